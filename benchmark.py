@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+import config
+from src.fake_bitbucket import FakeBitbucket, SyntheticRepositoryGenerator
+from src.fake_github import FakeGithub
+from src.fake_server import STATS_PATH, start_server
+from src.utils import get_request_json
+
+
+# Stages of the first migration and of the delta sync after updating the bitbucket repository
+STAGES = ["prepare", "upload", "verify"]
+DELTA_STAGES = ["delta sync"]
+
+
+def load_migrate_discussions():
+    # The script name is not a valid module name
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrate-discussions.py")
+    spec = importlib.util.spec_from_file_location("migrate_discussions", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def get_endpoint_counts(api_url):
+    return get_request_json(api_url.split("/2.0")[0] + STATS_PATH)["endpoints"]
+
+
+def diff_endpoint_counts(before, after):
+    return {
+        endpoint: count - before.get(endpoint, 0)
+        for endpoint, count in sorted(after.items())
+        if count != before.get(endpoint, 0)
+    }
+
+
+def run_stages(args):
+    """Runs the migration of one repository stage by stage, in this process. Writes the measurements of every stage
+    to `args.result_file`.
+    """
+    # Keep the state of the migration out of the real migration_data
+    config.GITHUB_CACHE_PATH = os.path.join(args.work_dir, "github_cache.sqlite")
+    config.ATTACHMENT_INDEX_PATH = os.path.join(args.work_dir, "attachments_index.json")
+    config.MIGRATION_JOURNAL_PATH = os.path.join(args.work_dir, "journal.sqlite")
+    config.GITHUB_MIN_WRITE_INTERVAL = args.github_min_write_interval
+    config.GITHUB_REQUESTS_PER_HOUR = args.github_requests_per_hour
+    config.BITBUCKET_REQUESTS_PER_HOUR = args.bitbucket_requests_per_hour
+    config.KNOWN_ISSUES_COUNT_MAPPING[args.repository] = args.issues
+    config.KNOWN_REPO_MAPPING[args.repository] = args.repository
+
+    migrate_discussions = load_migrate_discussions()
+    payload_path = os.path.join(args.work_dir, "payloads.jsonl.gz")
+    migration_args = migrate_discussions.create_parser().parse_args([
+        "--github-access-token", "benchmark",
+        "--bitbucket-repository", args.repository,
+        "--github-repository", args.repository,
+        "--bitbucket-username", "benchmark",
+        "--bitbucket-password", "benchmark",
+        "--bitbucket-api-url", args.bitbucket_api_url,
+        "--github-api-url", args.github_api_url,
+        "--verify-report", os.path.join(args.work_dir, "verify-report.json"),
+    ])
+    bexport = migrate_discussions.BitbucketExport(
+        args.repository, "benchmark", "benchmark", api_url=args.bitbucket_api_url
+    )
+    gimport = migrate_discussions.GithubImport("benchmark", args.repository, api_url=args.github_api_url)
+    cmap = migrate_discussions.CommitMap()
+    with open(args.commit_map, "r") as file:
+        cmap.set_map(args.repository, json.load(file))
+
+    stages = {}
+    for stage in args.stages.split(","):
+        bitbucket_before = get_endpoint_counts(args.bitbucket_api_url)
+        github_before = get_endpoint_counts(args.github_api_url)
+        usage_before = resource.getrusage(resource.RUSAGE_SELF)
+        start = time.monotonic()
+        if stage == "prepare":
+            migration_args.prepare = payload_path
+            migrate_discussions.prepare(bexport, gimport, cmap, migration_args)
+        elif stage == "upload":
+            migration_args.upload = payload_path
+            migrate_discussions.upload(gimport, migration_args)
+        elif stage == "verify":
+            migrate_discussions.verify(bexport, gimport, cmap, migration_args)
+        else:
+            migration_args.since = args.since
+            migrate_discussions.bitbucket_to_github(bexport, gimport, cmap, migration_args)
+        wall_time = time.monotonic() - start
+        usage_after = resource.getrusage(resource.RUSAGE_SELF)
+        stages[stage] = {
+            "wall_time": round(wall_time, 3),
+            "user_time": round(usage_after.ru_utime - usage_before.ru_utime, 3),
+            "system_time": round(usage_after.ru_stime - usage_before.ru_stime, 3),
+            "requests": {
+                "bitbucket": diff_endpoint_counts(bitbucket_before, get_endpoint_counts(args.bitbucket_api_url)),
+                "github": diff_endpoint_counts(github_before, get_endpoint_counts(args.github_api_url)),
+            },
+        }
+    with open(args.result_file, "w") as file:
+        json.dump(stages, file)
+
+
+def run_stages_in_child(stages, repository, issues_count, fake_bitbucket, fake_github, work_dir, commit_map_path,
+                        args, since=None):
+    """Runs the given stages in a child process. Returns its results, wall time and resource usage.
+    """
+    result_path = os.path.join(work_dir, "stages.json")
+    log_path = os.path.join(work_dir, "migration.log")
+    command = [
+        sys.executable, os.path.abspath(__file__),
+        "--run-stages", repository,
+        "--stages", ",".join(stages),
+        "--issues", str(issues_count),
+        "--bitbucket-api-url", fake_bitbucket.base_url + "/2.0",
+        "--github-api-url", fake_github.base_url,
+        "--work-dir", work_dir,
+        "--commit-map", commit_map_path,
+        "--result-file", result_path,
+        "--github-min-write-interval", str(args.github_min_write_interval),
+        "--github-requests-per-hour", str(args.github_requests_per_hour),
+        "--bitbucket-requests-per-hour", str(args.bitbucket_requests_per_hour),
+    ]
+    if since is not None:
+        command += ["--since", since]
+    start = time.monotonic()
+    with open(log_path, "a") as log:
+        process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(process.pid, 0)
+    wall_time = time.monotonic() - start
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise Exception("The stages {} of {} issues failed, see '{}'.".format(", ".join(stages), issues_count, log_path))
+    with open(result_path, "r") as file:
+        return json.load(file), wall_time, usage
+
+
+def run_size(issues_count, args):
+    """Generates a repository, serves it together with an empty github stand-in and migrates it in a child process,
+    so that its CPU time and peak memory are measured separately. Then updates a fraction of the issues and pull
+    requests on bitbucket and syncs them with `--since` in another child process.
+    """
+    repository = "benchmark/repo-{}".format(issues_count)
+    pulls_count = int(issues_count * args.pulls_ratio)
+    work_dir = os.path.join(args.output_dir, "repo-{}".format(issues_count))
+    os.makedirs(work_dir, exist_ok=True)
+
+    print("Generate bitbucket repository with {} issues and {} pull requests...".format(issues_count, pulls_count))
+    generator = SyntheticRepositoryGenerator(seed=args.seed)
+    repositories = generator.generate(repository, issues_count, pulls_count)
+    commit_map_path = os.path.join(work_dir, "commit_map.json")
+    with open(commit_map_path, "w") as file:
+        json.dump({
+            commit_hash: hashlib.sha1(commit_hash.encode("utf-8")).hexdigest()
+            for commit_hash in repositories[repository]["commits"]
+        }, file)
+
+    fake_bitbucket = FakeBitbucket(
+        repositories,
+        latency=args.bitbucket_latency,
+        requests_per_hour=args.bitbucket_requests_per_hour,
+        fault_rate_429=args.fault_rate_429,
+        fault_rate_5xx=args.fault_rate_5xx,
+        seed=args.seed
+    )
+    fake_github = FakeGithub(
+        repository,
+        latency=args.github_latency,
+        write_latency=args.github_write_latency,
+        requests_per_hour=args.github_requests_per_hour,
+        graphql_points_per_hour=args.github_requests_per_hour,
+        import_delay=args.import_delay
+    )
+    bitbucket_server = start_server(fake_bitbucket)
+    github_server = start_server(fake_github)
+    log_path = os.path.join(work_dir, "migration.log")
+    # The log is appended to by both child processes
+    open(log_path, "w").close()
+    try:
+        print("Migrate {} issues and pull requests (log: '{}')...".format(issues_count + pulls_count, log_path))
+        stages, wall_time, usage = run_stages_in_child(
+            STAGES, repository, issues_count, fake_bitbucket, fake_github, work_dir, commit_map_path, args
+        )
+        # Includes the empty issues that replace deleted ones
+        migrated_count = len(fake_github.issues)
+
+        since = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        updated_count = generator.update(repositories, repository, args.delta_ratio)
+        print("Sync {} updated issues and pull requests...".format(updated_count))
+        delta_stages, delta_wall_time, delta_usage = run_stages_in_child(
+            DELTA_STAGES, repository, issues_count, fake_bitbucket, fake_github, work_dir, commit_map_path, args, since
+        )
+        stages.update(delta_stages)
+    finally:
+        bitbucket_server.shutdown()
+        github_server.shutdown()
+
+    return {
+        "repository": repository,
+        "issues": issues_count,
+        "pulls": pulls_count,
+        "migrated": migrated_count,
+        "updated": updated_count,
+        "wall_time": round(wall_time + delta_wall_time, 3),
+        "user_time": round(usage.ru_utime + delta_usage.ru_utime, 3),
+        "system_time": round(usage.ru_stime + delta_usage.ru_stime, 3),
+        # Linux reports kilobytes
+        "peak_rss_kb": max(usage.ru_maxrss, delta_usage.ru_maxrss),
+        "issues_per_second": round(migrated_count / stages["upload"]["wall_time"], 3) if stages["upload"]["wall_time"] else None,
+        "end_to_end_issues_per_second": round(migrated_count / wall_time, 3),
+        "requests": {
+            "bitbucket": fake_bitbucket.get_stats(),
+            "github": fake_github.get_stats(),
+        },
+        "stages": stages,
+    }
+
+
+def print_summary(results):
+    print("{:>8} {:>8} {:>10} {:>10} {:>10} {:>10} {:>10} {:>12} {:>10} {:>10}".format(
+        "issues", "pulls", "wall (s)", "prepare", "upload", "verify", "delta sync", "peak RSS MB", "issues/s", "requests"
+    ))
+    for result in results:
+        print("{:>8} {:>8} {:>10} {:>10} {:>10} {:>10} {:>10} {:>12} {:>10} {:>10}".format(
+            result["issues"],
+            result["pulls"],
+            result["wall_time"],
+            result["stages"]["prepare"]["wall_time"],
+            result["stages"]["upload"]["wall_time"],
+            result["stages"]["verify"]["wall_time"],
+            result["stages"]["delta sync"]["wall_time"],
+            round(result["peak_rss_kb"] / 1024, 1),
+            result["issues_per_second"],
+            result["requests"]["bitbucket"]["requests"] + result["requests"]["github"]["requests"]
+        ))
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        prog="benchmark",
+        description="Benchmark the migration of issues and pull requests against local stand-ins of Bitbucket and Github"
+    )
+    parser.add_argument(
+        "--sizes",
+        help="Comma-separated numbers of issues of the benchmarked repositories",
+        default="100,1000,10000"
+    )
+    parser.add_argument(
+        "--pulls-ratio",
+        help="Number of pull requests per issue",
+        type=float,
+        default=0.2
+    )
+    parser.add_argument(
+        "--delta-ratio",
+        help="Fraction of the issues and pull requests that are updated on bitbucket before the delta sync",
+        type=float,
+        default=0.05
+    )
+    parser.add_argument(
+        "--seed",
+        help="Seed of the generated repositories and of the injected faults",
+        type=int,
+        default=0
+    )
+    parser.add_argument(
+        "--output-dir",
+        help="Directory of the logs and of the state of the benchmarked migrations",
+        default="migration_data/benchmark"
+    )
+    parser.add_argument(
+        "--result-file",
+        help="Path of the JSON file with the results",
+        default="migration_data/benchmark/results.json"
+    )
+    parser.add_argument(
+        "--bitbucket-latency",
+        help="Delay of every Bitbucket request, in seconds",
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        "--github-latency",
+        help="Delay of every Github request, in seconds",
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        "--github-write-latency",
+        help="Additional delay of Github writes, in seconds",
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        "--import-delay",
+        help="Time in seconds that an import of the Issue Import API stays pending",
+        type=float,
+        default=0.1
+    )
+    parser.add_argument(
+        "--fault-rate-429",
+        help="Fraction of Bitbucket requests that fail with 429",
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        "--fault-rate-5xx",
+        help="Fraction of Bitbucket requests that fail with 500, 502 or 503",
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        "--github-min-write-interval",
+        help="Spacing of Github writes by the client, in seconds (the real migration uses {})".format(config.GITHUB_MIN_WRITE_INTERVAL),
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        "--github-requests-per-hour",
+        help="Github rate limit of the stand-in and the client",
+        type=int,
+        default=10 ** 9
+    )
+    parser.add_argument(
+        "--bitbucket-requests-per-hour",
+        help="Bitbucket rate limit of the stand-in and the client",
+        type=int,
+        default=10 ** 9
+    )
+    # Used by the child process that runs the migration
+    parser.add_argument("--run-stages", metavar="REPOSITORY", dest="repository", help=argparse.SUPPRESS)
+    parser.add_argument("--stages", default=",".join(STAGES), help=argparse.SUPPRESS)
+    parser.add_argument("--since", help=argparse.SUPPRESS)
+    parser.add_argument("--issues", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--bitbucket-api-url", help=argparse.SUPPRESS)
+    parser.add_argument("--github-api-url", help=argparse.SUPPRESS)
+    parser.add_argument("--work-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--commit-map", help=argparse.SUPPRESS)
+    return parser
+
+
+def main():
+    parser = create_parser()
+    args = parser.parse_args()
+    if args.repository is not None:
+        run_stages(args)
+        return
+
+    results = []
+    for size in [int(x) for x in args.sizes.split(",")]:
+        results.append(run_size(size, args))
+        print_summary(results)
+    os.makedirs(os.path.dirname(args.result_file) or ".", exist_ok=True)
+    with open(args.result_file, "w") as file:
+        json.dump({"settings": vars(args), "results": results}, file, indent=2)
+    print("Results written to '{}'.".format(args.result_file))
+
+
+if __name__ == "__main__":
+    main()
@@ -303,3 +303,57 @@ KNOWN_CMAP_PATHS = {
     "viperproject/silver-verifiedif": "migration_data/silver-verifiedif_cmap.txt",
     "Felale/gobra-one": "migration_data/gobra_cmap.txt",
 }
+
+# Bitbucket's rate limit for repository data, used to pace requests until the
+# actual limit is read from the response headers.
+BITBUCKET_REQUESTS_PER_HOUR = 1000
+
+# Maximum number of concurrent requests sent to Bitbucket. The actual number is
+# reduced automatically when Bitbucket reports that the rate limit is close.
+BITBUCKET_MAX_CONCURRENCY = 4
+
+# Maximum number of issues submitted to GitHub's Issue Import API that may be
+# waiting to be imported at the same time.
+GITHUB_MAX_PENDING_IMPORTS = 50
+
+# GitHub's primary rate limit, used to pace requests until the actual limit is
+# read from the response headers.
+GITHUB_REQUESTS_PER_HOUR = 5000
+
+# Maximum number of concurrent requests sent to GitHub. GitHub recommends
+# sending requests serially to avoid secondary rate limits.
+GITHUB_MAX_CONCURRENCY = 2
+
+# Minimum number of seconds between two content-creating requests to GitHub.
+# GitHub recommends at least one second to avoid secondary rate limits.
+GITHUB_MIN_WRITE_INTERVAL = 1.0
+
+# Path of the persistent cache of GitHub GET responses, used for conditional
+# requests (ETag / Last-Modified).
+GITHUB_CACHE_PATH = "migration_data/github_cache.sqlite"
+
+# Path of the index of uploaded attachments (hash of the content -> URL), used
+# to upload identical attachments only once.
+ATTACHMENT_INDEX_PATH = "migration_data/attachments_index.json"
+
+# Number of issues whose attachments are migrated to gists concurrently. Gist
+# creations are additionally spaced by GITHUB_MIN_WRITE_INTERVAL.
+ATTACHMENT_MIGRATION_WORKERS = 4
+
+# Maximum number of rendered issues and pull requests waiting to be uploaded.
+PREPARE_QUEUE_SIZE = 20
+
+# Journal of the migrated issues and pull requests, used to resume an interrupted migration.
+MIGRATION_JOURNAL_PATH = "migration_data/journal.sqlite"
+
+# Base URL of the GitHub REST API; the GraphQL API is expected at "<GITHUB_API_URL>/graphql".
+GITHUB_API_URL = "https://api.github.com"
+
+# Base URL of the Bitbucket API.
+BITBUCKET_API_URL = "https://api.bitbucket.org/2.0"
+
+# Seconds between two progress lines when the output is not a terminal (e.g. a log file).
+PROGRESS_LOG_INTERVAL = 30
+
+# Seconds between two updates of the progress status line on a terminal.
+PROGRESS_TTY_INTERVAL = 0.5
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+import argparse
+import config
+from src.fake_bitbucket import FakeBitbucket, SyntheticRepositoryGenerator, load_repositories, save_repositories
+from src.fake_server import create_server
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        prog="fake-bitbucket-server",
+        description="Serve synthetic repositories with a local stand-in of the Bitbucket API, to benchmark the migration without using the real API"
+    )
+    parser.add_argument(
+        "-b", "--bitbucket-repository",
+        help="Full name of the generated Bitbucket repository (e.g. viperproject/silver)"
+    )
+    parser.add_argument(
+        "--issues",
+        help="Number of generated issues",
+        type=int,
+        default=100
+    )
+    parser.add_argument(
+        "--pulls",
+        help="Number of generated pull requests",
+        type=int,
+        default=20
+    )
+    parser.add_argument(
+        "--forks",
+        help="Number of generated forks, which are the source of some pull requests",
+        type=int,
+        default=2
+    )
+    parser.add_argument(
+        "--comments-mean",
+        help="Mean number of comments per issue and pull request",
+        type=float,
+        default=3.0
+    )
+    parser.add_argument(
+        "--seed",
+        help="Seed of the generated data and of the injected faults",
+        type=int,
+        default=0
+    )
+    parser.add_argument(
+        "--load",
+        help="Serve the repositories of a JSON file written by --save instead of generating them"
+    )
+    parser.add_argument(
+        "--save",
+        help="Write the generated repositories to a JSON file"
+    )
+    parser.add_argument(
+        "--host",
+        help="Host to listen on",
+        default="127.0.0.1"
+    )
+    parser.add_argument(
+        "--port",
+        help="Port to listen on",
+        type=int,
+        default=8082
+    )
+    parser.add_argument(
+        "--latency",
+        help="Delay of every request, in seconds",
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        "--requests-per-hour",
+        help="Rate limit; exceeding requests are rejected with 429",
+        type=int,
+        default=config.BITBUCKET_REQUESTS_PER_HOUR
+    )
+    parser.add_argument(
+        "--fault-rate-429",
+        help="Fraction of requests that fail with 429 and Retry-After",
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        "--fault-rate-5xx",
+        help="Fraction of requests that fail with 500, 502 or 503",
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        "-v", "--verbose",
+        help="Log every request",
+        action="store_true"
+    )
+    return parser
+
+
+def main():
+    parser = create_parser()
+    args = parser.parse_args()
+    if args.load is not None:
+        repositories = load_repositories(args.load)
+    elif args.bitbucket_repository is not None:
+        print("Generate bitbucket repository '{}' with {} issues and {} pull requests...".format(
+            args.bitbucket_repository,
+            args.issues,
+            args.pulls
+        ))
+        generator = SyntheticRepositoryGenerator(seed=args.seed, comments_mean=args.comments_mean)
+        repositories = generator.generate(args.bitbucket_repository, args.issues, args.pulls, args.forks)
+    else:
+        parser.error("either --bitbucket-repository or --load is required")
+    if args.save is not None:
+        save_repositories(repositories, args.save)
+
+    fake = FakeBitbucket(
+        repositories,
+        latency=args.latency,
+        requests_per_hour=args.requests_per_hour,
+        fault_rate_429=args.fault_rate_429,
+        fault_rate_5xx=args.fault_rate_5xx,
+        seed=args.seed
+    )
+    server = create_server(fake, args.host, args.port, verbose=args.verbose)
+    print("Serving a stand-in of the Bitbucket API for {} at {}/2.0...".format(", ".join(sorted(repositories)), fake.base_url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print("Requests per endpoint: {}".format(fake.get_stats()["endpoints"]))
+
+
+if __name__ == "__main__":
+    main()
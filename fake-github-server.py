@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+import argparse
+from src.fake_github import FakeGithub
+from src.fake_server import create_server
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        prog="fake-github-server",
+        description="Serve a local stand-in of the Github API, to benchmark the migration without using the real API"
+    )
+    parser.add_argument(
+        "-g", "--github-repository",
+        help="Full name of the served Github repository (e.g. viperproject/silver)",
+        required=True
+    )
+    parser.add_argument(
+        "--host",
+        help="Host to listen on",
+        default="127.0.0.1"
+    )
+    parser.add_argument(
+        "--port",
+        help="Port to listen on",
+        type=int,
+        default=8081
+    )
+    parser.add_argument(
+        "--latency",
+        help="Delay of every request, in seconds",
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        "--write-latency",
+        help="Additional delay of POST, PATCH, PUT and DELETE requests, in seconds",
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        "--requests-per-hour",
+        help="Primary rate limit of the REST API",
+        type=int,
+        default=5000
+    )
+    parser.add_argument(
+        "--graphql-points-per-hour",
+        help="Primary rate limit of the GraphQL API",
+        type=int,
+        default=5000
+    )
+    parser.add_argument(
+        "--import-delay",
+        help="Time in seconds that an import of the Issue Import API stays pending",
+        type=float,
+        default=1.0
+    )
+    parser.add_argument(
+        "--min-write-interval",
+        help="Reject writes closer than this number of seconds, like the secondary rate limit (0 to disable)",
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        "-v", "--verbose",
+        help="Log every request",
+        action="store_true"
+    )
+    return parser
+
+
+def main():
+    parser = create_parser()
+    args = parser.parse_args()
+    fake = FakeGithub(
+        args.github_repository,
+        latency=args.latency,
+        write_latency=args.write_latency,
+        requests_per_hour=args.requests_per_hour,
+        graphql_points_per_hour=args.graphql_points_per_hour,
+        import_delay=args.import_delay,
+        min_write_interval=args.min_write_interval
+    )
+    server = create_server(fake, args.host, args.port, verbose=args.verbose)
+    print("Serving a stand-in of the Github API for '{}' at {}...".format(args.github_repository, fake.base_url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print("Requests per endpoint: {}".format(fake.get_stats()["endpoints"]))
+
+
+if __name__ == "__main__":
+    main()
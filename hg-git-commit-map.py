@@ -3,6 +3,7 @@ import argparse
 import re
 import git
 from src.map import CommitMap
+from src.profiling import phase, profiler
 
 
 # creates a map from hg commit hash to git commit hash
@@ -46,18 +47,31 @@ def create_parser():
         help="Full name of the Bitbucket repository (e.g. viperproject/silver)",
         required=True
     )
+    parser.add_argument(
+        "--profile",
+        help="Profile the phases read notes and write map with cProfile and write the profiles to the given pstats file (and one file per phase next to it)",
+        metavar="PSTATS_FILE"
+    )
     return parser
 
 
 def main():
     parser = create_parser()
     args = parser.parse_args()
-    repo = git.Repo(args.repo)
+    if args.profile:
+        profiler.enable(args.profile)
+    try:
+        with phase("main"):
+            repo = git.Repo(args.repo)
 
-    map = create_map(repo)
-    commit_map = CommitMap()
-    commit_map.set_map(args.bitbucket_repository, map)
-    commit_map.store_to_disk()
+            with phase("read notes"):
+                map = create_map(repo)
+            with phase("write map"):
+                commit_map = CommitMap()
+                commit_map.set_map(args.bitbucket_repository, map)
+                commit_map.store_to_disk()
+    finally:
+        profiler.write()
 
 
 if __name__ == "__main__":
@@ -4,6 +4,7 @@ import re
 import config
 from src.repo import HgRepo
 from src.bitbucket import BitbucketExport
+from src.profiling import phase, profiler
 
 
 def get_bitbucket_base_url(args):
@@ -174,25 +175,54 @@ def create_parser():
         "-bp", "--bitbucket-password",
         help="App password for Bitbucket account",
     )
+    parser.add_argument(
+        "--bitbucket-api-url",
+        help="Base URL of the Bitbucket API, e.g. of a local stand-in for benchmarks (default: {})".format(config.BITBUCKET_API_URL),
+        default=config.BITBUCKET_API_URL
+    )
     parser.add_argument(
         "-v", "--verbose", action="store_true",
         help="Prints all write Hg command to stdout"
     )
+    parser.add_argument(
+        "--profile",
+        help="Profile the phases fetch and fork import with cProfile and write the profiles to the given pstats file (and one file per phase next to it)",
+        metavar="PSTATS_FILE"
+    )
     return parser
 
 
 def main():
     parser = create_parser()
     args = parser.parse_args()
+    if args.profile:
+        profiler.enable(args.profile)
+    try:
+        with phase("main"):
+            import_forks(args)
+    finally:
+        profiler.write()
+
+
+def import_forks(args):
     repo = HgRepo(args.repo, config.MIGRATION_COMMITS_USER)
-    bexport = BitbucketExport(args.bitbucket_repository, args.bitbucket_username, args.bitbucket_password)
+    bexport = BitbucketExport(
+        args.bitbucket_repository,
+        args.bitbucket_username,
+        args.bitbucket_password,
+        api_url=args.bitbucket_api_url
+    )
 
-    fork_commits = get_fork_commits(bexport, args)
-    for fork_commit in fork_commits:
-        import_fork_commit(repo, fork_commit, args)
-    create_branch_per_fork_commit(repo, fork_commits, args)
-    unique_branch_per_head(repo, args)
-    create_master_branch(repo, args)
+    with phase("fetch"):
+        fork_commits = get_fork_commits(bexport, args)
+    with phase("fork import"):
+        for fork_commit in fork_commits:
+            import_fork_commit(repo, fork_commit, args)
+        create_branch_per_fork_commit(repo, fork_commits, args)
+        unique_branch_per_head(repo, args)
+        create_master_branch(repo, args)
+    print("Bitbucket requests per endpoint:")
+    print(bexport.metrics.format_table())
 
 
 if __name__ == "__main__":
@@ -2,16 +2,17 @@
 import argparse
 import config
 import os
-from subprocess import check_call
 import pathlib
 from send2trash import send2trash
 from github import Github
 from github.GithubException import GithubException
+from src.timing import StepTimings
 #from getpass import getpass
-import datetime
 
 ROOT = os.path.abspath(os.path.dirname(__file__))
 MIGRATION_DATA_DIR = os.path.join(ROOT, "migration_data")
+# Wall time and resource usage of the steps, printed at the end of the migration
+TIMINGS = StepTimings()
 
 
 def bitbucket_repo_url(repo, username, password):
@@ -22,15 +23,12 @@ def github_repo_url(repo):
     return "git@github.com:" + repo + ".git"
 
 
-def execute(cmd, *args, **kwargs):
-    print("> '{}'".format(cmd))
-    check_call(cmd, *args, shell=True, **kwargs)
+def execute(cmd, cwd=None):
+    TIMINGS.execute(cmd, cwd=cwd)
 
 
-def step(msg):
-    now = datetime.datetime.now()
-    time = now.strftime("%Y-%m-%d %H:%M:%S")
-    print("\n[{}] === {}...".format(time, msg))
+def step(msg, name, repo=None):
+    TIMINGS.step(msg, name, repo)
 
 
 def is_github_repo_empty(github, grepo):
@@ -94,6 +92,10 @@ def create_parser():
         help="Skip the migration of attachments (development only!)",
         action="store_true"
     )
+    parser.add_argument(
+        "--attachments-repository",
+        help="Github repository to store the attachments in, instead of gists"
+    )
     parser.add_argument(
         "bitbucket_repositories",
         nargs="+",
@@ -105,6 +107,14 @@ def create_parser():
 def main():
     parser = create_parser()
     args = parser.parse_args()
+    try:
+        migrate(args)
+    finally:
+        print("\nDuration and resource usage of the steps:")
+        print(TIMINGS.format_summary())
+
+
+def migrate(args):
 
     repositories_to_migrate = {
         brepo: config.KNOWN_REPO_MAPPING[brepo]
@@ -131,7 +141,7 @@ def main():
 
     if not args.skip_stuff:
         for brepo, grepo in repositories_to_migrate.items():
-            step("Cloning bitbucket repository '{}' to local mercurial repository".format(brepo))
+            step("Cloning bitbucket repository '{}' to local mercurial repository".format(brepo), "hg clone", brepo)
             hg_folder = os.path.join(MIGRATION_DATA_DIR, "bitbucket", brepo)
             brepo_url = bitbucket_repo_url(brepo, args.bitbucket_username, args.bitbucket_password)
             if os.path.isdir(hg_folder):
@@ -141,7 +151,7 @@ def main():
 
         for brepo, grepo in repositories_to_migrate.items():
             hg_folder = os.path.join(MIGRATION_DATA_DIR, "bitbucket", brepo)
-            step("Importing forks of bitbucket repository '{}' into local mercurial repository".format(brepo))
+            step("Importing forks of bitbucket repository '{}' into local mercurial repository".format(brepo), "import forks", brepo)
             execute("./import-forks.py --verbose --repo {} --bitbucket-repository {} {}{}".format(
                 hg_folder,
                 brepo,
@@ -150,7 +160,7 @@ def main():
             ), cwd=ROOT)
 
         for brepo, grepo in repositories_to_migrate.items():
-            step("Preparing local git repository for '{}'".format(grepo))
+            step("Preparing local git repository for '{}'".format(grepo), "git init", brepo)
             git_folder = os.path.join(MIGRATION_DATA_DIR, "github", grepo)
             if os.path.isdir(git_folder):
                 send2trash(git_folder)
@@ -162,7 +172,7 @@ def main():
                 execute("git add .gitattributes", cwd=git_folder)
 
         for brepo, grepo in repositories_to_migrate.items():
-            step("Converting local mercurial repository of '{}' to git".format(brepo))
+            step("Converting local mercurial repository of '{}' to git".format(brepo), "hg-fast-export", brepo)
             hg_folder = os.path.join(MIGRATION_DATA_DIR, "bitbucket", brepo)
             git_folder = os.path.join(MIGRATION_DATA_DIR, "github", grepo)
             execute("{} -r {} -A {} -B {} --hg-hash ".format(
@@ -173,7 +183,7 @@ def main():
             ), cwd=git_folder)
 
         for brepo, grepo in repositories_to_migrate.items():
-            step("Mapping local mercurial commit hashes of '{}' to git".format(brepo))
+            step("Mapping local mercurial commit hashes of '{}' to git".format(brepo), "commit map", brepo)
             git_folder = os.path.join(MIGRATION_DATA_DIR, "github", grepo)
             execute("./hg-git-commit-map.py --repo {} --bitbucket-repository {}".format(
                 git_folder,
@@ -181,34 +191,35 @@ def main():
             ), cwd=ROOT)
 
         for brepo, grepo in repositories_to_migrate.items():
-            step("Adding remote github '{}' to local git repository".format(grepo))
+            step("Adding remote github '{}' to local git repository".format(grepo), "git remote add", brepo)
             git_folder = os.path.join(MIGRATION_DATA_DIR, "github", grepo)
             execute("git remote add origin {}".format(
                 github_repo_url(grepo)
             ), cwd=git_folder)
 
     for brepo, grepo in repositories_to_migrate.items():
-        step("Checking github repository '{}'".format(grepo))
+        step("Checking github repository '{}'".format(grepo), "check github", brepo)
         while not is_github_repo_empty(github, grepo):
             print("Error: Github repository '{}' is non-empty. Please delete and recreate it.".format(grepo))
             input("Press Enter to retry...")
 
     for brepo, grepo in repositories_to_migrate.items():
-        step("Converting local git repository to HTTPS: '{}'".format(grepo))
+        step("Converting local git repository to HTTPS: '{}'".format(grepo), "git remote set-url", brepo)
         git_folder = os.path.join(MIGRATION_DATA_DIR, "github", grepo)
         execute("git remote set-url origin https://{}:{}@github.com/{}.git".format(args.github_username, args.github_access_token, grepo), cwd=git_folder)
         if args.git_lfs is not None:
-            step("Converting '{}' files to Git LFS in repository '{}'".format(args.git_lfs, grepo))
+            step("Converting '{}' files to Git LFS in repository '{}'".format(args.git_lfs, grepo), "git lfs", brepo)
             execute("git lfs migrate import --include='*.{}' --everything --yes".format(args.git_lfs), cwd=git_folder)
-        step("Pushing local git repository to github repository '{}'".format(grepo))
+        step("Pushing local git repository to github repository '{}'".format(grepo), "git push", brepo)
         execute("git push --set-upstream origin master", cwd=git_folder)
         execute("git push --all origin", cwd=git_folder)
         execute("git push --tags origin", cwd=git_folder)
 
     for brepo, grepo in repositories_to_migrate.items():
-        step("Migrate issues and pull requests of bitbucket repository '{}' to github".format(brepo))
-        execute("./migrate-discussions.py {} --github-access-token {} --bitbucket-repository {} --github-repository {} --bitbucket-username {} --bitbucket-password {}".format(
+        step("Migrate issues and pull requests of bitbucket repository '{}' to github".format(brepo), "discussions", brepo)
+        execute("./migrate-discussions.py {} {} --github-access-token {} --bitbucket-repository {} --github-repository {} --bitbucket-username {} --bitbucket-password {}".format(
             "--skip-attachments" if args.skip_attachments else "",
+            "--attachments-repository {}".format(args.attachments_repository) if args.attachments_repository is not None else "",
             args.github_access_token,
             brepo,
             grepo,
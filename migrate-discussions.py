@@ -4,10 +4,23 @@ from dateutil import parser
 import argparse
 from github import InputFileContent
 import config
+from src.attachments import AttachmentIndex, GitAttachmentStore, hash_attachment_content
 from src.bitbucket import BitbucketExport
 from src.github import GithubImport
+from src.http_metrics import export_request_metrics
+from src.journal import MigrationJournal, hash_payload, hash_render_inputs, hash_source
 from src.map import CommitMap
+from src.payloads import PayloadFile
+from src.plan import MigrationPlan
+from src.profiling import phase, profile_iteration, profiler
+from src.progress import ProgressReporter
+from src.utils import format_connection_stats, iterate_in_background
 import requests
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
 from urllib.parse import urlparse
 
 
@@ -379,7 +392,7 @@ def construct_gcomment_body(bcomment, bcomments_by_id, cmap, args, bexport):
     return "".join(sb)
 
 
-def construct_gissue_body(bissue, battachments, attachment_gist_by_issue_id, cmap, args):
+def construct_gissue_body(bissue, battachments, attachment_urls_by_issue_id, cmap, args):
     sb = []
 
     # Header
@@ -402,14 +415,13 @@ def construct_gissue_body(bissue, battachments, attachment_gist_by_issue_id, cma
         sb.append("Attachments:\n")
         for name in battachments.keys():
             issue_id = bissue["id"]
-            if issue_id in attachment_gist_by_issue_id:
-                attachments_gist = attachment_gist_by_issue_id[issue_id]
+            if name in attachment_urls_by_issue_id.get(issue_id, {}):
                 sb.append("* [**`{}`**]({})\n".format(
                     name,
-                    attachments_gist.files[name].raw_url
+                    attachment_urls_by_issue_id[issue_id][name]
                 ))
             else:
-                print("Error: missing gist for the attachments of issue #{}.".format(issue_id))
+                print("Error: missing gist file for the attachment '{}' of issue #{}.".format(name, issue_id))
                 sb.append("* **`{}`** (missing link)\n".format(name))
 
     return "".join(sb)
@@ -577,13 +589,16 @@ def construct_gissue_comments(bcomments, cmap, args, bexport):
                 "created_at": convert_date(bcomment["created_on"])
             }
             comments.append(comment)
-        except:
+        except Exception:
             print("Failed to get comment id {}".format(comment_id))
 
     comments.sort(key=lambda x: x["created_at"])
     return comments
 
 
+GIST_README_NAME = "# README.md"
+
+
 def construct_gist_description_for_issue_attachments(bissue, bexport):
     return "Attachments for issue https://github.com/{}/issues/{}".format(
         map_brepo_to_grepo(bexport.get_repo_full_name()),
@@ -591,15 +606,19 @@ def construct_gist_description_for_issue_attachments(bissue, bexport):
     )
 
 
-def construct_gist_from_bissue_attachments(bissue, bexport):
+def construct_gist_from_bissue_attachments(bissue, bexport, battachments=None):
     issue_id = bissue["id"]
-    battachments = bexport.get_issue_attachments(issue_id)
+    if battachments is None:
+        battachments = bexport.get_issue_attachments(issue_id)
 
     if not battachments:
         return None
 
     gist_description = construct_gist_description_for_issue_attachments(bissue, bexport)
-    gist_files = {"# README.md": InputFileContent(gist_description)}
+    # The content of the files is kept next to the InputFileContent objects to compare and hash it
+    gist_contents = {GIST_README_NAME: gist_description}
+    # Files whose content has been replaced by a placeholder
+    placeholders = set()
 
     for name in battachments.keys():
         content = bexport.get_issue_attachment_content(issue_id, name)
@@ -610,6 +629,7 @@ def construct_gist_from_bissue_attachments(bissue, bexport):
                 issue_id
             ))
             content = "(empty)"
+            placeholders.add(name)
         elif len(content) > 500 * 1000:
             print("Error: file '{}' of bitbucket issue {}/#{} is too big and cannot be uploaded as a gist file. This has to be done manually.".format(
                 name,
@@ -617,11 +637,14 @@ def construct_gist_from_bissue_attachments(bissue, bexport):
                 issue_id
             ))
             content = "(too big)"
-        gist_files[name] = InputFileContent(content)
+            placeholders.add(name)
+        gist_contents[name] = content
 
     return {
         "description": gist_description,
-        "files": gist_files
+        "files": {name: InputFileContent(content) for name, content in gist_contents.items()},
+        "contents": gist_contents,
+        "placeholders": placeholders
     }
 
 
@@ -657,13 +680,13 @@ def construct_gissue_comments_for_activity(bactivity):
     return comments
 
 
-def construct_gissue_from_bissue(bissue, bexport, attachment_gist_by_issue_id, cmap, args):
+def construct_gissue_from_bissue(bissue, bexport, attachment_urls_by_issue_id, cmap, args):
     issue_id = bissue["id"]
     battachments = bexport.get_issue_attachments(issue_id)
     bcomments = bexport.get_issue_comments(issue_id)
     bchanges = bexport.get_issue_changes(issue_id)
 
-    issue_body = construct_gissue_body(bissue, battachments, attachment_gist_by_issue_id, cmap, args)
+    issue_body = construct_gissue_body(bissue, battachments, attachment_urls_by_issue_id, cmap, args)
 
     # Construct comments
     comments = []
@@ -687,7 +710,7 @@ def construct_gissue_from_bissue(bissue, bexport, attachment_gist_by_issue_id, c
             "updated_at": convert_date(bissue["updated_on"]),
             "assignee": map_buser_to_guser(bissue["assignee"]),
             "closed": map_bstate_to_gstate(bissue) == "closed",
-            "labels": list(set(labels)),
+            "labels": sorted(set(labels)),
         },
         "comments": comments
     }
@@ -715,7 +738,8 @@ def construct_gissue_or_gpull_from_bpull(bpull, bexport, cmap, args):
     else:
         generate_gissue = False
         base_branch = cmap.convert_branch_name(bpull["destination"]["branch"]["name"])
-        head_branch = cmap.convert_branch_name(
+        # The source repository is None if the fork has been deleted
+        head_branch = None if bpull["source"]["repository"] is None else cmap.convert_branch_name(
             branch=bpull["source"]["branch"]["name"],
             repo=bpull["source"]["repository"]["full_name"],
             default_repo=bexport.get_repo_full_name()
@@ -738,7 +762,7 @@ def construct_gissue_or_gpull_from_bpull(bpull, bexport, cmap, args):
                 "updated_at": convert_date(bpull["updated_on"]),
                 "assignee": map_buser_to_guser(bpull["author"]),
                 "closed": is_closed,
-                "labels": list(set(labels)),
+                "labels": sorted(set(labels)),
             },
             "comments": comments
         }
@@ -763,7 +787,7 @@ def construct_gissue_or_gpull_from_bpull(bpull, bexport, cmap, args):
                     if guser is not None
                 ],
                 "closed": is_closed,
-                "labels": list(set(labels)),
+                "labels": sorted(set(labels)),
                 "base": base_branch,
                 "head": head_branch
             },
@@ -788,98 +812,686 @@ def construct_empty_gissue(issue_id, from_bpull=False):
     return {"type": "issue", "data": issue_data}
 
 
-def bitbucket_to_github(bexport, gimport, cmap, args):
-    brepo_full_name = bexport.get_repo_full_name()
-    issues_and_pulls = []
-    attachment_gist_by_issue_id = {}
+def migrate_bissue_attachments(bissue, bexport, gimport, attachment_index, create_gists=True, migration_plan=None):
+    """Returns the URLs of the attachments of a bitbucket issue (by name), or None if it has no attachments.
+    Attachments are deduplicated by content: an attachment whose content has already been uploaded (according to
+    `attachment_index`) links to the existing gist file, and only the others are uploaded to the gist of the issue.
+    Placeholders of empty or too big files are always uploaded to the gist of the issue, to be replaced manually.
+    The missing gist is only created if `create_gists` is set. With a `migration_plan`, the gist that would be
+    created or edited is only counted.
+    """
+    issue_id = bissue["id"]
+    battachments = bexport.get_issue_attachments(issue_id)
+    if not battachments:
+        return None
+    gist_data = construct_gist_from_bissue_attachments(bissue, bexport, battachments)
+    urls = {}
+    new_files = {}
+    new_hashes = {}
+    for name, content in gist_data["contents"].items():
+        if name == GIST_README_NAME:
+            continue
+        if name in gist_data["placeholders"]:
+            new_files[name] = gist_data["files"][name]
+            continue
+        content_hash = hash_attachment_content(content)
+        url = attachment_index.get_url(content_hash)
+        if url is None:
+            new_files[name] = gist_data["files"][name]
+            new_hashes[name] = content_hash
+        else:
+            urls[name] = url
+    if not new_files:
+        print("All attachments of bitbucket issue #{} have already been uploaded.".format(issue_id))
+        return urls
+    gist_data["files"] = dict(new_files, **{GIST_README_NAME: gist_data["files"][GIST_README_NAME]})
+    gist_data["contents"] = {name: gist_data["contents"][name] for name in gist_data["files"]}
+    if migration_plan is not None:
+        gist = gimport.get_gist_by_description(gist_data["description"])
+        if gist is not None:
+            for name in new_files:
+                if name in gist.files:
+                    urls[name] = gist.files[name].raw_url
+        # Only the files that are missing from the existing gist are planned to be uploaded
+        if gist is None or not gimport.gist_has_files(gist, gist_data["contents"]):
+            migration_plan.add_gist(exists=gist is not None)
+        return urls
+    if create_gists:
+        gist = gimport.get_or_create_gist_by_description(gist_data)
+    else:
+        gist = gimport.get_gist_by_description(gist_data["description"])
+    if gist is not None:
+        for name in new_files:
+            if name in gist.files:
+                urls[name] = gist.files[name].raw_url
+                if name in new_hashes:
+                    attachment_index.add_url(new_hashes[name], urls[name])
+        if create_gists:
+            attachment_index.store_to_disk()
+    return urls
+
+
+def get_attachment_urls(bissues, bexport, gimport, attachment_index, args, create_gists=True, migration_plan=None):
+    """Returns a map from bitbucket issue ids to the URLs of the attachments of the issue (by name).
+    The attachments of several issues are downloaded and uploaded concurrently, with at most
+    `config.ATTACHMENT_MIGRATION_WORKERS` issues in progress. The schedulers of both APIs still pace the requests
+    and space the gist creations. Identical attachments of issues in progress at the same time may be uploaded twice.
+    """
+    # Load the index of the gists before starting the workers
+    if bissues:
+        gimport.get_gists_by_description()
+    with ThreadPoolExecutor(max_workers=config.ATTACHMENT_MIGRATION_WORKERS) as executor, \
+            ProgressReporter("attachments", len(bissues), gimport.scheduler) as progress:
+        all_urls = executor.map(
+            lambda bissue: migrate_bissue_attachments(bissue, bexport, gimport, attachment_index, create_gists, migration_plan),
+            bissues
+        )
+        return {
+            bissue["id"]: urls
+            for bissue, urls in zip(progress.iterate(bissues), all_urls)
+            if urls is not None
+        }
 
-    # Retrieve data
-    try:
-        bissues = bexport.get_issues()
-    except:
-        bissues = []
-    bpulls = bexport.get_pulls()
-    assert brepo_full_name in config.KNOWN_ISSUES_COUNT_MAPPING
-    assert config.KNOWN_ISSUES_COUNT_MAPPING[brepo_full_name] >= len(bissues), len(bissues)
-    pulls_id_offset = config.KNOWN_ISSUES_COUNT_MAPPING[brepo_full_name]
 
-    # Migrate attachments
-    if not args.skip_attachments:
-        print("Migrate bitbucket attachments to github...")
-        for bissue in bissues:
-            issue_id = bissue["id"]
-            print("Migrate attachments for bitbucket issue #{}... [rate limiting: {}]".format(issue_id, gimport.get_remaining_rate_limit()))
-            battachments = bexport.get_issue_attachments(issue_id)
-            if battachments:
-                gist_data = construct_gist_from_bissue_attachments(bissue, bexport)
-                gist = gimport.get_or_create_gist_by_description(gist_data)
-                attachment_gist_by_issue_id[issue_id] = gist
-    else:
-        print("Warning: migration of bitbucket attachments to github has been skipped.")
+def get_attachment_urls_from_git_store(bissues, bexport, attachment_store, push=True):
+    """Returns a map from bitbucket issue ids to the URLs of the attachments of the issue (by name), storing all
+    attachments in `attachment_store` and pushing them at once if `push` is set.
+    """
+    attachment_urls_by_issue_id = {}
+    for bissue in bissues:
+        issue_id = bissue["id"]
+        battachments = bexport.get_issue_attachments(issue_id)
+        if not battachments:
+            continue
+        print("Store attachments of bitbucket issue #{}...".format(issue_id))
+        urls = {}
+        for name in battachments.keys():
+            content = bexport.get_issue_attachment_bytes(issue_id, name)
+            if push:
+                urls[name] = attachment_store.add(name, content)
+            else:
+                urls[name] = attachment_store.get_url(name, content)
+        attachment_urls_by_issue_id[issue_id] = urls
+    if push:
+        attachment_store.commit_and_push("Add attachments of {}".format(bexport.get_repo_full_name()))
+    return attachment_urls_by_issue_id
+
+
+def create_attachment_store(args):
+    return GitAttachmentStore(
+        os.path.join("migration_data", "attachments", args.attachments_repository),
+        args.attachments_repository,
+        args.github_access_token
+    )
+
+
+def generate_issues_and_pulls(bissues, bpulls, pulls_id_offset, attachment_urls_by_issue_id, bexport, cmap, args,
+                              skipped_numbers=frozenset()):
+    """Renders the github payloads of all issues and pull requests one by one, in the order of their github number.
+    Yields (number, issue or pull request) pairs. Missing ids are filled with empty issues. The numbers in
+    `skipped_numbers` are neither rendered nor yielded.
+    """
+    number = 0
 
-    # Prepare issues
     print("Prepare github issues...")
     for bissue in bissues:
         issue_id = bissue["id"]
-        print("Prepare github issue #{} from bitbucket issue...".format(issue_id))
-        while issue_id > len(issues_and_pulls) + 1:
-            print("Warning: There is no bitbucket issue with id #{}".format(len(issues_and_pulls) + 1))
+        while issue_id > number + 1:
+            number += 1
+            if number in skipped_numbers:
+                continue
+            print("Warning: There is no bitbucket issue with id #{}".format(number))
             print("Creating an empty github issue...")
-            issues_and_pulls.append(construct_empty_gissue(len(issues_and_pulls) + 1, from_bpull=False))
-        gissue = construct_gissue_from_bissue(bissue, bexport, attachment_gist_by_issue_id, cmap, args)
-        issues_and_pulls.append({"type": "issue", "data": gissue})
+            yield number, construct_empty_gissue(number, from_bpull=False)
+        number += 1
+        if number in skipped_numbers:
+            continue
+        gissue = construct_gissue_from_bissue(bissue, bexport, attachment_urls_by_issue_id, cmap, args)
+        yield number, {"type": "issue", "data": gissue}
 
     for bpull in bpulls:
         issue_id = bpull["id"] + pulls_id_offset
-        print("Prepare github issue #{} from bitbucket pull request...".format(issue_id))
-        while issue_id > len(issues_and_pulls) + 1:
-            print("Warning: There is no bitbucket pull request with id #{}.".format(len(issues_and_pulls) + 1 - pulls_id_offset))
+        while issue_id > number + 1:
+            number += 1
+            if number in skipped_numbers:
+                continue
+            print("Warning: There is no bitbucket pull request with id #{}.".format(number - pulls_id_offset))
             print("Creating an empty github issue...")
-            issues_and_pulls.append(construct_empty_gissue(len(issues_and_pulls) + 1, from_bpull=True))
+            yield number, construct_empty_gissue(number, from_bpull=True)
+        number += 1
+        if number in skipped_numbers:
+            continue
         gissue_or_gpull = construct_gissue_or_gpull_from_bpull(bpull, bexport, cmap, args)
-        issues_and_pulls.append(gissue_or_gpull)
+        yield number, gissue_or_gpull
 
-    # Upload github issues
-    print("Upload github issues...")
-    existing_gissues = gimport.get_issues()
-    existing_gpulls = gimport.get_pulls()
 
-    for index, issue_or_pull in enumerate(issues_and_pulls):
-        number = index + 1
-        type = issue_or_pull["type"]
-        data = issue_or_pull["data"]
+def generate_changed_issues_and_pulls(bissues, bpulls, pulls_id_offset, attachment_urls_by_issue_id, bexport, cmap, args,
+                                      skipped_numbers=frozenset()):
+    """Renders the given (changed) issues and pull requests, in the order of their github number.
+    Yields (number, issue or pull request) pairs. No empty issues are generated for missing ids. The numbers in
+    `skipped_numbers` are neither rendered nor yielded.
+    """
+    for bissue in bissues:
+        if bissue["id"] not in skipped_numbers:
+            gissue = construct_gissue_from_bissue(bissue, bexport, attachment_urls_by_issue_id, cmap, args)
+            yield bissue["id"], {"type": "issue", "data": gissue}
+    for bpull in bpulls:
+        number = bpull["id"] + pulls_id_offset
+        if number not in skipped_numbers:
+            yield number, construct_gissue_or_gpull_from_bpull(bpull, bexport, cmap, args)
+
+
+def prepare_issues_and_pulls(bissues, bpulls, pulls_id_offset, attachment_urls_by_issue_id, bexport, cmap, args):
+    """Renders the github payloads of all issues and pull requests, ordered by their github number.
+    """
+    issues_and_pulls = generate_issues_and_pulls(bissues, bpulls, pulls_id_offset, attachment_urls_by_issue_id, bexport, cmap, args)
+    count = get_issues_and_pulls_count(bissues, bpulls, pulls_id_offset)
+    with ProgressReporter("render", count, bexport.scheduler) as progress:
+        return [issue_or_pull for _, issue_or_pull in progress.iterate(issues_and_pulls)]
+
+
+def get_issues_and_pulls_count(bissues, bpulls, pulls_id_offset):
+    if bpulls:
+        return pulls_id_offset + bpulls[-1]["id"]
+    if bissues:
+        return bissues[-1]["id"]
+    return 0
+
+
+def get_render_hash(cmap, args):
+    """Returns a hash of everything besides the bitbucket data that the rendered issues depend on: the mappings
+    of the configuration, the commit map and the repositories and attachment options passed by command line.
+    """
+    return hash_render_inputs(
+        config.USER_MAPPING,
+        config.KIND_MAPPING,
+        config.PRIORITY_MAPPING,
+        config.COMPONENT_MAPPING,
+        config.STATE_MAPPING,
+        config.OPEN_ISSUE_OR_PULL_REQUEST_STATES,
+        config.KNOWN_REPO_MAPPING,
+        config.KNOWN_ISSUES_COUNT_MAPPING,
+        cmap.maps,
+        args.bitbucket_repository,
+        args.github_repository,
+        args.attachments_repository,
+        args.skip_attachments
+    )
 
-        print("Upload github issue or pull request #{}... [rate limiting: {}]".format(number, gimport.get_remaining_rate_limit()))
 
-        if type == "issue":
-            if number in existing_gissues:
-                print("Update github issue #{}...".format(number))
-                gimport.update_issue_with_comments(existing_gissues[number], data)
-            else:
-                print("Create github issue #{}...".format(number))
-                gimport.create_issue_with_comments(data)
-        elif type == "pull":
-            pull_number = number - pulls_id_offset
-            if pull_number in existing_gpulls:
-                print("Update github pull request #{}...".format(number))
-                gimport.update_issue_with_comments(existing_gpulls[pull_number], data)
-            else:
-                print("Create github pull request #{}...".format(number))
-                try:
-                    gimport.create_pull_with_comments(data)
-                except:
-                    print("Failed to process pull request #{}".format(number))
+def get_source_hashes(bissues, bpulls, pulls_id_offset, render_hash, complete=True):
+    """Returns a map from github numbers to the fingerprint of the bitbucket data and the other inputs (see
+    `get_render_hash`) that they are rendered from.
+    The missing ids, which are rendered as empty issues, are only included if `complete` is set.
+    """
+    source_hashes = {}
+    if complete:
+        for number in range(1, get_issues_and_pulls_count(bissues, bpulls, pulls_id_offset) + 1):
+            source_hashes[number] = hash_source(None, render_hash)
+    for bissue in bissues:
+        source_hashes[bissue["id"]] = hash_source(bissue, render_hash)
+    for bpull in bpulls:
+        source_hashes[bpull["id"] + pulls_id_offset] = hash_source(bpull, render_hash)
+    return source_hashes
+
+
+def get_existing_states(gimport, journal, first_number):
+    """Returns the state of the existing github issues and pull requests (a map from number to `IssueState`) for an
+    upload that starts at `first_number`. If the journal has confirmed all existing github issues and recorded none
+    from `first_number` on, every uploaded issue is new and no state is loaded.
+    """
+    first_unconfirmed = journal.get_first_unconfirmed()
+    if first_number >= first_unconfirmed and not journal.has_entries_from(first_unconfirmed) \
+            and gimport.get_issues_count() == first_unconfirmed - 1:
+        print("The journal has confirmed all {} existing github issues and pull requests, so their state is not loaded.".format(
+            first_unconfirmed - 1
+        ))
+        return {}
+    print("Get the state of existing github issues and pull requests...")
+    return gimport.get_issue_states()
+
+
+def upload_issue_or_pull(number, issue_or_pull, existing_states, gimport, on_confirmed):
+    """Creates or updates a github issue or pull request. `on_confirmed` is called once github has the rendered
+    state, which may be later for the issues submitted to the Issue Import API.
+    """
+    type = issue_or_pull["type"]
+    data = issue_or_pull["data"]
+
+    if number in existing_states and existing_states[number].matches(issue_or_pull):
+        print("Github issue or pull request #{} is up to date.".format(number))
+        on_confirmed()
+    elif type == "issue":
+        if number in existing_states:
+            print("Update github issue #{}...".format(number))
+            gimport.update_issue_with_comments(number, existing_states[number], data)
+            on_confirmed()
+        else:
+            print("Create github issue #{}...".format(number))
+            gimport.submit_issue_with_comments(number, data, on_imported=on_confirmed)
+    elif type == "pull":
+        if number in existing_states and existing_states[number].is_pull:
+            print("Update github pull request #{}...".format(number))
+            gimport.update_pull_with_comments(number, existing_states[number], data)
+            on_confirmed()
+        elif number in existing_states:
+            print("Error: github issue #{} is not a pull request.".format(number))
+        else:
+            print("Create github pull request #{}...".format(number))
+            # The pull request takes the next number, so all preceding issues have to be imported first
+            gimport.flush_issue_imports()
+            try:
+                gimport.create_pull_with_comments(data)
+                on_confirmed()
+            except Exception:
+                print("Failed to process pull request #{}".format(number))
+    else:
+        print("Error: unknown type '{}' for data '{}'".format(type, data))
+
+
+def render_bitbucket_issues_and_pulls(bexport, gimport, cmap, args, updated_since=None, migration_plan=None, journal=None):
+    """Retrieves the bitbucket issues and pull requests and migrates their attachments.
+    Returns a generator of the rendered (number, issue or pull request) pairs, the highest number and the
+    fingerprints of the bitbucket data of the numbers (see `get_source_hashes`).
+    If `updated_since` is given, only the issues and pull requests updated since then are rendered.
+    If `migration_plan` is given, the attachments are not migrated, but the gists that would be written are counted.
+    If `journal` is given (and none of `--restart`, `--first` and `--last`), the issues and pull requests that it
+    has confirmed with the same bitbucket data and configuration are skipped before their comments and attachments
+    are retrieved.
+    """
+    brepo_full_name = bexport.get_repo_full_name()
+
+    with phase("fetch"):
+        # Retrieve data
+        try:
+            bissues = bexport.get_issues(updated_since)
+        except requests.exceptions.HTTPError:
+            # E.g. the issue tracker of the repository is disabled
+            bissues = []
+        bpulls = bexport.get_pulls(updated_since)
+        assert brepo_full_name in config.KNOWN_ISSUES_COUNT_MAPPING
+        # A delta sync only has the changed issues, so their count says nothing about the highest id
+        max_bissue_id = max((x["id"] for x in bissues), default=0)
+        assert config.KNOWN_ISSUES_COUNT_MAPPING[brepo_full_name] >= max_bissue_id, max_bissue_id
+        pulls_id_offset = config.KNOWN_ISSUES_COUNT_MAPPING[brepo_full_name]
+        issues_and_pulls_count = get_issues_and_pulls_count(bissues, bpulls, pulls_id_offset)
+        source_hashes = get_source_hashes(
+            bissues, bpulls, pulls_id_offset, get_render_hash(cmap, args), complete=updated_since is None
+        )
+
+        # The numbers selected with --first and --last are always rendered again, and only skipped by the upload
+        # if their payload is unchanged
+        skipped_numbers = set()
+        if journal is not None and not args.restart and args.first is None and args.last is None:
+            confirmed_source_hashes = journal.get_confirmed_source_hashes()
+            skipped_numbers = {
+                number for number, source_hash in source_hashes.items()
+                if confirmed_source_hashes.get(number) == source_hash
+            }
+        if skipped_numbers:
+            print("Skipping {} github issues and pull requests that have already been migrated...".format(len(skipped_numbers)))
+            if migration_plan is not None:
+                migration_plan.add("issues_skipped", len(skipped_numbers))
+            bissues_to_render = [x for x in bissues if x["id"] not in skipped_numbers]
+        else:
+            bissues_to_render = bissues
+
+        # Migrate attachments
+        attachment_index = AttachmentIndex(config.ATTACHMENT_INDEX_PATH).load_from_disk()
+        if not args.skip_attachments and args.attachments_repository is not None:
+            print("Migrate bitbucket attachments to github repository '{}'...".format(args.attachments_repository))
+            attachment_store = create_attachment_store(args).open()
+            attachment_urls_by_issue_id = get_attachment_urls_from_git_store(
+                bissues_to_render, bexport, attachment_store, push=migration_plan is None
+            )
+        elif not args.skip_attachments and migration_plan is not None:
+            print("Plan the migration of bitbucket attachments to github...")
+            attachment_urls_by_issue_id = get_attachment_urls(
+                bissues_to_render, bexport, gimport, attachment_index, args, create_gists=False, migration_plan=migration_plan
+            )
+        elif not args.skip_attachments:
+            print("Migrate bitbucket attachments to github...")
+            attachment_urls_by_issue_id = get_attachment_urls(bissues_to_render, bexport, gimport, attachment_index, args)
         else:
-            print("Error: unknown type '{}' for data '{}'".format(type, data))
+            print("Warning: migration of bitbucket attachments to github has been skipped.")
+            attachment_urls_by_issue_id = {}
 
-    # Final checks
-    if pulls_id_offset + len(bpulls) != gimport.get_issues_count():
-        print("Error: the number of Github issues and pull requests seems to be wrong ({} + {} != {}).".format(
-            pulls_id_offset,
-            len(bpulls),
+    if updated_since is not None:
+        print("Found {} bitbucket issues and {} pull requests updated since {}.".format(len(bissues), len(bpulls), updated_since))
+        numbered_issues_and_pulls = generate_changed_issues_and_pulls(
+            bissues, bpulls, pulls_id_offset, attachment_urls_by_issue_id, bexport, cmap, args, skipped_numbers
+        )
+    else:
+        numbered_issues_and_pulls = generate_issues_and_pulls(
+            bissues, bpulls, pulls_id_offset, attachment_urls_by_issue_id, bexport, cmap, args, skipped_numbers
+        )
+    return profile_iteration("render", numbered_issues_and_pulls), issues_and_pulls_count, source_hashes
+
+
+def upload_issues_and_pulls(numbered_issues_and_pulls, issues_and_pulls_count, gimport, args, complete=True,
+                            source_hashes=None):
+    """Uploads the (number, issue or pull request) pairs in the order of their number.
+    Only the numbers between `--first` and `--last` are uploaded. `complete` is False if the pairs only contain the
+    changed issues and pull requests. The fingerprints of their bitbucket data (`source_hashes`, by number) are
+    recorded in the journal, so that the next run can skip them before rendering them.
+    Returns whether github has confirmed all uploaded issues and pull requests.
+    """
+    if source_hashes is None:
+        source_hashes = {}
+    # Numbers that have been uploaded, but not (yet) confirmed
+    unconfirmed_numbers = set()
+
+    def confirm(number, type, payload_hash, source_hash):
+        journal.record(number, type, payload_hash, MigrationJournal.CONFIRMED, source_hash)
+        unconfirmed_numbers.discard(number)
+
+    # Issues and pull requests confirmed by a previous run are skipped without any github request
+    journal = MigrationJournal(config.MIGRATION_JOURNAL_PATH, gimport.get_repo_full_name())
+    first_number = 1 if args.first is None else args.first
+    last_number = issues_and_pulls_count if args.last is None else min(args.last, issues_and_pulls_count)
+    if args.restart and args.first is None and args.last is None:
+        print("Clearing the migration journal of '{}'...".format(gimport.get_repo_full_name()))
+        journal.clear()
+    elif args.restart:
+        print("Clearing the migration journal of '{}' from github issue #{} to #{}...".format(
+            gimport.get_repo_full_name(),
+            first_number,
+            last_number
+        ))
+        journal.clear(first_number, last_number)
+    first_unconfirmed = journal.get_first_unconfirmed()
+    if first_unconfirmed > 1:
+        print("Resuming the migration at github issue #{}...".format(first_unconfirmed))
+    confirmed_source_hashes = journal.get_confirmed_source_hashes()
+    # Loaded once the first issue that needs an upload is known
+    existing_states = None
+
+    # The progress is measured in issue numbers, which a delta sync skips
+    previous_number = first_number - 1
+    with ProgressReporter("upload", max(0, last_number - previous_number), gimport.scheduler) as progress:
+        for number, issue_or_pull in numbered_issues_and_pulls:
+            if number < first_number or number > last_number:
+                continue
+            # The numbers between two yielded issues have not changed since the last sync
+            if number - previous_number > 1:
+                progress.advance(number - previous_number - 1, skipped=True)
+            previous_number = number
+            payload_hash = hash_payload(issue_or_pull)
+            source_hash = source_hashes.get(number)
+            if journal.is_confirmed(number, payload_hash):
+                # E.g. after a change of the configuration that does not affect this issue, which is then skipped
+                # before rendering by the next run
+                if source_hash is not None and confirmed_source_hashes.get(number) != source_hash:
+                    journal.record(number, issue_or_pull["type"], payload_hash, MigrationJournal.CONFIRMED, source_hash)
+                progress.advance(skipped=True)
+                continue
+
+            if existing_states is None:
+                existing_states = get_existing_states(gimport, journal, number)
+            journal.record(number, issue_or_pull["type"], payload_hash, MigrationJournal.SUBMITTED, source_hash)
+            unconfirmed_numbers.add(number)
+            upload_issue_or_pull(
+                number,
+                issue_or_pull,
+                existing_states,
+                gimport,
+                partial(confirm, number, issue_or_pull["type"], payload_hash, source_hash)
+            )
+            progress.advance()
+        if last_number > previous_number:
+            progress.advance(last_number - previous_number, skipped=True)
+        gimport.flush_issue_imports()
+    journal.close()
+
+    # Final checks (a delta sync only knows the changed issues)
+    if complete and last_number == issues_and_pulls_count and issues_and_pulls_count != gimport.get_issues_count():
+        print("Error: the number of Github issues and pull requests seems to be wrong ({} != {}).".format(
+            issues_and_pulls_count,
             gimport.get_issues_count()
         ))
 
+    if unconfirmed_numbers:
+        print("Error: github has not confirmed the issues and pull requests {}.".format(
+            ", ".join("#{}".format(x) for x in sorted(unconfirmed_numbers))
+        ))
+
+    print("Github rate limiting: {}".format(gimport.scheduler.format_metrics()))
+    print("Github connections: {}".format(format_connection_stats(gimport.session)))
+    print("Github cache: {}".format(gimport.cache.format_stats()))
+    return not unconfirmed_numbers
+
+
+def get_updated_since(journal, args):
+    """Returns the time since which changed issues and pull requests have to be synced, or None for a full sync.
+    """
+    if args.since is None:
+        return None
+    if args.since != "last":
+        return args.since
+    updated_since = journal.get_high_water_mark()
+    if updated_since is None:
+        raise Exception("No previous migration to '{}' is recorded, so --since needs an explicit time.".format(
+            journal.repository
+        ))
+    return updated_since
+
+
+def record_high_water_mark(journal, synced_at, all_confirmed, args):
+    """Records that the bitbucket data of `synced_at` have been migrated, if all issues and pull requests have been
+    uploaded and confirmed. The unconfirmed issues have to be synced again by the next delta sync.
+    """
+    if args.first is None and args.last is None and all_confirmed:
+        journal.set_high_water_mark(synced_at)
+        print("Recorded the migration of the bitbucket data of {}.".format(synced_at))
+    elif not all_confirmed:
+        print("Warning: the migration of the bitbucket data of {} is not recorded, since some issues failed.".format(synced_at))
+
+
+def bitbucket_to_github(bexport, gimport, cmap, args):
+    # The high-water mark is taken before retrieving data, so that changes made during the migration are synced again
+    journal = MigrationJournal(config.MIGRATION_JOURNAL_PATH, gimport.get_repo_full_name())
+    synced_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    updated_since = get_updated_since(journal, args)
+    numbered_issues_and_pulls, issues_and_pulls_count, source_hashes = render_bitbucket_issues_and_pulls(
+        bexport, gimport, cmap, args, updated_since, journal=journal
+    )
+
+    # Prepare and upload github issues: the issues are rendered in a background thread, at most
+    # PREPARE_QUEUE_SIZE issues ahead of the upload
+    print("Prepare and upload github issues...")
+    with phase("upload"):
+        all_confirmed = upload_issues_and_pulls(
+            iterate_in_background(numbered_issues_and_pulls, config.PREPARE_QUEUE_SIZE),
+            issues_and_pulls_count,
+            gimport,
+            args,
+            complete=updated_since is None,
+            source_hashes=source_hashes
+        )
+    record_high_water_mark(journal, synced_at, all_confirmed, args)
+    journal.close()
+
+    print("Bitbucket rate limiting: {}".format(bexport.scheduler.format_metrics()))
+    print("Bitbucket connections: {}".format(format_connection_stats(bexport.session)))
+
+
+def prepare(bexport, gimport, cmap, args):
+    """Renders all issues and pull requests to a payload file, which can be uploaded later with `--upload`.
+    """
+    # Like in `bitbucket_to_github`, the high-water mark is taken before retrieving data
+    journal = MigrationJournal(config.MIGRATION_JOURNAL_PATH, gimport.get_repo_full_name())
+    synced_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    updated_since = get_updated_since(journal, args)
+    journal.close()
+    numbered_issues_and_pulls, issues_and_pulls_count, source_hashes = render_bitbucket_issues_and_pulls(
+        bexport, gimport, cmap, args, updated_since
+    )
+
+    print("Prepare github issues to '{}'...".format(args.prepare))
+    with ProgressReporter("render", issues_and_pulls_count, bexport.scheduler) as progress:
+        written_count = PayloadFile(args.prepare).write(progress.iterate(numbered_issues_and_pulls), metadata={
+            "bitbucket_repository": bexport.get_repo_full_name(),
+            "github_repository": gimport.get_repo_full_name(),
+            "count": issues_and_pulls_count,
+            "updated_since": updated_since,
+            "synced_at": synced_at,
+            # JSON keys are strings
+            "source_hashes": {str(number): source_hash for number, source_hash in source_hashes.items()},
+        })
+    print("Prepared {} github issues and pull requests.".format(written_count))
+
+    print("Bitbucket rate limiting: {}".format(bexport.scheduler.format_metrics()))
+    print("Bitbucket connections: {}".format(format_connection_stats(bexport.session)))
+
+
+def upload(gimport, args):
+    """Uploads the issues and pull requests of a payload file written by `--prepare`.
+    """
+    payload_file = PayloadFile(args.upload)
+    metadata = payload_file.get_metadata()
+    if metadata.get("github_repository") != gimport.get_repo_full_name():
+        print("Warning: the payload file '{}' has been prepared for github repository '{}', not '{}'.".format(
+            args.upload,
+            metadata.get("github_repository"),
+            gimport.get_repo_full_name()
+        ))
+
+    print("Upload github issues from '{}'...".format(args.upload))
+    with phase("upload"):
+        all_confirmed = upload_issues_and_pulls(
+            payload_file.iterate(args.first, args.last),
+            metadata["count"],
+            gimport,
+            args,
+            complete=metadata.get("updated_since") is None,
+            source_hashes={int(number): x for number, x in metadata.get("source_hashes", {}).items()}
+        )
+    # Payload files of older versions don't know when their bitbucket data have been retrieved
+    if metadata.get("synced_at") is not None:
+        journal = MigrationJournal(config.MIGRATION_JOURNAL_PATH, gimport.get_repo_full_name())
+        record_high_water_mark(journal, metadata["synced_at"], all_confirmed, args)
+        journal.close()
+
+
+def plan(bexport, gimport, cmap, args):
+    """Counts the github reads, writes, gist creations and import calls of a migration and predicts its duration
+    with the current rate limit. The issues and pull requests are rendered from bitbucket, or read from the payload
+    file of `--upload`. Nothing is written to github.
+    """
+    migration_plan = MigrationPlan(gimport.max_pending_imports)
+    journal = MigrationJournal(config.MIGRATION_JOURNAL_PATH, gimport.get_repo_full_name())
+    if args.upload:
+        payload_file = PayloadFile(args.upload)
+        numbered_issues_and_pulls = payload_file.iterate(args.first, args.last)
+        issues_and_pulls_count = payload_file.get_metadata()["count"]
+        complete = payload_file.get_metadata().get("updated_since") is None
+    else:
+        updated_since = get_updated_since(journal, args)
+        numbered_issues_and_pulls, issues_and_pulls_count, _ = render_bitbucket_issues_and_pulls(
+            bexport, gimport, cmap, args, updated_since, migration_plan, journal
+        )
+        complete = updated_since is None
+    existing_states = None
+
+    first_number = 1 if args.first is None else args.first
+    last_number = issues_and_pulls_count if args.last is None else min(args.last, issues_and_pulls_count)
+    previous_number = first_number - 1
+    with ProgressReporter("plan", max(0, last_number - previous_number), bexport.scheduler if bexport else None) as progress:
+        for number, issue_or_pull in numbered_issues_and_pulls:
+            if number < first_number or number > last_number:
+                continue
+            if number - previous_number > 1:
+                progress.advance(number - previous_number - 1, skipped=True)
+            previous_number = number
+            if not args.restart and journal.is_confirmed(number, hash_payload(issue_or_pull)):
+                migration_plan.add_skipped()
+                progress.advance(skipped=True)
+            else:
+                if existing_states is None:
+                    existing_states = get_existing_states(gimport, journal, number)
+                migration_plan.add_issue_or_pull(issue_or_pull, existing_states.get(number))
+                progress.advance()
+        if last_number > previous_number:
+            progress.advance(last_number - previous_number, skipped=True)
+    # The migration sends the same requests as the plan to list the gists and to load the state of github
+    migration_plan.add("reads", gimport.scheduler.requests_count)
+    # Like the upload, a delta sync or a partial range does not count the github issues at the end
+    migration_plan.finish(complete and last_number == issues_and_pulls_count)
+    journal.close()
+
+    print("Plan of the migration to github repository '{}':".format(gimport.get_repo_full_name()))
+    print(migration_plan.format_report(gimport.scheduler))
+    writes_count = sum(
+        x["count"] for x in gimport.metrics.to_json()["endpoints"]
+        if x["method"] != "GET" and x["endpoint"] != "/graphql"
+    )
+    print("Github requests sent by the plan: {} ({} writes).".format(gimport.scheduler.requests_count, writes_count))
+
+
+def verify(bexport, gimport, cmap, args):
+    """Compares every rendered payload with the state of the github repository and writes a report of the
+    issues and pull requests that need to be re-synced. Nothing is written to github, but the journal forgets the
+    differing issues, so that the next migration uploads them again.
+    """
+    brepo_full_name = bexport.get_repo_full_name()
+    pulls_id_offset = config.KNOWN_ISSUES_COUNT_MAPPING[brepo_full_name]
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # Load the github state while the payloads are rendered
+        print("Get the state of existing github issues and pull requests...")
+        future_states = executor.submit(gimport.get_issue_states)
+        with phase("fetch"):
+            try:
+                bissues = bexport.get_issues()
+            except requests.exceptions.HTTPError:
+                # E.g. the issue tracker of the repository is disabled
+                bissues = []
+            bpulls = bexport.get_pulls()
+            attachment_index = AttachmentIndex(config.ATTACHMENT_INDEX_PATH).load_from_disk()
+            if args.skip_attachments:
+                attachment_urls_by_issue_id = {}
+            elif args.attachments_repository is not None:
+                attachment_urls_by_issue_id = get_attachment_urls_from_git_store(bissues, bexport, create_attachment_store(args), push=False)
+            else:
+                attachment_urls_by_issue_id = get_attachment_urls(bissues, bexport, gimport, attachment_index, args, create_gists=False)
+        with phase("render"):
+            issues_and_pulls = prepare_issues_and_pulls(bissues, bpulls, pulls_id_offset, attachment_urls_by_issue_id, bexport, cmap, args)
+        existing_states = future_states.result()
+
+    mismatches = []
+    for index, issue_or_pull in enumerate(issues_and_pulls):
+        number = index + 1
+        if number not in existing_states:
+            fields = ["missing"]
+        else:
+            fields = existing_states[number].diff(issue_or_pull)
+        if fields:
+            print("Github {} #{} differs: {}".format(issue_or_pull["type"], number, ", ".join(fields)))
+            mismatches.append({"number": number, "type": issue_or_pull["type"], "fields": fields})
+    unexpected = sorted(number for number in existing_states if number > len(issues_and_pulls))
+
+    report = {
+        "bitbucket_repository": brepo_full_name,
+        "github_repository": gimport.get_repo_full_name(),
+        "checked": len(issues_and_pulls),
+        "mismatches": mismatches,
+        "unexpected": unexpected,
+        "resync": [x["number"] for x in mismatches],
+    }
+    with open(args.verify_report, "w") as file:
+        json.dump(report, file, indent=2)
+    if mismatches:
+        journal = MigrationJournal(config.MIGRATION_JOURNAL_PATH, gimport.get_repo_full_name())
+        journal.forget(report["resync"])
+        journal.close()
+        print("The next migration will upload the {} differing github issues and pull requests again.".format(len(mismatches)))
+    print("Verified {} github issues and pull requests: {} mismatches, {} unexpected. Report written to '{}'.".format(
+        len(issues_and_pulls),
+        len(mismatches),
+        len(unexpected),
+        args.verify_report
+    ))
+
 
 def check(bexport, gimport, args):
     # Retrieve data
@@ -924,47 +1536,54 @@ def check(bexport, gimport, args):
 
     # Check authors
     bnicknames = set()
-    for bissue in bissues:
-        bissue_id = bissue["id"]
-        if bissue_id % 10 == 0:
-            print("Checking bitbucket issue #{}...".format(bissue_id))
-        if bissue["assignee"] is not None:
-            bnicknames.add(bissue["assignee"]["nickname"])
-        for bcomment in bexport.get_issue_comments(bissue_id).values():
-            bnicknames.add(bcomment["user"]["nickname"])
-    for bpull in bpulls:
-        bpull_id = bpull["id"]
-        if bpull_id % 10 == 0:
-            print("Checking bitbucket pull request #{}...".format(bpull_id))
-        if bpull["author"] is not None:
-            bnicknames.add(bpull["author"]["nickname"])
-        for bparticipant in bpull["participants"]:
-            bnicknames.add(bparticipant["user"]["nickname"])
-        for breviewer in bpull["reviewers"]:
-            bnicknames.add(breviewer["nickname"])
-        for bcomment in bexport.get_issue_comments(bissue_id).values():
-            bnicknames.add(bcomment["user"]["nickname"])
-        if (bpull["source"]["repository"] is None) != (bpull["source"]["commit"] is None):
-            print("Info: source repository is '{}', but commit is '{}'".format(
-                bpull["source"]["repository"],
-                bpull["source"]["commit"]
-            ))
-        if (bpull["destination"]["repository"] is None) != (bpull["destination"]["commit"] is None):
-            print("Info: destination repository is '{}', but commit is '{}'".format(
-                bpull["destination"]["repository"],
-                bpull["destination"]["commit"]
-            ))
-        if bpull["destination"]["repository"] is None:
-            print("Info: destination repository is None")
-        if bpull["source"]["branch"] is None:
-            print("Info: source branch is None")
-        if bpull["destination"]["branch"] is None:
-            print("Info: destination branch is None")
+    with ProgressReporter("check", len(bissues) + len(bpulls), bexport.scheduler) as progress:
+        for bissue in progress.iterate(bissues):
+            bissue_id = bissue["id"]
+            if bissue["assignee"] is not None:
+                bnicknames.add(bissue["assignee"]["nickname"])
+            for bcomment in bexport.get_issue_comments(bissue_id).values():
+                bnicknames.add(bcomment["user"]["nickname"])
+        for bpull in progress.iterate(bpulls):
+            if bpull["author"] is not None:
+                bnicknames.add(bpull["author"]["nickname"])
+            for bparticipant in bpull["participants"]:
+                bnicknames.add(bparticipant["user"]["nickname"])
+            for breviewer in bpull["reviewers"]:
+                bnicknames.add(breviewer["nickname"])
+            for bcomment in bexport.get_issue_comments(bissue_id).values():
+                bnicknames.add(bcomment["user"]["nickname"])
+            if (bpull["source"]["repository"] is None) != (bpull["source"]["commit"] is None):
+                print("Info: source repository is '{}', but commit is '{}'".format(
+                    bpull["source"]["repository"],
+                    bpull["source"]["commit"]
+                ))
+            if (bpull["destination"]["repository"] is None) != (bpull["destination"]["commit"] is None):
+                print("Info: destination repository is '{}', but commit is '{}'".format(
+                    bpull["destination"]["repository"],
+                    bpull["destination"]["commit"]
+                ))
+            if bpull["destination"]["repository"] is None:
+                print("Info: destination repository is None")
+            if bpull["source"]["branch"] is None:
+                print("Info: source branch is None")
+            if bpull["destination"]["branch"] is None:
+                print("Info: destination branch is None")
     for nickname in bnicknames:
         if nickname not in config.USER_MAPPING:
             print("Warning: bitbucket user '{}' is not configured in USER_MAPPING.".format(nickname))
 
 
+def report_request_metrics(metrics_list, args):
+    """Prints the requests per endpoint and optionally writes them to the JSON file of `--http-metrics`.
+    """
+    for metrics in metrics_list:
+        print("{} requests per endpoint:".format(metrics.name.capitalize()))
+        print(metrics.format_table())
+    if args.http_metrics:
+        export_request_metrics(args.http_metrics, metrics_list)
+        print("Request metrics written to '{}'.".format(args.http_metrics))
+
+
 def create_parser():
     parser = argparse.ArgumentParser(
         prog="migrate-discussion",
@@ -987,39 +1606,145 @@ def create_parser():
     )
     parser.add_argument(
         "--bitbucket-username",
-        help="BitBucket username with access to repository.",
-        required=True
+        help="BitBucket username with access to repository (not needed by --upload)."
     )
     parser.add_argument(
         "--bitbucket-password",
-        help="BitBucket password.",
-        required=True
+        help="BitBucket password (not needed by --upload)."
+    )
+    parser.add_argument(
+        "--bitbucket-api-url",
+        help="Base URL of the Bitbucket API, e.g. of a local stand-in for benchmarks (default: {})".format(config.BITBUCKET_API_URL),
+        default=config.BITBUCKET_API_URL
+    )
+    parser.add_argument(
+        "--github-api-url",
+        help="Base URL of the Github API, e.g. of a local stand-in for benchmarks (default: {})".format(config.GITHUB_API_URL),
+        default=config.GITHUB_API_URL
     )
     parser.add_argument(
         "--skip-attachments",
         help="Skip the migration of attachments (development only!)",
         action="store_true"
     )
+    parser.add_argument(
+        "--attachments-repository",
+        help="Full name of a Github repository (e.g. viperproject/silver-attachments) to store the attachments in, instead of gists"
+    )
     parser.add_argument(
         "--check",
         help="Check the configuration",
         action="store_true"
     )
+    parser.add_argument(
+        "--verify",
+        help="Compare the migrated issues and pull requests with github and report the ones that need to be re-synced",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--verify-report",
+        help="Path of the JSON report written by --verify",
+        default="migration_data/verify-report.json"
+    )
+    parser.add_argument(
+        "--restart",
+        help=(
+            "Ignore the issues and pull requests that the migration journal records as migrated by a previous run "
+            "(only between --first and --last, if given)"
+        ),
+        action="store_true"
+    )
+    parser.add_argument(
+        "--since",
+        help=(
+            "Only sync the issues and pull requests updated on Bitbucket since the given time (ISO 8601, "
+            "e.g. 2020-06-01T00:00:00+00:00), or since the last completed migration if no time is given"
+        ),
+        nargs="?",
+        const="last"
+    )
+    parser.add_argument(
+        "--prepare",
+        help="Only render the issues and pull requests, and write them to the given payload file",
+        metavar="PAYLOAD_FILE"
+    )
+    parser.add_argument(
+        "--upload",
+        help="Only upload the issues and pull requests of a payload file written by --prepare (no Bitbucket access needed)",
+        metavar="PAYLOAD_FILE"
+    )
+    parser.add_argument(
+        "--plan",
+        help="Count the github requests of the migration (or of the --upload of a payload file) and predict its duration, without writing to github",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--first",
+        help="Number of the first github issue or pull request to upload",
+        type=int
+    )
+    parser.add_argument(
+        "--last",
+        help="Number of the last github issue or pull request to upload",
+        type=int
+    )
+    parser.add_argument(
+        "--http-metrics",
+        help="Write the count, status, size, latency histogram and retries of the requests per endpoint to the given JSON file",
+        metavar="JSON_FILE"
+    )
+    parser.add_argument(
+        "--profile",
+        help="Profile the phases fetch, render and upload with cProfile and write the profiles to the given pstats file (and one file per phase next to it)",
+        metavar="PSTATS_FILE"
+    )
     return parser
 
 
 def main():
     parser = create_parser()
     args = parser.parse_args()
-    bexport = BitbucketExport(args.bitbucket_repository, args.bitbucket_username, args.bitbucket_password)
-    gimport = GithubImport(args.github_access_token, args.github_repository, debug=False)
+    if not args.upload and (args.bitbucket_username is None or args.bitbucket_password is None):
+        parser.error("the following arguments are required: --bitbucket-username, --bitbucket-password")
+    if args.profile:
+        profiler.enable(args.profile)
+    try:
+        # Everything outside of the fetch, render and upload phases is attributed to the "main" phase
+        with phase("main"):
+            migrate(args)
+    finally:
+        profiler.write()
+
+
+def migrate(args):
+    gimport = GithubImport(args.github_access_token, args.github_repository, debug=False, api_url=args.github_api_url)
+    if args.upload:
+        if args.plan:
+            plan(bexport=None, gimport=gimport, cmap=None, args=args)
+        else:
+            upload(gimport=gimport, args=args)
+        report_request_metrics([gimport.metrics], args)
+        return
+    bexport = BitbucketExport(
+        args.bitbucket_repository,
+        args.bitbucket_username,
+        args.bitbucket_password,
+        api_url=args.bitbucket_api_url
+    )
     cmap = CommitMap()
     print("Load mapping of mercurial commits to git...")
     cmap.load_from_disk()
     if args.check:
         check(bexport=bexport, gimport=gimport, args=args)
+    elif args.verify:
+        verify(bexport=bexport, gimport=gimport, cmap=cmap, args=args)
+    elif args.plan:
+        plan(bexport=bexport, gimport=gimport, cmap=cmap, args=args)
+    elif args.prepare:
+        prepare(bexport=bexport, gimport=gimport, cmap=cmap, args=args)
     else:
         bitbucket_to_github(bexport=bexport, gimport=gimport, cmap=cmap, args=args)
+    report_request_metrics([bexport.metrics, gimport.metrics], args)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import threading
+from urllib.parse import quote
+
+import git
+
+
+def hash_attachment_content(content):
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+class AttachmentIndex:
+    """Persistent map from the hash of an attachment's content to the URL at which it has been uploaded.
+    It allows to upload identical attachments only once, also across runs.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.urls = {}
+        # Attachments may be migrated concurrently
+        self.lock = threading.Lock()
+
+    def load_from_disk(self):
+        if os.path.isfile(self.path):
+            with open(self.path, "r") as file:
+                self.urls = json.load(file)
+        return self
+
+    def store_to_disk(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with self.lock:
+            with open(tmp_path, "w") as file:
+                json.dump(self.urls, file, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+    def get_url(self, content_hash):
+        return self.urls.get(content_hash, None)
+
+    def add_url(self, content_hash, url):
+        with self.lock:
+            self.urls[content_hash] = url
+
+
+class GitAttachmentStore:
+    """Stores attachments in a local clone of a GitHub repository, which is committed and pushed once.
+    Files are stored under the hash of their content, so identical attachments are stored only once, and are
+    linked by their raw URL. Unlike gists, this has no per-file API calls and no size limit below GitHub's 100 MB.
+    """
+
+    def __init__(self, path, repository, access_token, branch=None):
+        self.path = path
+        self.repository = repository
+        self.access_token = access_token
+        # The default branch of the repository, if not given
+        self.branch = branch
+        self.repo = None
+        self.added_paths = set()
+
+    def get_remote_url(self):
+        return "https://x-access-token:{}@github.com/{}.git".format(self.access_token, self.repository)
+
+    def get_branch(self):
+        """Returns the branch to which the attachments are pushed: the default branch of the repository, or the
+        branch of the clone if the repository is still empty.
+        """
+        if self.branch is None:
+            output = git.cmd.Git().ls_remote("--symref", self.get_remote_url(), "HEAD")
+            for line in output.splitlines():
+                if line.startswith("ref: refs/heads/") and line.endswith("\tHEAD"):
+                    self.branch = line[len("ref: refs/heads/"):-len("\tHEAD")]
+            if self.branch is None:
+                self.branch = self.repo.head.ref.name if self.repo is not None else "main"
+        return self.branch
+
+    def open(self):
+        """Clones the repository, or updates the existing clone. Needed before adding attachments.
+        """
+        remote_url = self.get_remote_url()
+        if os.path.isdir(os.path.join(self.path, ".git")):
+            self.repo = git.Repo(self.path)
+            self.repo.remote("origin").set_url(remote_url)
+            if self.repo.head.is_valid():
+                self.repo.git.pull("origin", self.get_branch())
+        else:
+            os.makedirs(self.path, exist_ok=True)
+            # Cloning an empty repository works, but has no branch yet
+            self.repo = git.Repo.clone_from(remote_url, self.path)
+        if not self.repo.head.is_valid() or self.repo.active_branch.name != self.get_branch():
+            self.repo.git.checkout("-B", self.get_branch())
+        return self
+
+    def get_relative_path(self, content_hash, name):
+        return "{}/{}/{}".format(content_hash[:2], content_hash, name)
+
+    def get_url(self, name, content):
+        """Returns the URL of an attachment (bytes) once it has been pushed.
+        """
+        relative_path = self.get_relative_path(hash_attachment_content(content), name)
+        return "https://raw.githubusercontent.com/{}/{}/{}".format(self.repository, self.get_branch(), quote(relative_path))
+
+    def add(self, name, content):
+        """Writes an attachment (bytes) to the working tree and returns the URL it will have once pushed.
+        The file may already exist, e.g. if a previous run has been interrupted before pushing it, so it is committed
+        unless git already has it.
+        """
+        relative_path = self.get_relative_path(hash_attachment_content(content), name)
+        file_path = os.path.join(self.path, relative_path)
+        if not os.path.isfile(file_path):
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "wb") as file:
+                file.write(content)
+        self.added_paths.add(relative_path)
+        return self.get_url(name, content)
+
+    def commit_and_push(self, message):
+        """Commits all added attachments at once and pushes them with a single push, together with the commits of
+        an interrupted run.
+        """
+        if not self.added_paths:
+            print("No new attachments to push to '{}'.".format(self.repository))
+            return
+        self.repo.index.add(sorted(self.added_paths))
+        self.added_paths = set()
+        if self.repo.is_dirty(index=True, working_tree=False, untracked_files=False):
+            self.repo.index.commit(message)
+        branch = self.get_branch()
+        unpushed = self.repo.git.rev_list("--count", "HEAD", "--not", "--remotes=origin")
+        if unpushed == "0":
+            print("No new attachments to push to '{}'.".format(self.repository))
+            return
+        print("Pushing {} new commits of attachments to '{}'...".format(unpushed, self.repository))
+        self.repo.git.push("origin", "HEAD:{}".format(branch))
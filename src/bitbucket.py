@@ -1,8 +1,16 @@
-from requests import Session
-from requests.adapters import HTTPAdapter
+import config
+from urllib.parse import quote
 from requests.packages.urllib3.util.retry import Retry
 
-from .utils import get_request_content, get_request_json
+from .http_metrics import RequestMetrics
+from .progress import ProgressReporter
+from .ratelimit import RequestScheduler, ScheduledSession
+from .utils import get_request_bytes, get_request_content, get_request_json, mount_retry_adapter
+
+
+def get_updated_since_query(updated_since):
+    # Bitbucket's filter language compares datetimes in ISO 8601 format
+    return quote("updated_on > {}".format(updated_since))
 
 
 def get_paginated_json(url, session=None):
@@ -16,11 +24,19 @@ def get_paginated_json(url, session=None):
 
 
 class BitbucketExport:
-    def __init__(self, repository_name, username=None, app_password=None):
+    def __init__(self, repository_name, username=None, app_password=None, api_url=None):
         self.repository_name = repository_name
-        self.repo_url = "https://api.bitbucket.org/2.0/repositories/" + repository_name
-        # Share TCP connection and add a delay between failing requests
-        session = Session()
+        # A different API URL is only used to run against a local stand-in of Bitbucket
+        self.api_url = (api_url or config.BITBUCKET_API_URL).rstrip("/")
+        self.repo_url = self.api_url + "/repositories/" + repository_name
+        # Share TCP connection, pace requests according to Bitbucket's rate limit
+        # and add a delay between failing requests
+        self.scheduler = RequestScheduler(
+            "bitbucket",
+            requests_per_hour=config.BITBUCKET_REQUESTS_PER_HOUR,
+            max_concurrency=config.BITBUCKET_MAX_CONCURRENCY
+        )
+        session = ScheduledSession(self.scheduler)
         if username is not None and app_password is not None:
             session.auth = (username, app_password)
         retry = Retry(
@@ -28,19 +44,30 @@ class BitbucketExport:
             connect=10,
             read=10,
             backoff_factor=0.3,
-            status_forcelist=(500, 502, 503, 504)
+            status_forcelist=(500, 502, 503, 504),
+            # 429 responses and their Retry-After header are handled by the scheduler
+            respect_retry_after_header=False
         )
-        adapter = HTTPAdapter(max_retries=retry)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
+        mount_retry_adapter(session, retry, pool_maxsize=config.BITBUCKET_MAX_CONCURRENCY)
+        # Method, endpoint, status, size, latency and retries of every request
+        self.metrics = RequestMetrics("bitbucket", self.api_url)
+        session.add_request_hook(self.metrics.record_request)
         self.session = session
 
     def get_repo_full_name(self):
         return self.repository_name
 
-    def get_issues(self):
-        print("Get all bitbucket issues...")
-        issues = list(get_paginated_json(self.repo_url + "/issues", self.session))
+    def get_rate_limit_metrics(self):
+        return self.scheduler.get_metrics()
+
+    def get_issues(self, updated_since=None):
+        url = self.repo_url + "/issues"
+        if updated_since is None:
+            print("Get all bitbucket issues...")
+        else:
+            print("Get bitbucket issues updated since {}...".format(updated_since))
+            url += "?q=" + get_updated_since_query(updated_since)
+        issues = list(get_paginated_json(url, self.session))
         issues.sort(key=lambda x: x["id"])
         return issues
 
@@ -62,9 +89,19 @@ class BitbucketExport:
         data = get_request_content(self.repo_url + "/issues/" + str(issue_id) + "/attachments/" + attachment_name, self.session)
         return data
 
-    def get_simplified_pulls(self):
-        print("Get all simplified bitbucket pull requests...")
-        pulls = list(get_paginated_json(self.repo_url + "/pullrequests?state=MERGED&state=SUPERSEDED&state=OPEN&state=DECLINED", self.session))
+    def get_issue_attachment_bytes(self, issue_id, attachment_name):
+        # Binary attachments would be corrupted by decoding them as text
+        data = get_request_bytes(self.repo_url + "/issues/" + str(issue_id) + "/attachments/" + attachment_name, self.session)
+        return data
+
+    def get_simplified_pulls(self, updated_since=None):
+        url = self.repo_url + "/pullrequests?state=MERGED&state=SUPERSEDED&state=OPEN&state=DECLINED"
+        if updated_since is None:
+            print("Get all simplified bitbucket pull requests...")
+        else:
+            print("Get simplified bitbucket pull requests updated since {}...".format(updated_since))
+            url += "&q=" + get_updated_since_query(updated_since)
+        pulls = list(get_paginated_json(url, self.session))
         pulls.sort(key=lambda x: x["id"])
         return pulls
 
@@ -76,15 +113,15 @@ class BitbucketExport:
         pull = get_request_json(self.repo_url + "/pullrequests/" + str(pull_id), self.session)
         return pull
 
-    def get_pulls(self):
+    def get_pulls(self, updated_since=None):
+        if updated_since is not None:
+            pull_ids = [pull["id"] for pull in self.get_simplified_pulls(updated_since)]
+            print("Get {} detailed bitbucket pull requests...".format(len(pull_ids)))
+            return [self.get_pull(pull_id) for pull_id in pull_ids]
         pulls_count = self.get_pulls_count()
         print("Get all {} detailed bitbucket pull requests...".format(pulls_count))
-        pulls = []
-        for pull_id in range(1, pulls_count + 1):
-            if pull_id % 10 == 0:
-                print("{}/{}...".format(pull_id, pulls_count))
-            pulls.append(self.get_pull(pull_id))
-        return pulls
+        with ProgressReporter("pull requests", pulls_count, self.scheduler) as progress:
+            return [self.get_pull(pull_id) for pull_id in progress.iterate(range(1, pulls_count + 1))]
 
     def get_pull_comments(self, pulls_id):
         comments = list(get_paginated_json(self.repo_url + "/pullrequests/" + str(pulls_id) + "/comments", self.session))
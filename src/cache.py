@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+
+
+class ConditionalRequestCache:
+    """Persistent cache of GET responses, used to send conditional requests (`If-None-Match` and
+    `If-Modified-Since`). A `304 Not Modified` response is replaced by the cached response.
+    Entries are keyed by URL, `Accept` header and a hash of the `Authorization` header, because the responses of
+    GitHub vary on those.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, url TEXT, etag TEXT, last_modified TEXT, headers TEXT, content BLOB)"
+        )
+        self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get_key(self, url, headers):
+        headers = CaseInsensitiveDict(headers or {})
+        authorization = hashlib.sha1(headers.get("Authorization", "").encode("utf-8")).hexdigest()
+        return "{} {} {}".format(url, headers.get("Accept", ""), authorization)
+
+    def get_conditional_headers(self, url, headers):
+        """Returns the headers of a GET request to `url`, extended with the validators of the cached response.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT etag, last_modified FROM responses WHERE key = ?",
+                (self.get_key(url, headers),)
+            ).fetchone()
+        conditional_headers = dict(headers or {})
+        if row is not None:
+            etag, last_modified = row
+            if etag:
+                conditional_headers["If-None-Match"] = etag
+            if last_modified:
+                conditional_headers["If-Modified-Since"] = last_modified
+        return conditional_headers
+
+    def store(self, url, headers, response):
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if response.status_code != 200 or (etag is None and last_modified is None):
+            return
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    self.get_key(url, headers),
+                    url,
+                    etag,
+                    last_modified,
+                    json.dumps(dict(response.headers)),
+                    response.content
+                )
+            )
+            self.connection.commit()
+
+    def load(self, url, headers, not_modified_response):
+        """Builds the response to return instead of `not_modified_response` (a 304) from the cache.
+        The rate limit headers of the 304 response are kept because they are more recent.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT headers, content FROM responses WHERE key = ?",
+                (self.get_key(url, headers),)
+            ).fetchone()
+        if row is None:
+            return None
+        cached_headers, content = row
+        response = Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.url = not_modified_response.url
+        response.request = not_modified_response.request
+        response.connection = not_modified_response.connection
+        response.elapsed = not_modified_response.elapsed
+        response.headers = CaseInsensitiveDict(json.loads(cached_headers))
+        for name, value in not_modified_response.headers.items():
+            if name.lower().startswith("x-ratelimit-"):
+                response.headers[name] = value
+        response._content = content
+        response.encoding = not_modified_response.encoding
+        return response
+
+    def send(self, send_request, url, headers):
+        """Sends a GET request with `send_request(headers)`, using the cache for conditional requests.
+        """
+        response = send_request(self.get_conditional_headers(url, headers))
+        if response.status_code == 304:
+            cached_response = self.load(url, headers, response)
+            if cached_response is not None:
+                self.hits += 1
+                return cached_response
+            # The entry disappeared: fetch the full response again
+            response = send_request(dict(headers or {}))
+        self.misses += 1
+        self.store(url, headers, response)
+        return response
+
+    def format_stats(self):
+        total = self.hits + self.misses
+        return "{} of {} GET requests served from the cache ({}%)".format(
+            self.hits,
+            total,
+            round(100 * self.hits / total) if total else 0
+        )
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,480 @@
+import json
+import random
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode
+
+from .fake_server import FakeApi, FakeApiError, FakeRequest, paginate
+
+
+ISSUE_STATES = ["new", "open", "resolved", "on hold", "invalid", "duplicate", "wontfix", "closed"]
+ISSUE_KINDS = ["bug", "enhancement", "proposal", "task"]
+ISSUE_PRIORITIES = ["trivial", "minor", "major", "critical", "blocker"]
+PULL_STATES = ["MERGED", "DECLINED", "SUPERSEDED", "OPEN"]
+# The generated links point to Bitbucket, the server rewrites them to itself
+BITBUCKET_API_URL = "https://api.bitbucket.org/2.0"
+WORDS = (
+    "the verifier fails on this program with a timeout because the quantifier triggers are not instantiated "
+    "please check the encoding of predicates and magic wands in the new backend before the release"
+).split()
+
+
+def format_bitbucket_time(date):
+    return date.strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+
+
+class SyntheticRepositoryGenerator:
+    """Generates synthetic Bitbucket repositories with the shape of the data returned by Bitbucket's API: issues
+    with comments, changes and attachments, pull requests with comments (some inline or replies), activity and
+    sources in forks. The numbers of comments, changes and activities are drawn from exponential distributions with
+    the given means. The same seed generates the same repositories.
+    """
+
+    def __init__(self, seed=0, users=None, comments_mean=3.0, changes_mean=1.0, activity_mean=2.0,
+                 inline_ratio=0.3, reply_ratio=0.1, attachment_ratio=0.1, deleted_ratio=0.02, fork_ratio=0.3,
+                 deleted_fork_ratio=0.1, body_words_mean=60):
+        self.random = random.Random(seed)
+        self.users = users or ["user{}".format(i) for i in range(20)]
+        self.comments_mean = comments_mean
+        self.changes_mean = changes_mean
+        self.activity_mean = activity_mean
+        self.inline_ratio = inline_ratio
+        self.reply_ratio = reply_ratio
+        self.attachment_ratio = attachment_ratio
+        self.deleted_ratio = deleted_ratio
+        self.fork_ratio = fork_ratio
+        self.deleted_fork_ratio = deleted_fork_ratio
+        self.body_words_mean = body_words_mean
+        self.date = datetime(2015, 1, 1, tzinfo=timezone.utc)
+        self.next_id = 1000
+
+    def create_id(self):
+        self.next_id += 1
+        return self.next_id
+
+    def count(self, mean):
+        if mean <= 0:
+            return 0
+        return int(self.random.expovariate(1 / mean))
+
+    def advance(self):
+        self.date += timedelta(minutes=self.random.randint(1, 600), microseconds=self.random.randint(0, 999999))
+        return format_bitbucket_time(self.date)
+
+    def user(self, nullable=True):
+        if nullable and self.random.random() < 0.05:
+            return None
+        nickname = self.random.choice(self.users)
+        return {
+            "nickname": nickname,
+            "display_name": nickname.capitalize(),
+            "account_id": "557058:{}".format(nickname),
+            "uuid": "{{{}}}".format(nickname),
+            "type": "user",
+        }
+
+    def commit_hash(self):
+        return "{:040x}".format(self.random.getrandbits(160))
+
+    def text(self, issues_count=1, pulls_count=1, commits=()):
+        words = [self.random.choice(WORDS) for _ in range(max(1, self.count(self.body_words_mean)))]
+        # References that the migration rewrites
+        if self.random.random() < 0.3:
+            words.append("#{}".format(self.random.randint(1, max(1, issues_count))))
+        if self.random.random() < 0.2:
+            words.append("pull request #{}".format(self.random.randint(1, max(1, pulls_count))))
+        if self.random.random() < 0.2:
+            words.append("@" + self.random.choice(self.users))
+        if commits and self.random.random() < 0.2:
+            words.append(self.random.choice(commits)[:12])
+        return " ".join(words)
+
+    def comment(self, comments, url, inline=False, **text_args):
+        created_on = self.advance()
+        comment = {
+            "id": self.create_id(),
+            "created_on": created_on,
+            "updated_on": created_on,
+            "user": self.user(),
+            "content": {"raw": self.text(**text_args), "markup": "markdown"},
+            "deleted": self.random.random() < 0.02,
+        }
+        comment["links"] = {"self": {"href": "{}/{}".format(url, comment["id"])}}
+        if comments and self.random.random() < self.reply_ratio:
+            comment["parent"] = {"id": self.random.choice(comments)["id"]}
+        if inline:
+            start = self.random.randint(1, 500)
+            comment["inline"] = {
+                "path": "src/main/scala/{}.scala".format(self.random.choice(WORDS).capitalize()),
+                "from": self.random.choice([None, start]),
+                "to": self.random.choice([None, start, start + self.random.randint(1, 10)]),
+                "outdated": self.random.random() < 0.3,
+            }
+        return comment
+
+    def generate(self, full_name, issues_count, pulls_count, forks_count=2):
+        """Returns a map from repository name to repository, containing the repository and its forks.
+        """
+        owner, name = full_name.split("/")
+        forks = ["{}-fork{}/{}".format(owner, i, name) for i in range(forks_count)]
+        repositories = {fork_name: {"commits": set()} for fork_name in forks}
+        repository = {
+            "commits": set(),
+            "issues": [],
+            "issue_comments": {},
+            "issue_changes": {},
+            "issue_attachments": {},
+            "pulls": [],
+            "pull_comments": {},
+            "pull_activity": {},
+        }
+        repositories[full_name] = repository
+        api_url = BITBUCKET_API_URL + "/repositories/" + full_name
+        # The commits that issues and comments refer to
+        history = [self.commit_hash() for _ in range(max(1, (issues_count + pulls_count) // 5))]
+        repository["commits"].update(history)
+        text_args = {"issues_count": issues_count, "pulls_count": pulls_count, "commits": history}
+
+        for issue_id in range(1, issues_count + 1):
+            created_on = self.advance()
+            if self.random.random() < self.deleted_ratio and issue_id != issues_count:
+                continue
+            issue = {
+                "id": issue_id,
+                "type": "issue",
+                "title": "Issue {}: {}".format(issue_id, " ".join(self.random.choice(WORDS) for _ in range(5))),
+                "content": {"raw": self.text(**text_args), "markup": "markdown"},
+                "reporter": self.user(),
+                "assignee": self.user() if self.random.random() < 0.5 else None,
+                "state": self.random.choice(ISSUE_STATES),
+                "kind": self.random.choice(ISSUE_KINDS),
+                "priority": self.random.choice(ISSUE_PRIORITIES),
+                "component": None,
+                "votes": 0,
+                "created_on": created_on,
+            }
+            comments = []
+            for _ in range(self.count(self.comments_mean)):
+                comments.append(self.comment(comments, "{}/issues/{}/comments".format(api_url, issue_id), **text_args))
+            changes = []
+            for _ in range(self.count(self.changes_mean)):
+                old_state, new_state = self.random.sample(ISSUE_STATES, 2)
+                changes.append({
+                    "id": self.create_id(),
+                    "created_on": self.advance(),
+                    "user": self.user(),
+                    "changes": {"state": {"old": old_state, "new": new_state}},
+                })
+            attachments = {}
+            if self.random.random() < self.attachment_ratio:
+                for index in range(self.random.randint(1, 3)):
+                    attachment_name = "file{}.{}".format(index, self.random.choice(["txt", "vpr", "log"]))
+                    attachments[attachment_name] = self.text(**text_args)
+            issue["updated_on"] = self.advance() if comments or changes else created_on
+            repository["issues"].append(issue)
+            repository["issue_comments"][issue_id] = comments
+            repository["issue_changes"][issue_id] = changes
+            repository["issue_attachments"][issue_id] = attachments
+
+        for pull_id in range(1, pulls_count + 1):
+            created_on = self.advance()
+            state = self.random.choice(PULL_STATES)
+            destination_hash = self.commit_hash()
+            repository["commits"].add(destination_hash)
+            source_hash = self.commit_hash()
+            source_name = full_name
+            if forks and self.random.random() < self.fork_ratio:
+                source_name = self.random.choice(forks)
+            source = {"branch": {"name": "feature-{}".format(pull_id)}}
+            if source_name != full_name and self.random.random() < self.deleted_fork_ratio:
+                # The fork has been deleted
+                source.update({"repository": None, "commit": None})
+            else:
+                repositories[source_name]["commits"].add(source_hash)
+                source.update({
+                    "repository": {"full_name": source_name, "type": "repository"},
+                    "commit": {
+                        "hash": source_hash[:12],
+                        "links": {"self": {"href": "{}/repositories/{}/commit/{}".format(BITBUCKET_API_URL, source_name, source_hash[:12])}},
+                    },
+                })
+            reviewers = [x for x in [self.user(nullable=False) for _ in range(self.random.randint(0, 2))]]
+            author = self.user()
+            participants = [
+                {"user": reviewer, "role": "REVIEWER", "approved": self.random.random() < 0.5}
+                for reviewer in reviewers
+            ]
+            if author is not None:
+                participants.append({"user": author, "role": "PARTICIPANT", "approved": False})
+            pull = {
+                "id": pull_id,
+                "type": "pullrequest",
+                "title": "Pull request {}: {}".format(pull_id, " ".join(self.random.choice(WORDS) for _ in range(5))),
+                "description": self.text(**text_args),
+                "state": state,
+                "author": author,
+                "reviewers": reviewers,
+                "participants": participants,
+                "source": source,
+                "destination": {
+                    "repository": {"full_name": full_name, "type": "repository"},
+                    "branch": {"name": "default"},
+                    "commit": {"hash": destination_hash[:12]},
+                },
+                "merge_commit": {"hash": self.commit_hash()[:12]} if state == "MERGED" else None,
+                "created_on": created_on,
+            }
+            comments = []
+            for _ in range(self.count(self.comments_mean)):
+                comments.append(self.comment(
+                    comments,
+                    "{}/pullrequests/{}/comments".format(api_url, pull_id),
+                    inline=self.random.random() < self.inline_ratio,
+                    **text_args
+                ))
+            activity = []
+            for _ in range(self.count(self.activity_mean)):
+                date = self.advance()
+                if self.random.random() < 0.5:
+                    activity.append({"approval": {"date": date, "user": self.user(nullable=False)}})
+                else:
+                    activity.append({"update": {"date": date, "state": state, "author": self.user()}})
+            pull["updated_on"] = self.advance() if comments or activity else created_on
+            repository["pulls"].append(pull)
+            repository["pull_comments"][pull_id] = comments
+            repository["pull_activity"][pull_id] = activity
+        return repositories
+
+    def update(self, repositories, full_name, ratio):
+        """Adds a comment to a fraction of the issues and pull requests of a generated repository, as if they had
+        been discussed on bitbucket after a migration. Returns the number of updated issues and pull requests.
+        """
+        repository = repositories[full_name]
+        api_url = BITBUCKET_API_URL + "/repositories/" + full_name
+        text_args = {
+            "issues_count": len(repository["issues"]),
+            "pulls_count": len(repository["pulls"]),
+            "commits": sorted(repository["commits"]),
+        }
+        updated_count = 0
+        for kind, items, comments_key in [
+            ("issues", repository["issues"], "issue_comments"),
+            ("pullrequests", repository["pulls"], "pull_comments"),
+        ]:
+            for item in items:
+                if self.random.random() >= ratio:
+                    continue
+                now = format_bitbucket_time(datetime.now(timezone.utc))
+                comments = repository[comments_key][item["id"]]
+                comment = self.comment(comments, "{}/{}/{}/comments".format(api_url, kind, item["id"]), **text_args)
+                comment.update({"created_on": now, "updated_on": now, "deleted": False})
+                comments.append(comment)
+                item["updated_on"] = now
+                updated_count += 1
+        return updated_count
+
+
+def save_repositories(repositories, path):
+    with open(path, "w") as file:
+        json.dump(repositories, file, default=sorted)
+
+
+def load_repositories(path):
+    with open(path, "r") as file:
+        repositories = json.load(file)
+    for repository in repositories.values():
+        repository["commits"] = set(repository["commits"])
+        for key in ("issue_comments", "issue_changes", "issue_attachments", "pull_comments", "pull_activity"):
+            if key in repository:
+                repository[key] = {int(x): value for x, value in repository[key].items()}
+    return repositories
+
+
+REPO = r"/2\.0/repositories/([^/]+/[^/]+)"
+UPDATED_SINCE_RE = re.compile(r'^\s*updated_on\s*>\s*"?([^"]+)"?\s*$')
+
+
+def bitbucket_route(method, path, handler_name, template):
+    return method, re.compile(path.replace("{repo}", REPO)), handler_name, "{} {}".format(method, template)
+
+
+class FakeBitbucket(FakeApi):
+    """In-memory stand-in for the endpoints of the Bitbucket API used by `BitbucketExport` and `import-forks.py`,
+    serving repositories of `SyntheticRepositoryGenerator`.
+    Lists are paginated like Bitbucket (`pagelen`, `page`, `size` and `next`) and support the `updated_on > ...`
+    query. A fraction of the requests fails with 429 (`fault_rate_429`) or with 500, 502 or 503 (`fault_rate_5xx`).
+    Every request is delayed by `latency` seconds.
+    """
+    routes = [
+        bitbucket_route("GET", r"{repo}/issues", "list_issues", "/repositories/:repo/issues"),
+        bitbucket_route("GET", r"{repo}/issues/(\d+)/comments", "list_issue_comments", "/repositories/:repo/issues/:id/comments"),
+        bitbucket_route("GET", r"{repo}/issues/(\d+)/changes", "list_issue_changes", "/repositories/:repo/issues/:id/changes"),
+        bitbucket_route("GET", r"{repo}/issues/(\d+)/attachments", "list_issue_attachments", "/repositories/:repo/issues/:id/attachments"),
+        bitbucket_route("GET", r"{repo}/issues/(\d+)/attachments/([^/]+)", "get_issue_attachment", "/repositories/:repo/issues/:id/attachments/:name"),
+        bitbucket_route("GET", r"{repo}/pullrequests", "list_pulls", "/repositories/:repo/pullrequests"),
+        bitbucket_route("GET", r"{repo}/pullrequests/(\d+)", "get_pull", "/repositories/:repo/pullrequests/:id"),
+        bitbucket_route("GET", r"{repo}/pullrequests/(\d+)/comments", "list_pull_comments", "/repositories/:repo/pullrequests/:id/comments"),
+        bitbucket_route("GET", r"{repo}/pullrequests/(\d+)/comments/(\d+)", "get_pull_comment", "/repositories/:repo/pullrequests/:id/comments/:comment_id"),
+        bitbucket_route("GET", r"{repo}/pullrequests/(\d+)/activity", "list_pull_activity", "/repositories/:repo/pullrequests/:id/activity"),
+        bitbucket_route("GET", r"{repo}/commit/(\w+)", "get_commit", "/repositories/:repo/commit/:hash"),
+        bitbucket_route("HEAD", r"{repo}/commit/(\w+)", "get_commit", "/repositories/:repo/commit/:hash"),
+    ]
+
+    def __init__(self, repositories, latency=0.0, requests_per_hour=1000, fault_rate_429=0.0, fault_rate_5xx=0.0,
+                 seed=0):
+        super().__init__()
+        self.repositories = repositories
+        self.latency = latency
+        self.requests_per_hour = requests_per_hour
+        self.fault_rate_429 = fault_rate_429
+        self.fault_rate_5xx = fault_rate_5xx
+        self.random = random.Random(seed)
+        self.remaining = requests_per_hour
+        self.reset_at = None
+        self.faults_count = 0
+
+    def get_repository(self, full_name, key=None):
+        repository = self.repositories.get(full_name)
+        if repository is None or (key is not None and key not in repository):
+            raise FakeApiError(404, "Repository {} not found".format(full_name))
+        return repository
+
+    def get_rate_limit_headers(self):
+        return {
+            "X-RateLimit-Limit": str(self.requests_per_hour),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(int(self.reset_at)),
+            "X-RateLimit-Resource": "api",
+            "X-RateLimit-NearLimit": "true" if self.remaining < self.requests_per_hour * 0.2 else "false",
+        }
+
+    def check_rate_limit(self):
+        now = time.time()
+        if self.reset_at is None or now >= self.reset_at:
+            self.remaining = self.requests_per_hour
+            self.reset_at = now + 3600
+        if self.remaining <= 0:
+            raise FakeApiError(429, "Rate limit for this resource has been exceeded", {
+                "Retry-After": str(max(1, int(self.reset_at - now)))
+            })
+        self.remaining -= 1
+
+    def inject_fault(self):
+        value = self.random.random()
+        if value < self.fault_rate_429:
+            self.faults_count += 1
+            raise FakeApiError(429, "Rate limit for this resource has been exceeded", {"Retry-After": "1"})
+        if value < self.fault_rate_429 + self.fault_rate_5xx:
+            self.faults_count += 1
+            raise FakeApiError(self.random.choice([500, 502, 503]), "Something went wrong")
+
+    def handle(self, method, path, headers, body):
+        request = FakeRequest(method, path, headers, body)
+        if self.latency > 0:
+            time.sleep(self.latency)
+        response_headers = {"Content-Type": "application/json; charset=utf-8"}
+        try:
+            handler, groups, template = self.route(request)
+            self.count_request(template)
+            with self.lock:
+                self.check_rate_limit()
+                response_headers.update(self.get_rate_limit_headers())
+                self.inject_fault()
+                status, extra_headers, value = handler(request, *groups)
+            response_headers.update(extra_headers)
+        except FakeApiError as e:
+            status = e.status
+            response_headers.update(e.headers)
+            value = {"type": "error", "error": {"message": e.message}}
+        if isinstance(value, bytes):
+            return status, response_headers, value
+        content = json.dumps(value).replace(BITBUCKET_API_URL, self.base_url + "/2.0")
+        return status, response_headers, content.encode("utf-8")
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats["faults"] = self.faults_count
+        return stats
+
+    def paginated(self, request, values, default_pagelen=10, max_pagelen=100):
+        pagelen = min(max_pagelen, request.get_int("pagelen", default_pagelen))
+        page = request.get_int("page", 1)
+        page_values, last_page = paginate(values, page, pagelen)
+        result = {"pagelen": pagelen, "size": len(values), "page": page, "values": page_values}
+        if page < last_page:
+            query = dict(request.query_lists, page=[str(page + 1)])
+            result["next"] = "{}{}?{}".format(self.base_url, request.path, urlencode(query, doseq=True))
+        return 200, {}, result
+
+    def filter_updated_since(self, request, values):
+        if "q" not in request.query:
+            return values
+        match = UPDATED_SINCE_RE.match(request.query["q"])
+        if match is None:
+            raise FakeApiError(400, "Unsupported query: {}".format(request.query["q"]))
+        updated_since = datetime.fromisoformat(match.group(1))
+        return [x for x in values if datetime.fromisoformat(x["updated_on"]) > updated_since]
+
+    def list_issues(self, request, full_name):
+        issues = self.filter_updated_since(request, self.get_repository(full_name, "issues")["issues"])
+        return self.paginated(request, issues, max_pagelen=50)
+
+    def get_existing(self, full_name, key, item_id):
+        values = self.get_repository(full_name, key)[key]
+        if int(item_id) not in values:
+            raise FakeApiError(404, "Not found")
+        return values[int(item_id)]
+
+    def list_issue_comments(self, request, full_name, issue_id):
+        return self.paginated(request, self.get_existing(full_name, "issue_comments", issue_id))
+
+    def list_issue_changes(self, request, full_name, issue_id):
+        return self.paginated(request, self.get_existing(full_name, "issue_changes", issue_id))
+
+    def list_issue_attachments(self, request, full_name, issue_id):
+        attachments = self.get_existing(full_name, "issue_attachments", issue_id)
+        values = [
+            {
+                "type": "issue_attachment",
+                "name": name,
+                "links": {"self": {"href": self.url("/2.0/repositories/{}/issues/{}/attachments/{}".format(full_name, issue_id, name))}},
+            }
+            for name in sorted(attachments)
+        ]
+        return self.paginated(request, values)
+
+    def get_issue_attachment(self, request, full_name, issue_id, name):
+        attachments = self.get_existing(full_name, "issue_attachments", issue_id)
+        if name not in attachments:
+            raise FakeApiError(404, "Not found")
+        return 200, {"Content-Type": "application/octet-stream"}, attachments[name].encode("utf-8")
+
+    def list_pulls(self, request, full_name):
+        states = request.query_lists.get("state", ["OPEN"])
+        pulls = [x for x in self.get_repository(full_name, "pulls")["pulls"] if x["state"] in states]
+        return self.paginated(request, self.filter_updated_since(request, pulls), max_pagelen=50)
+
+    def get_pull(self, request, full_name, pull_id):
+        pulls = self.get_repository(full_name, "pulls")["pulls"]
+        if not 1 <= int(pull_id) <= len(pulls):
+            raise FakeApiError(404, "Not found")
+        return 200, {}, pulls[int(pull_id) - 1]
+
+    def list_pull_comments(self, request, full_name, pull_id):
+        return self.paginated(request, self.get_existing(full_name, "pull_comments", pull_id))
+
+    def get_pull_comment(self, request, full_name, pull_id, comment_id):
+        for comment in self.get_existing(full_name, "pull_comments", pull_id):
+            if comment["id"] == int(comment_id):
+                return 200, {}, comment
+        raise FakeApiError(404, "Not found")
+
+    def list_pull_activity(self, request, full_name, pull_id):
+        return self.paginated(request, self.get_existing(full_name, "pull_activity", pull_id))
+
+    def get_commit(self, request, full_name, commit_hash):
+        commits = self.get_repository(full_name)["commits"]
+        if not any(x.startswith(commit_hash) for x in commits):
+            raise FakeApiError(404, "Commit not found")
+        return 200, {}, {"type": "commit", "hash": commit_hash}
@@ -0,0 +1,629 @@
+import hashlib
+import json
+import math
+import re
+import time
+from datetime import datetime, timezone
+
+from .fake_server import FakeApi, FakeApiError, FakeRequest, paginate
+
+
+def format_time(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def parse_time(value):
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp()
+
+
+WRITE_METHODS = ("POST", "PATCH", "PUT", "DELETE")
+
+
+def is_write(method, resource):
+    # GraphQL queries are sent with POST, but only read
+    return method in WRITE_METHODS and resource != "graphql"
+
+
+REPO = r"/repos/[^/]+/[^/]+"
+
+
+def github_route(method, path, handler_name, template):
+    return method, re.compile(path.replace("{repo}", REPO)), handler_name, "{} {}".format(method, template)
+
+
+class FakeGithub(FakeApi):
+    """In-memory stand-in for the endpoints of the GitHub API used by `GithubImport`: the repository, issues, pull
+    requests, comments, gists, the Issue Import API and the GraphQL queries of `github_state`.
+    Every response has rate limit headers. Imports stay pending for `import_delay` seconds and are processed in the
+    order of their submission. Writes closer than `min_write_interval` seconds are rejected like GitHub's secondary
+    rate limit. Every request is delayed by `latency` seconds, writes by `write_latency` more.
+    """
+    routes = [
+        github_route("GET", r"/user", "get_user", "/user"),
+        github_route("GET", r"/rate_limit", "get_rate_limit", "/rate_limit"),
+        github_route("POST", r"/graphql", "post_graphql", "/graphql"),
+        github_route("GET", r"/gists", "list_gists", "/gists"),
+        github_route("POST", r"/gists", "create_gist", "/gists"),
+        github_route("GET", r"/gists/(\w+)", "get_gist", "/gists/:id"),
+        github_route("PATCH", r"/gists/(\w+)", "edit_gist", "/gists/:id"),
+        github_route("GET", r"{repo}", "get_repo", "/repos/:repo"),
+        github_route("GET", r"{repo}/issues", "list_issues", "/repos/:repo/issues"),
+        github_route("POST", r"{repo}/issues", "create_issue", "/repos/:repo/issues"),
+        github_route("PATCH", r"{repo}/issues/comments/(\d+)", "edit_comment", "/repos/:repo/issues/comments/:id"),
+        github_route("DELETE", r"{repo}/issues/comments/(\d+)", "delete_comment", "/repos/:repo/issues/comments/:id"),
+        github_route("GET", r"{repo}/issues/(\d+)", "get_issue", "/repos/:repo/issues/:number"),
+        github_route("PATCH", r"{repo}/issues/(\d+)", "edit_issue", "/repos/:repo/issues/:number"),
+        github_route("GET", r"{repo}/issues/(\d+)/comments", "list_comments", "/repos/:repo/issues/:number/comments"),
+        github_route("POST", r"{repo}/issues/(\d+)/comments", "create_comment", "/repos/:repo/issues/:number/comments"),
+        github_route("PUT", r"{repo}/issues/(\d+)/labels", "set_labels", "/repos/:repo/issues/:number/labels"),
+        github_route("POST", r"{repo}/issues/(\d+)/assignees", "add_assignees", "/repos/:repo/issues/:number/assignees"),
+        github_route("DELETE", r"{repo}/issues/(\d+)/assignees", "remove_assignees", "/repos/:repo/issues/:number/assignees"),
+        github_route("GET", r"{repo}/pulls", "list_pulls", "/repos/:repo/pulls"),
+        github_route("POST", r"{repo}/pulls", "create_pull", "/repos/:repo/pulls"),
+        github_route("GET", r"{repo}/pulls/(\d+)", "get_pull", "/repos/:repo/pulls/:number"),
+        github_route("PATCH", r"{repo}/pulls/(\d+)", "edit_pull", "/repos/:repo/pulls/:number"),
+        github_route("POST", r"{repo}/pulls/(\d+)/requested_reviewers", "add_reviewers", "/repos/:repo/pulls/:number/requested_reviewers"),
+        github_route("DELETE", r"{repo}/pulls/(\d+)/requested_reviewers", "remove_reviewers", "/repos/:repo/pulls/:number/requested_reviewers"),
+        github_route("GET", r"{repo}/import/issues", "list_imports", "/repos/:repo/import/issues"),
+        github_route("POST", r"{repo}/import/issues", "create_import", "/repos/:repo/import/issues"),
+        github_route("GET", r"{repo}/import/issues/(\d+)", "get_import", "/repos/:repo/import/issues/:id"),
+    ]
+
+    def __init__(self, repository, user="migration-bot", latency=0.0, write_latency=0.0, requests_per_hour=5000,
+                 graphql_points_per_hour=5000, import_delay=1.0, min_write_interval=0.0):
+        super().__init__()
+        self.repository = repository
+        self.user = user
+        self.latency = latency
+        self.write_latency = write_latency
+        self.import_delay = import_delay
+        self.min_write_interval = min_write_interval
+        self.issues = {}
+        self.comments = {}
+        self.gists = {}
+        self.imports = []
+        self.next_id = 1
+        self.last_write_at = None
+        # resource -> [limit, remaining, reset time]
+        self.limits = {
+            "core": [requests_per_hour, requests_per_hour, None],
+            "graphql": [graphql_points_per_hour, graphql_points_per_hour, None],
+        }
+
+    def create_id(self):
+        self.next_id += 1
+        return self.next_id
+
+    # Rate limiting
+
+    def get_resource(self, request):
+        return "graphql" if request.path == "/graphql" else "core"
+
+    def get_rate_limit_headers(self, resource):
+        limit, remaining, reset_at = self.limits[resource]
+        return {
+            "X-RateLimit-Limit": str(limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(int(reset_at)),
+            "X-RateLimit-Used": str(limit - remaining),
+            "X-RateLimit-Resource": resource,
+        }
+
+    def refresh_rate_limit(self, resource):
+        # The window starts with the first request and lasts one hour
+        now = time.time()
+        limit = self.limits[resource]
+        if limit[2] is None or now >= limit[2]:
+            limit[1] = limit[0]
+            limit[2] = now + 3600
+
+    def check_rate_limit(self, request, resource):
+        now = time.time()
+        if self.limits[resource][1] <= 0:
+            raise FakeApiError(403, "API rate limit exceeded for user.")
+        if is_write(request.method, resource) and self.min_write_interval > 0:
+            if self.last_write_at is not None and now - self.last_write_at < self.min_write_interval:
+                retry_after = math.ceil(self.min_write_interval - (now - self.last_write_at))
+                raise FakeApiError(
+                    403,
+                    "You have exceeded a secondary rate limit. Please wait a few minutes before you try again.",
+                    {"Retry-After": str(retry_after)}
+                )
+            self.last_write_at = now
+
+    # HTTP
+
+    def handle(self, method, path, headers, body):
+        request = FakeRequest(method, path, headers, body)
+        resource = self.get_resource(request)
+        delay = self.latency + (self.write_latency if is_write(method, resource) else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+        response_headers = {"Content-Type": "application/json; charset=utf-8"}
+        try:
+            handler, groups, template = self.route(request)
+            self.count_request(template)
+            if not headers.get("Authorization"):
+                raise FakeApiError(401, "Requires authentication")
+            with self.lock:
+                self.refresh_rate_limit(resource)
+                self.check_rate_limit(request, resource)
+                self.process_imports()
+                if request.path.startswith("/repos/"):
+                    self.check_repo(request)
+                status, extra_headers, value = handler(request, *groups)
+            response_headers.update(extra_headers)
+        except FakeApiError as e:
+            status = e.status
+            response_headers.update(e.headers)
+            value = {"message": e.message, "documentation_url": "https://docs.github.com/rest"}
+        content = b"" if value is None else json.dumps(value).encode("utf-8")
+
+        if method == "GET" and status == 200:
+            etag = 'W/"{}"'.format(hashlib.sha1(content).hexdigest())
+            response_headers["ETag"] = etag
+            if headers.get("If-None-Match") == etag:
+                status = 304
+                content = b""
+
+        with self.lock:
+            self.refresh_rate_limit(resource)
+            # Conditional requests answered with 304 don't count against the rate limit
+            if status != 304 and not (status == 403 and self.limits[resource][1] <= 0):
+                self.limits[resource][1] = max(0, self.limits[resource][1] - 1)
+            response_headers.update(self.get_rate_limit_headers(resource))
+        return status, response_headers, content
+
+    def check_repo(self, request):
+        if not (request.path + "/").startswith("/repos/{}/".format(self.repository)):
+            raise FakeApiError(404, "Not Found")
+
+    def paginated(self, request, items, path):
+        per_page = min(100, request.get_int("per_page", 30))
+        page = request.get_int("page", 1)
+        values, last_page = paginate(items, page, per_page)
+        links = []
+        for rel, target in [("next", page + 1), ("last", last_page)]:
+            if target <= last_page and page < last_page:
+                links.append('<{}>; rel="{}"'.format(self.url(path, dict(request.query, page=target)), rel))
+        return 200, {"Link": ", ".join(links)} if links else {}, values
+
+    # JSON representations
+
+    def get_repo_url(self):
+        return self.url("/repos/" + self.repository)
+
+    def user_json(self, login):
+        return {
+            "login": login,
+            "id": int(hashlib.sha1(login.encode("utf-8")).hexdigest()[:8], 16),
+            "type": "User",
+            "url": self.url("/users/" + login),
+        }
+
+    def issue_json(self, issue):
+        url = "{}/issues/{}".format(self.get_repo_url(), issue["number"])
+        value = {
+            "id": issue["number"],
+            "number": issue["number"],
+            "url": url,
+            "html_url": "https://github.com/{}/issues/{}".format(self.repository, issue["number"]),
+            "comments_url": url + "/comments",
+            "title": issue["title"],
+            "body": issue["body"],
+            "state": issue["state"],
+            "user": self.user_json(self.user),
+            "labels": [{"name": label} for label in issue["labels"]],
+            "assignee": self.user_json(issue["assignees"][0]) if issue["assignees"] else None,
+            "assignees": [self.user_json(login) for login in issue["assignees"]],
+            "comments": len(issue["comment_ids"]),
+            "created_at": issue["created_at"],
+            "updated_at": issue["updated_at"],
+            "closed_at": issue["updated_at"] if issue["state"] == "closed" else None,
+        }
+        if issue["is_pull"]:
+            value["pull_request"] = {"url": "{}/pulls/{}".format(self.get_repo_url(), issue["number"])}
+        return value
+
+    def pull_json(self, issue):
+        value = self.issue_json(issue)
+        value.update({
+            "url": "{}/pulls/{}".format(self.get_repo_url(), issue["number"]),
+            "issue_url": "{}/issues/{}".format(self.get_repo_url(), issue["number"]),
+            "html_url": "https://github.com/{}/pull/{}".format(self.repository, issue["number"]),
+            "base": {"ref": issue["base"], "label": "{}:{}".format(self.repository.split("/")[0], issue["base"])},
+            "head": {"ref": issue["head"], "label": "{}:{}".format(self.repository.split("/")[0], issue["head"])},
+            "requested_reviewers": [self.user_json(login) for login in issue["reviewers"]],
+            "requested_teams": [],
+            "merged": False,
+        })
+        del value["pull_request"]
+        return value
+
+    def comment_json(self, comment):
+        return {
+            "id": comment["id"],
+            "url": "{}/issues/comments/{}".format(self.get_repo_url(), comment["id"]),
+            "issue_url": "{}/issues/{}".format(self.get_repo_url(), comment["number"]),
+            "body": comment["body"],
+            "user": self.user_json(self.user),
+            "created_at": comment["created_at"],
+            "updated_at": comment["updated_at"],
+        }
+
+    def gist_json(self, gist, with_content):
+        files = {}
+        for name, content in gist["files"].items():
+            files[name] = {
+                "filename": name,
+                "size": len(content.encode("utf-8")),
+                "raw_url": "https://gist.githubusercontent.com/{}/{}/raw/{}".format(self.user, gist["id"], name),
+                "truncated": False,
+            }
+            if with_content:
+                files[name]["content"] = content
+        return {
+            "id": gist["id"],
+            "url": self.url("/gists/" + gist["id"]),
+            "html_url": "https://gist.github.com/" + gist["id"],
+            "description": gist["description"],
+            "public": gist["public"],
+            "owner": self.user_json(self.user),
+            "files": files,
+            "created_at": gist["created_at"],
+            "updated_at": gist["updated_at"],
+        }
+
+    def import_json(self, issue_import):
+        value = {
+            "id": issue_import["id"],
+            "status": issue_import["status"],
+            "url": "{}/import/issues/{}".format(self.get_repo_url(), issue_import["id"]),
+            "import_issues_url": "{}/import/issues".format(self.get_repo_url()),
+            "repository_url": self.get_repo_url(),
+            "created_at": issue_import["created_at"],
+            "updated_at": issue_import["updated_at"],
+        }
+        if issue_import["number"] is not None:
+            value["issue_url"] = "{}/issues/{}".format(self.get_repo_url(), issue_import["number"])
+        if issue_import["errors"]:
+            value["errors"] = issue_import["errors"]
+        return value
+
+    # Model
+
+    def get_existing_issue(self, number, is_pull=None):
+        issue = self.issues.get(int(number))
+        if issue is None or (is_pull is not None and issue["is_pull"] != is_pull):
+            raise FakeApiError(404, "Not Found")
+        return issue
+
+    def add_issue(self, title, body, labels=(), assignees=(), state="open", created_at=None, is_pull=False,
+                  base=None, head=None):
+        now = format_time(time.time())
+        number = max(self.issues, default=0) + 1
+        self.issues[number] = {
+            "number": number,
+            "is_pull": is_pull,
+            "title": title,
+            "body": body or "",
+            "state": state,
+            "labels": sorted(set(labels)),
+            "assignees": list(assignees),
+            "reviewers": [],
+            "base": base,
+            "head": head,
+            "comment_ids": [],
+            "created_at": created_at or now,
+            "updated_at": now,
+        }
+        return self.issues[number]
+
+    def add_comment(self, issue, body, created_at=None):
+        now = format_time(time.time())
+        comment = {
+            "id": self.create_id(),
+            "number": issue["number"],
+            "body": body or "",
+            "created_at": created_at or now,
+            "updated_at": now,
+        }
+        self.comments[comment["id"]] = comment
+        issue["comment_ids"].append(comment["id"])
+        issue["updated_at"] = now
+        return comment
+
+    def touch(self, issue):
+        issue["updated_at"] = format_time(time.time())
+
+    def process_imports(self):
+        """Imports the pending issues that have been submitted at least `import_delay` seconds ago, in order.
+        """
+        now = time.time()
+        for issue_import in self.imports:
+            if issue_import["status"] != "pending":
+                continue
+            if issue_import["submitted_at"] + self.import_delay > now:
+                break
+            data = issue_import["data"]
+            meta = data.get("issue") or {}
+            if not meta.get("title"):
+                issue_import["status"] = "failed"
+                issue_import["errors"] = [{"location": "/issue/title", "code": "missing_field", "field": "title"}]
+            else:
+                issue = self.add_issue(
+                    meta["title"],
+                    meta.get("body"),
+                    labels=meta.get("labels") or [],
+                    assignees=[meta["assignee"]] if meta.get("assignee") else [],
+                    state="closed" if meta.get("closed") else "open",
+                    created_at=meta.get("created_at")
+                )
+                for comment in data.get("comments") or []:
+                    self.add_comment(issue, comment.get("body"), comment.get("created_at"))
+                issue_import["status"] = "imported"
+                issue_import["number"] = issue["number"]
+            issue_import["updated_at"] = format_time(now)
+
+    # Handlers
+
+    def get_user(self, request):
+        return 200, {}, self.user_json(self.user)
+
+    def get_rate_limit(self, request):
+        resources = {}
+        for resource, (limit, remaining, reset_at) in self.limits.items():
+            resources[resource] = {"limit": limit, "remaining": remaining, "reset": int(reset_at), "used": limit - remaining}
+        return 200, {}, {"resources": resources, "rate": resources["core"]}
+
+    def get_repo(self, request):
+        owner, name = self.repository.split("/")
+        return 200, {}, {
+            "id": 1,
+            "name": name,
+            "full_name": self.repository,
+            "owner": self.user_json(owner),
+            "url": self.get_repo_url(),
+            "html_url": "https://github.com/" + self.repository,
+            "private": True,
+            "has_issues": True,
+        }
+
+    def list_issues(self, request):
+        state = request.query.get("state", "open")
+        issues = [
+            self.issue_json(issue) for number, issue in sorted(self.issues.items(), reverse=True)
+            if state == "all" or issue["state"] == state
+        ]
+        return self.paginated(request, issues, request.path)
+
+    def create_issue(self, request):
+        data = request.json()
+        if not data.get("title"):
+            raise FakeApiError(422, "Validation Failed")
+        issue = self.add_issue(data["title"], data.get("body"), data.get("labels") or [], data.get("assignees") or [])
+        return 201, {}, self.issue_json(issue)
+
+    def get_issue(self, request, number):
+        return 200, {}, self.issue_json(self.get_existing_issue(number))
+
+    def edit_issue(self, request, number):
+        issue = self.get_existing_issue(number)
+        data = request.json()
+        for field in ("title", "body", "state"):
+            if field in data:
+                issue[field] = data[field]
+        if "labels" in data:
+            issue["labels"] = sorted(set(data["labels"]))
+        if "assignees" in data:
+            issue["assignees"] = list(data["assignees"])
+        self.touch(issue)
+        return 200, {}, self.issue_json(issue)
+
+    def list_comments(self, request, number):
+        issue = self.get_existing_issue(number)
+        comments = [self.comment_json(self.comments[x]) for x in issue["comment_ids"]]
+        return self.paginated(request, comments, request.path)
+
+    def create_comment(self, request, number):
+        issue = self.get_existing_issue(number)
+        comment = self.add_comment(issue, request.json().get("body"))
+        return 201, {}, self.comment_json(comment)
+
+    def edit_comment(self, request, comment_id):
+        comment = self.comments.get(int(comment_id))
+        if comment is None:
+            raise FakeApiError(404, "Not Found")
+        comment["body"] = request.json().get("body", comment["body"])
+        comment["updated_at"] = format_time(time.time())
+        return 200, {}, self.comment_json(comment)
+
+    def delete_comment(self, request, comment_id):
+        comment = self.comments.pop(int(comment_id), None)
+        if comment is None:
+            raise FakeApiError(404, "Not Found")
+        self.issues[comment["number"]]["comment_ids"].remove(comment["id"])
+        return 204, {}, None
+
+    def set_labels(self, request, number):
+        issue = self.get_existing_issue(number)
+        data = request.json()
+        labels = data.get("labels", []) if isinstance(data, dict) else data
+        issue["labels"] = sorted(set(x["name"] if isinstance(x, dict) else x for x in labels))
+        self.touch(issue)
+        return 200, {}, [{"name": label} for label in issue["labels"]]
+
+    def add_assignees(self, request, number):
+        issue = self.get_existing_issue(number)
+        for login in request.json().get("assignees", []):
+            if login not in issue["assignees"]:
+                issue["assignees"].append(login)
+        self.touch(issue)
+        return 201, {}, self.issue_json(issue)
+
+    def remove_assignees(self, request, number):
+        issue = self.get_existing_issue(number)
+        logins = request.json().get("assignees", [])
+        issue["assignees"] = [x for x in issue["assignees"] if x not in logins]
+        self.touch(issue)
+        return 200, {}, self.issue_json(issue)
+
+    def list_pulls(self, request):
+        state = request.query.get("state", "open")
+        pulls = [
+            self.pull_json(issue) for number, issue in sorted(self.issues.items(), reverse=True)
+            if issue["is_pull"] and (state == "all" or issue["state"] == state)
+        ]
+        return self.paginated(request, pulls, request.path)
+
+    def create_pull(self, request):
+        data = request.json()
+        if not data.get("title") or not data.get("base") or not data.get("head"):
+            raise FakeApiError(422, "Validation Failed")
+        issue = self.add_issue(data["title"], data.get("body"), is_pull=True, base=data["base"], head=data["head"])
+        return 201, {}, self.pull_json(issue)
+
+    def get_pull(self, request, number):
+        return 200, {}, self.pull_json(self.get_existing_issue(number, is_pull=True))
+
+    def edit_pull(self, request, number):
+        issue = self.get_existing_issue(number, is_pull=True)
+        data = request.json()
+        for field in ("title", "body", "state", "base"):
+            if field in data:
+                issue[field] = data[field]
+        self.touch(issue)
+        return 200, {}, self.pull_json(issue)
+
+    def add_reviewers(self, request, number):
+        issue = self.get_existing_issue(number, is_pull=True)
+        for login in request.json().get("reviewers", []):
+            if login not in issue["reviewers"]:
+                issue["reviewers"].append(login)
+        return 201, {}, self.pull_json(issue)
+
+    def remove_reviewers(self, request, number):
+        issue = self.get_existing_issue(number, is_pull=True)
+        logins = request.json().get("reviewers", [])
+        issue["reviewers"] = [x for x in issue["reviewers"] if x not in logins]
+        return 200, {}, self.pull_json(issue)
+
+    def list_imports(self, request):
+        since = parse_time(request.query["since"]) if "since" in request.query else 0
+        imports = [self.import_json(x) for x in self.imports if parse_time(x["created_at"]) >= since]
+        return 200, {}, imports
+
+    def create_import(self, request):
+        data = request.json()
+        now = time.time()
+        issue_import = {
+            "id": self.create_id(),
+            "status": "pending",
+            "data": data,
+            "number": None,
+            "errors": None,
+            "submitted_at": now,
+            "created_at": format_time(now),
+            "updated_at": format_time(now),
+        }
+        self.imports.append(issue_import)
+        return 202, {}, self.import_json(issue_import)
+
+    def get_import(self, request, import_id):
+        for issue_import in self.imports:
+            if issue_import["id"] == int(import_id):
+                return 200, {}, self.import_json(issue_import)
+        raise FakeApiError(404, "Not Found")
+
+    def list_gists(self, request):
+        gists = [self.gist_json(gist, with_content=False) for gist in reversed(list(self.gists.values()))]
+        return self.paginated(request, gists, request.path)
+
+    def create_gist(self, request):
+        data = request.json()
+        now = format_time(time.time())
+        gist = {
+            "id": "{:032x}".format(self.create_id()),
+            "description": data.get("description"),
+            "public": bool(data.get("public")),
+            "files": {name: file["content"] for name, file in data.get("files", {}).items()},
+            "created_at": now,
+            "updated_at": now,
+        }
+        self.gists[gist["id"]] = gist
+        return 201, {}, self.gist_json(gist, with_content=True)
+
+    def get_existing_gist(self, gist_id):
+        gist = self.gists.get(gist_id)
+        if gist is None:
+            raise FakeApiError(404, "Not Found")
+        return gist
+
+    def get_gist(self, request, gist_id):
+        return 200, {}, self.gist_json(self.get_existing_gist(gist_id), with_content=True)
+
+    def edit_gist(self, request, gist_id):
+        gist = self.get_existing_gist(gist_id)
+        data = request.json()
+        if "description" in data:
+            gist["description"] = data["description"]
+        for name, file in data.get("files", {}).items():
+            if file is None:
+                gist["files"].pop(name, None)
+            else:
+                gist["files"][file.get("filename", name)] = file.get("content", gist["files"].get(name, ""))
+        gist["updated_at"] = format_time(time.time())
+        return 200, {}, self.gist_json(gist, with_content=True)
+
+    # GraphQL (only the queries of `github_state`)
+
+    def graphql_comments(self, issue, first=100, cursor=None):
+        comment_ids = issue["comment_ids"]
+        start = int(cursor) if cursor else 0
+        nodes = [
+            {"databaseId": x, "body": self.comments[x]["body"]} for x in comment_ids[start:start + first]
+        ]
+        return {
+            "pageInfo": {"hasNextPage": start + first < len(comment_ids), "endCursor": str(start + len(nodes))},
+            "nodes": nodes,
+        }
+
+    def graphql_node(self, issue):
+        node = {
+            "number": issue["number"],
+            "state": issue["state"].upper(),
+            "title": issue["title"],
+            "body": issue["body"],
+            "labels": {"nodes": [{"name": label} for label in issue["labels"]]},
+            "assignees": {"nodes": [{"login": login} for login in issue["assignees"]]},
+            "comments": self.graphql_comments(issue),
+        }
+        if issue["is_pull"]:
+            node["baseRefName"] = issue["base"]
+            node["headRefName"] = issue["head"]
+            node["reviewRequests"] = {"nodes": [{"requestedReviewer": {"login": x}} for x in issue["reviewers"]]}
+        return node
+
+    def post_graphql(self, request):
+        data = request.json()
+        query = data.get("query", "")
+        variables = data.get("variables") or {}
+        if "{}/{}".format(variables.get("owner"), variables.get("name")) != self.repository:
+            return 200, {}, {"data": {"repository": None}, "errors": [{"type": "NOT_FOUND"}]}
+        cursor = variables.get("cursor")
+        if "issueOrPullRequest" in query:
+            issue = self.issues.get(variables.get("number"))
+            if issue is None:
+                return 200, {}, {"data": {"repository": {"issueOrPullRequest": None}}}
+            node = {"comments": self.graphql_comments(issue, cursor=cursor)}
+            return 200, {}, {"data": {"repository": {"issueOrPullRequest": node}}}
+        is_pull = "pullRequests(" in query
+        connection_name = "pullRequests" if is_pull else "issues"
+        issues = [issue for number, issue in sorted(self.issues.items()) if issue["is_pull"] == is_pull]
+        start = int(cursor) if cursor else 0
+        nodes = [self.graphql_node(issue) for issue in issues[start:start + 100]]
+        connection = {
+            "pageInfo": {"hasNextPage": start + 100 < len(issues), "endCursor": str(start + len(nodes))},
+            "nodes": nodes,
+        }
+        return 200, {}, {"data": {"repository": {connection_name: connection}}}
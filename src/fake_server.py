@@ -0,0 +1,151 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+
+# Path at which the servers report the number of requests per endpoint
+STATS_PATH = "/_fake/stats"
+
+
+class FakeApiError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+class FakeRequest:
+    def __init__(self, method, path, headers, body):
+        parsed = urlparse(path)
+        self.method = method
+        self.path = parsed.path
+        self.query = {name: values[-1] for name, values in parse_qs(parsed.query).items()}
+        self.query_lists = parse_qs(parsed.query)
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        if not self.body:
+            return {}
+        return json.loads(self.body.decode("utf-8"))
+
+    def get_int(self, name, default):
+        try:
+            return int(self.query.get(name, default))
+        except ValueError:
+            raise FakeApiError(400, "Invalid value of '{}'".format(name))
+
+
+class FakeApi:
+    """Base class of the local stand-ins of the Bitbucket and GitHub APIs.
+    `routes` is a list of (method, path regex, handler name, endpoint template); the handlers are called with the
+    request and the groups of the regex and return (status, headers, JSON value). The number of requests is counted
+    per endpoint template.
+    """
+    routes = []
+
+    def __init__(self):
+        self.base_url = None
+        self.lock = threading.Lock()
+        self.endpoint_counts = {}
+
+    def route(self, request):
+        for method, regex, handler_name, template in self.routes:
+            if method != request.method:
+                continue
+            match = regex.fullmatch(request.path)
+            if match is not None:
+                return getattr(self, handler_name), match.groups(), template
+        raise FakeApiError(404, "Not Found")
+
+    def count_request(self, template):
+        with self.lock:
+            self.endpoint_counts[template] = self.endpoint_counts.get(template, 0) + 1
+
+    def get_stats(self):
+        with self.lock:
+            return {"requests": sum(self.endpoint_counts.values()), "endpoints": dict(self.endpoint_counts)}
+
+    def handle(self, method, path, headers, body):
+        """Returns the (status, headers, content bytes) of a request.
+        """
+        raise NotImplementedError()
+
+    def url(self, path, query=None):
+        url = self.base_url + path
+        if query:
+            url += "?" + urlencode(query)
+        return url
+
+
+class FakeApiRequestHandler(BaseHTTPRequestHandler):
+    # Keep-alive connections, like the real APIs
+    protocol_version = "HTTP/1.1"
+    # Send the headers and the content of a response in one segment, otherwise Nagle's algorithm and delayed ACKs
+    # add about 40ms to every request on a kept-alive connection
+    wbufsize = -1
+
+    def handle_method(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if self.path == STATS_PATH:
+            status, headers = 200, {"Content-Type": "application/json"}
+            content = json.dumps(self.server.api.get_stats()).encode("utf-8")
+        else:
+            status, headers, content = self.server.api.handle(method, self.path, self.headers, body)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        if method != "HEAD":
+            self.wfile.write(content)
+
+    def do_GET(self):
+        self.handle_method("GET")
+
+    def do_HEAD(self):
+        self.handle_method("HEAD")
+
+    def do_POST(self):
+        self.handle_method("POST")
+
+    def do_PATCH(self):
+        self.handle_method("PATCH")
+
+    def do_PUT(self):
+        self.handle_method("PUT")
+
+    def do_DELETE(self):
+        self.handle_method("DELETE")
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def create_server(api, host="127.0.0.1", port=0, verbose=False):
+    """Creates an HTTP server for a `FakeApi`. Port 0 picks a free port. Sets the base URL of the API.
+    """
+    server = ThreadingHTTPServer((host, port), FakeApiRequestHandler)
+    server.daemon_threads = True
+    server.api = api
+    server.verbose = verbose
+    api.base_url = "http://{}:{}".format(host, server.server_address[1])
+    return server
+
+
+def start_server(api, host="127.0.0.1", port=0, verbose=False):
+    """Serves a `FakeApi` from a background thread. Returns the server; stop it with `shutdown()`.
+    """
+    server = create_server(api, host, port, verbose)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def paginate(items, page, per_page):
+    start = (page - 1) * per_page
+    return items[start:start + per_page], max(1, (len(items) + per_page - 1) // per_page)
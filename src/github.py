@@ -1,25 +1,125 @@
 from requests.packages.urllib3.util.retry import Retry
 from github import Github, enable_console_debug_logging
 from github.GithubException import UnknownObjectException
+from github.Requester import Requester, HTTPRequestsConnectionClass, HTTPSRequestsConnectionClass
 from time import sleep
-import requests
-from .utils import get_request_json
+from .ratelimit import GithubRequestScheduler, ScheduledSession
+from .cache import ConditionalRequestCache
+from .http_metrics import RequestMetrics
+from .github_state import hash_body, load_issue_states
+from .utils import get_request_json, mount_retry_adapter
 from copy import deepcopy
+import config
+import re
+
+
+IMPORTED_ISSUE_NUMBER_RE = re.compile(r'/issues/(\d+)$')
+
+
+def diff_comments(existing_hashes, comments_data):
+    """Returns the list of actions ("keep", "edit", "create" or "delete", index) needed to turn the existing
+    comments (the hashes of their bodies, see `hash_body`) into the rendered comments. Comments are matched by
+    position because GitHub orders comments by creation time.
+    """
+    actions = []
+    for index, comment_data in enumerate(comments_data):
+        if index >= len(existing_hashes):
+            actions.append(("create", index))
+        elif existing_hashes[index] != hash_body(comment_data["body"]):
+            actions.append(("edit", index))
+        else:
+            actions.append(("keep", index))
+    for index in range(len(comments_data), len(existing_hashes)):
+        actions.append(("delete", index))
+    return actions
+
+
+def get_issue_changes(fields, meta):
+    """Returns the body of the request that edits an issue, for the `fields` that differ from the rendered `meta`.
+    """
+    values = {
+        "title": meta["title"],
+        "body": meta["body"],
+        "labels": meta["labels"],
+        "state": "closed" if meta["closed"] else "open",
+        "assignees": [] if meta["assignee"] is None else [meta["assignee"]],
+    }
+    return {name: values[name] for name in fields if name in values}
+
+
+def get_pull_changes(fields, meta):
+    """Returns the body of the request that edits a pull request, for the `fields` that differ from the rendered
+    `meta`. Labels, assignees and reviewers are changed by separate requests.
+    """
+    values = {
+        "title": meta["title"],
+        "body": meta["body"],
+        "state": "closed" if meta["closed"] else "open",
+        "base": meta["base"],
+    }
+    return {name: values[name] for name in fields if name in values}
+
+
+def create_scheduled_connection_class(session, base=HTTPSRequestsConnectionClass):
+    """Returns a connection class for PyGithub's requester that sends all requests through `session`.
+    PyGithub creates a new connection for every request once connection classes are injected, so the session
+    (and thereby the scheduler and the pooled connections) is shared between them.
+    """
+    class ScheduledConnectionClass(base):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.session = session
+
+        def close(self):
+            # The shared session must stay open to keep its connections alive
+            pass
+    return ScheduledConnectionClass
 
 
 class GithubImport:
-    def __init__(self, access_token, repository, debug=False):
+    def __init__(self, access_token, repository, debug=False, api_url=None):
         if debug:
             enable_console_debug_logging()
         self.access_token = access_token
+        # A different API URL is only used to run against a local stand-in of GitHub
+        self.api_url = (api_url or config.GITHUB_API_URL).rstrip("/")
+        self.max_pending_imports = config.GITHUB_MAX_PENDING_IMPORTS
+        # Imports that have been submitted, but are not yet known to be done:
+        # import id -> (number, issue_data, import_data, on_imported)
+        self.pending_imports = {}
+        self.failed_imports = []
+        # Imports that have taken the number of a failed import submitted before them:
+        # (number, created number, issue_data, on_imported)
+        self.shifted_imports = []
+        self.gists_by_description = None
         retry = Retry(
             total=30,
             connect=5,
             read=5,
             backoff_factor=0.5,
-            status_forcelist=(500, 502, 503, 504)
+            status_forcelist=(500, 502, 503, 504),
+            # 429 responses and their Retry-After header are handled by the scheduler
+            respect_retry_after_header=False
+        )
+        # Every GitHub call (PyGithub, Issue Import API and GraphQL) is paced by the same scheduler
+        self.scheduler = GithubRequestScheduler(
+            requests_per_hour=config.GITHUB_REQUESTS_PER_HOUR,
+            max_concurrency=config.GITHUB_MAX_CONCURRENCY,
+            min_write_interval=config.GITHUB_MIN_WRITE_INTERVAL
+        )
+        # One keep-alive session with connection pooling and the retry policy for all raw and PyGithub calls
+        # GET requests are sent as conditional requests to save rate limit on re-runs
+        self.cache = ConditionalRequestCache(config.GITHUB_CACHE_PATH)
+        self.session = ScheduledSession(self.scheduler, timeout=30, cache=self.cache)
+        mount_retry_adapter(self.session, retry, pool_maxsize=config.GITHUB_MAX_CONCURRENCY)
+        # Method, endpoint, status, size, latency and retries of every request, including the ones of PyGithub
+        self.metrics = RequestMetrics("github", self.api_url)
+        self.session.add_request_hook(self.metrics.record_request)
+        Requester.injectConnectionClasses(
+            create_scheduled_connection_class(self.session, HTTPRequestsConnectionClass),
+            create_scheduled_connection_class(self.session)
         )
-        self.github = Github(access_token, timeout=30, retry=retry, per_page=300)
+        self.github = Github(access_token, base_url=self.api_url, timeout=30, retry=retry, per_page=100)
         try:
             self.repo = self.github.get_repo(repository)
         except UnknownObjectException:
@@ -29,7 +129,8 @@ class GithubImport:
         return self.repo.full_name
 
     def get_remaining_rate_limit(self):
-        return self.github.rate_limiting[0]
+        # Read from the headers of the last response, so this doesn't cost a request
+        return self.scheduler.get_remaining()
 
     def get_issues_count(self):
         return self.repo.get_issues(state="all").totalCount
@@ -45,13 +146,42 @@ class GithubImport:
         pulls = self.repo.get_pulls(state="all")
         return {x.number: x for x in pulls}
 
+    def get_issue(self, number):
+        return self.repo.get_issue(number)
+
+    def get_pull(self, number):
+        return self.repo.get_pull(number)
+
+    def get_issue_states(self):
+        """Returns a compact snapshot (map from number to `IssueState`) of all existing issues and pull requests.
+        """
+        return load_issue_states(self.access_token, self.get_repo_full_name(), self.session, self.api_url + "/graphql")
+
+    def get_gists_by_description(self):
+        # The gists are listed only once; the index is updated when gists are created
+        if self.gists_by_description is None:
+            print("Get all github gists...")
+            self.gists_by_description = {}
+            for gist in self.github.get_user().get_gists():
+                self.gists_by_description.setdefault(gist.description, gist)
+        return self.gists_by_description
+
     def get_gist_by_description(self, description):
-        return next(
-            (
-                x for x in self.github.get_user().get_gists()
-                if x.description == description
-            ),
-            None
+        return self.get_gists_by_description().get(description, None)
+
+    def gist_has_files(self, gist, contents):
+        """Checks whether the gist already contains the given files (a map from name to content).
+        """
+        if any(
+            name not in gist.files or gist.files[name].size != len(content.encode("utf-8"))
+            for name, content in contents.items()
+        ):
+            return False
+        # The list of gists does not include the content of the files
+        full_gist = self.github.get_gist(gist.id)
+        return all(
+            not full_gist.files[name].raw_data.get("truncated", False) and full_gist.files[name].content == content
+            for name, content in contents.items()
         )
 
     def get_or_create_gist_by_description(self, gist_data):
@@ -62,73 +192,210 @@ class GithubImport:
                 gist_data["files"],
                 gist_data["description"]
             )
-        else:
+            self.get_gists_by_description()[gist_data["description"]] = gist
+        elif not self.gist_has_files(gist, gist_data["contents"]):
             gist.edit(gist_data["description"], gist_data["files"])
         return gist
 
+    def get_api_headers(self):
+        return {"Authorization": "token {}".format(self.access_token)}
+
+    def send_repo_request(self, method, path, data=None):
+        """Sends a request to an endpoint of the repository (e.g. "/issues/1") with the shared session.
+        """
+        url = "{api_url}/repos/{repo}{path}".format(api_url=self.api_url, repo=self.get_repo_full_name(), path=path)
+        res = self.session.request(method, url, json=data, headers=self.get_api_headers())
+        if not res.ok:
+            res.raise_for_status()
+        return res
+
+    def get_import_headers(self):
+        return {
+            "Authorization": "token {}".format(self.access_token),
+            "Accept": "application/vnd.github.golden-comet-preview+json"
+        }
+
     def create_issue_with_comments(self, issue_data):
         """
-        Push a single issue to GitHub.
+        Push a single issue to GitHub and wait until it has been imported.
+        """
+        self.submit_issue_with_comments(None, issue_data)
+        self.flush_issue_imports()
+
+    def submit_issue_with_comments(self, number, issue_data, on_imported=None):
+        """
+        Submit a single issue to GitHub without waiting for the import to finish.
         Importing via GitHub's normal Issue API quickly triggers anti-abuse rate
         limits. So we use their dedicated Issue Import API instead:
         https://gist.github.com/jonmagic/5282384165e0f86ef105
         https://github.com/nicoddemus/bitbucket_issue_migration/issues/1
+        GitHub processes the imports of a repository in the order in which they
+        are submitted, so `number` is only used to check the resulting issue number.
+        At most `max_pending_imports` imports are pending at the same time. Once an
+        import has failed, nothing is submitted until it has been retried and the
+        issues imported after it have been moved back to their numbers (see
+        `flush_issue_imports`).
+        `on_imported` is called once GitHub has created the issue.
         """
-        url = "https://api.github.com/repos/{repo}/import/issues".format(
+        while len(self.pending_imports) >= self.max_pending_imports and not self.failed_imports:
+            self.poll_issue_imports()
+        if self.failed_imports:
+            self.flush_issue_imports()
+        url = "{api_url}/repos/{repo}/import/issues".format(
+            api_url=self.api_url,
             repo=self.get_repo_full_name())
-        headers = {
-            "Authorization": "token {}".format(self.access_token),
-            "Accept": "application/vnd.github.golden-comet-preview+json"
-        }
-        res = requests.post(url, json=issue_data, headers=headers)
+        res = self.session.post(url, json=issue_data, headers=self.get_import_headers())
         if not res.ok:
             res.raise_for_status()
         import_data = res.json()
-        import_status = import_data["status"]
-        delay = 1
-        while import_status == "pending":
-            print("Waiting...")
+        self.pending_imports[import_data["id"]] = (number, issue_data, import_data, on_imported)
+        self.handle_import_status(import_data)
+
+    def poll_issue_imports(self, delay=1):
+        """
+        Check the status of all pending imports with a single request to the
+        "list since" endpoint of the Issue Import API. Sleeps for `delay`
+        seconds if no pending import has been completed.
+        """
+        if not self.pending_imports:
+            return
+        since = min(import_data["created_at"] for _, _, import_data, _ in self.pending_imports.values())
+        url = "{api_url}/repos/{repo}/import/issues?since={since}".format(
+            api_url=self.api_url,
+            repo=self.get_repo_full_name(),
+            since=since
+        )
+        pending_count = len(self.pending_imports)
+        for import_data in get_request_json(url, self.session, headers=self.get_import_headers()):
+            self.handle_import_status(import_data)
+        if len(self.pending_imports) == pending_count:
+            print("Waiting for {} pending imports...".format(pending_count))
             sleep(delay)
-            delay = min(5, delay + 1)
-            import_data = get_request_json(import_data["url"], headers=headers)
-            import_status = import_data["status"]
 
+    def handle_import_status(self, import_data):
+        import_id = import_data["id"]
+        import_status = import_data["status"]
+        if import_id not in self.pending_imports or import_status == "pending":
+            return
+        number, issue_data, _, on_imported = self.pending_imports.pop(import_id)
         if import_status != "imported":
-            print("Warning: import status is '{}'.".format(import_status))
+            print("Warning: import status of github issue #{} is '{}'.".format(number, import_status))
         if import_status == "failed":
-            print("Retrying...".format(import_status))
-            self.slow_create_issue_with_comments(issue_data)
-
-    def update_issue_comments(self, issue, comments_data):
-        issue_id = issue.number
-        num_comments = len(comments_data)
-        existing_comments = list(issue.get_comments())
-
-        # Create or update comments
-        for comment_num, comment_data in enumerate(comments_data):
-            print("Set comment {}/{} of github issue #{}...".format(comment_num + 1, num_comments, issue_id))
-            comment_body = comment_data["body"]
-            if comment_num < len(existing_comments):
-                existing_comments[comment_num].edit(comment_body)
+            self.failed_imports.append((number, issue_data, on_imported))
+            return
+        match = IMPORTED_ISSUE_NUMBER_RE.search(import_data.get("issue_url") or "")
+        if match is not None and number is not None and int(match.group(1)) != number:
+            # Resolved by `flush_issue_imports` once all pending imports are done
+            self.shifted_imports.append((number, int(match.group(1)), issue_data, on_imported))
+            return
+        if on_imported is not None:
+            on_imported()
+
+    def check_issue_number(self, number, created_number):
+        # All later issues would be shifted as well, so the migration cannot continue
+        if number is not None and created_number != number:
+            raise Exception("Github issue #{} has been created as #{}.".format(number, created_number))
+
+    def flush_issue_imports(self):
+        """
+        Wait until all submitted imports are done and retry the failed ones
+        with the normal Issue API. The issues that were still pending when an
+        import failed have been created with the numbers of the failed ones, so
+        they are edited to match the issues that should have these numbers,
+        and the remaining issues are created after them, in the order of their
+        numbers. The edited issues keep the creation date of the issue that
+        they have been imported from.
+        """
+        delay = 1
+        while self.pending_imports:
+            self.poll_issue_imports(delay)
+            delay = min(5, delay + 1)
+        failed_imports = self.failed_imports
+        shifted_imports = sorted(self.shifted_imports, key=lambda x: x[1])
+        self.failed_imports = []
+        self.shifted_imports = []
+        if shifted_imports and not failed_imports:
+            # Not caused by the migration, e.g. an issue has been created in the meantime
+            number, created_number, _, _ = shifted_imports[0]
+            self.check_issue_number(number, created_number)
+        issues_to_create = sorted(
+            failed_imports + [(number, issue_data, on_imported) for number, _, issue_data, on_imported in shifted_imports],
+            key=lambda x: x[0] or 0
+        )
+        for index, (number, issue_data, on_imported) in enumerate(issues_to_create):
+            if index < len(shifted_imports):
+                # The issue with this number has been imported from a later one
+                self.check_issue_number(number, shifted_imports[index][1])
+                print("Move github issue #{} back to its number...".format(number))
+                self.replace_issue_with_comments(number, issue_data)
+            else:
+                print("Retrying github issue #{}...".format(number))
+                issue = self.slow_create_issue_with_comments(issue_data)
+                self.check_issue_number(number, issue.number)
+            if on_imported is not None:
+                on_imported()
+
+    def sync_comments(self, kind, number, existing_comments, comments_data):
+        """Makes the comments of an issue or pull request match `comments_data`, comparing the existing comments
+        (the (id, body hash) pairs of its `IssueState`) with the rendered ones position by position. Only the creates,
+        edits and deletes that are actually needed are sent. Returns the number of created, edited, deleted and
+        unchanged comments.
+        """
+        counts = {"created": 0, "edited": 0, "deleted": 0, "unchanged": 0}
+        existing_hashes = [body_hash for _, body_hash in existing_comments]
+        for action, index in diff_comments(existing_hashes, comments_data):
+            if action == "edit":
+                print("Edit comment {}/{} of github {} #{}...".format(index + 1, len(comments_data), kind, number))
+                comment_id, _ = existing_comments[index]
+                self.send_repo_request("PATCH", "/issues/comments/{}".format(comment_id), {
+                    "body": comments_data[index]["body"]
+                })
+                counts["edited"] += 1
+            elif action == "create":
+                print("Create comment {}/{} of github {} #{}...".format(index + 1, len(comments_data), kind, number))
+                self.send_repo_request("POST", "/issues/{}/comments".format(number), {
+                    "body": comments_data[index]["body"]
+                })
+                counts["created"] += 1
+            elif action == "delete":
+                print("Delete extra github comment {}/{} of {} #{}...".format(
+                    index - len(comments_data) + 1,
+                    len(existing_comments) - len(comments_data),
+                    kind,
+                    number
+                ))
+                comment_id, _ = existing_comments[index]
+                self.send_repo_request("DELETE", "/issues/comments/{}".format(comment_id))
+                counts["deleted"] += 1
             else:
-                issue.create_comment(comment_body)
+                counts["unchanged"] += 1
+        print("Comments of github {} #{}: {created} created, {edited} edited, {deleted} deleted, {unchanged} unchanged.".format(
+            kind,
+            number,
+            **counts
+        ))
+        return counts
 
-        # Delete comments in excess
-        comments_to_delete = existing_comments[num_comments:]
-        for i, gcomment in enumerate(comments_to_delete):
-            print("Delete extra github comment {}/{} of issue #{}...".format(i + 1, len(comments_to_delete), issue_id))
-            gcomment.delete()
+    def update_issue_with_comments(self, number, existing_state, issue_data):
+        """Makes an existing issue match the rendered `issue_data`. Only the differences to `existing_state` (its
+        `IssueState`) are sent, without reading the issue or its comments again.
+        """
+        meta = issue_data["issue"]
+        changes = get_issue_changes(existing_state.diff_issue_meta(meta), meta)
+        if changes:
+            print("Edit {} of github issue #{}...".format(", ".join(sorted(changes)), number))
+            self.send_repo_request("PATCH", "/issues/{}".format(number), changes)
+        self.sync_comments("issue", number, existing_state.comments, issue_data["comments"])
 
-    def update_issue_with_comments(self, issue, issue_data):
+    def replace_issue_with_comments(self, number, issue_data):
+        """Makes an existing issue, whose state is unknown, match the rendered `issue_data`.
+        """
         meta = issue_data["issue"]
-        issue.edit(
-            title=meta["title"],
-            body=meta["body"],
-            labels=meta["labels"],
-            state="closed" if meta["closed"] else "open",
-            assignees=[] if meta["assignee"] is None else [meta["assignee"]]
-        )
-        self.update_issue_comments(issue, issue_data["comments"])
+        self.send_repo_request("PATCH", "/issues/{}".format(number), get_issue_changes(
+            ["title", "body", "labels", "state", "assignees"], meta
+        ))
+        existing_comments = [(x.id, hash_body(x.body)) for x in self.repo.get_issue(number).get_comments()]
+        self.sync_comments("issue", number, existing_comments, issue_data["comments"])
 
     def slow_create_issue_with_comments(self, issue_data):
         meta = issue_data["issue"]
@@ -139,50 +406,39 @@ class GithubImport:
             assignees=[] if meta["assignee"] is None else [meta["assignee"]]
         )
         issue.edit(state="closed" if meta["closed"] else "open")
-        self.update_issue_comments(issue, issue_data["comments"])
-
-    def update_pull_comments(self, pull, comments_data):
-        pull_id = pull.number
-        num_comments = len(comments_data)
-        existing_comments = list(pull.get_issue_comments())
-
-        # Create or update comments
-        for comment_num, comment_data in enumerate(comments_data):
-            print("Set comment {}/{} of github pull request #{}...".format(comment_num + 1, num_comments, pull_id))
-            comment_body = comment_data["body"]
-            if comment_num < len(existing_comments):
-                existing_comments[comment_num].edit(comment_body)
-            else:
-                pull.create_comment(comment_body)
-
-        # Delete comments in excess
-        comments_to_delete = existing_comments[num_comments:]
-        for i, gcomment in enumerate(comments_to_delete):
-            print("Delete extra github comment {}/{} of pull request #{}...".format(i + 1, len(comments_to_delete), pull_id))
-            gcomment.delete()
+        self.sync_comments("issue", issue.number, [], issue_data["comments"])
+        return issue
 
-    def update_pull_with_comments(self, pull, pull_data):
+    def update_pull_with_comments(self, number, existing_state, pull_data):
+        """Makes an existing pull request match the rendered `pull_data`. Only the differences to `existing_state`
+        (its `IssueState`) are sent, without reading the pull request or its comments again.
+        """
         meta = pull_data["pull"]
-        assert meta["head"] == pull.head.ref
-        pull.edit(
-            title=meta["title"],
-            body=meta["body"],
-            state=meta["state"],
-            base=meta["base"],
-        )
-        pull.set_labels(*meta["labels"])
-        pull.remove_from_assignees(*[
-            x.name for x in pull.assignees
-            if x.name not in meta["assignees"]
-        ])
-        pull.add_to_assignees(*meta["assignees"])
-        (reviewers, team_reviewers) = pull.get_review_request()
-        pull.delete_review_request(
-            reviewers=[u.name for u in reviewers],
-            team_reviewers=[u.name for u in team_reviewers]
-        )
-        pull.create_review_request(reviewers=meta["reviewers"])
-        self.update_pull_comments(pull, pull_data["comments"])
+        assert meta["head"] == existing_state.head
+        fields = existing_state.diff_pull_meta(meta)
+        changes = get_pull_changes(fields, meta)
+        if changes:
+            print("Edit {} of github pull request #{}...".format(", ".join(sorted(changes)), number))
+            self.send_repo_request("PATCH", "/pulls/{}".format(number), changes)
+        if "labels" in fields:
+            self.send_repo_request("PUT", "/issues/{}/labels".format(number), {"labels": meta["labels"]})
+        assignees_to_remove = sorted(existing_state.assignees.difference(meta["assignees"]))
+        assignees_to_add = [x for x in meta["assignees"] if x not in existing_state.assignees]
+        if assignees_to_remove:
+            self.send_repo_request("DELETE", "/issues/{}/assignees".format(number), {"assignees": assignees_to_remove})
+        if assignees_to_add:
+            self.send_repo_request("POST", "/issues/{}/assignees".format(number), {"assignees": assignees_to_add})
+        reviewers_to_remove = sorted(existing_state.reviewers.difference(meta["reviewers"]))
+        team_reviewers_to_remove = sorted(existing_state.team_reviewers)
+        reviewers_to_add = [x for x in meta["reviewers"] if x not in existing_state.reviewers]
+        if reviewers_to_remove or team_reviewers_to_remove:
+            self.send_repo_request("DELETE", "/pulls/{}/requested_reviewers".format(number), {
+                "reviewers": reviewers_to_remove,
+                "team_reviewers": team_reviewers_to_remove
+            })
+        if reviewers_to_add:
+            self.send_repo_request("POST", "/pulls/{}/requested_reviewers".format(number), {"reviewers": reviewers_to_add})
+        self.sync_comments("pull request", number, existing_state.comments, pull_data["comments"])
 
     def create_pull_with_comments(self, pull_data):
         meta = pull_data["pull"]
@@ -0,0 +1,241 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+from .utils import normalize_body
+
+
+GRAPHQL_URL = "https://api.github.com/graphql"
+
+ISSUE_FIELDS = """
+    number
+    state
+    title
+    body
+    labels(first: 100) { nodes { name } }
+    assignees(first: 100) { nodes { login } }
+    comments(first: 100) { pageInfo { hasNextPage endCursor } nodes { databaseId body } }
+"""
+
+PULL_FIELDS = ISSUE_FIELDS + """
+    baseRefName
+    headRefName
+    reviewRequests(first: 100) { nodes { requestedReviewer { ... on User { login } ... on Team { slug } } } }
+"""
+
+ISSUES_QUERY = """
+query($owner: String!, $name: String!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    issues(first: 100, after: $cursor) {
+      pageInfo { hasNextPage endCursor }
+      nodes { %s }
+    }
+  }
+}
+""" % ISSUE_FIELDS
+
+PULLS_QUERY = """
+query($owner: String!, $name: String!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    pullRequests(first: 100, after: $cursor) {
+      pageInfo { hasNextPage endCursor }
+      nodes { %s }
+    }
+  }
+}
+""" % PULL_FIELDS
+
+COMMENTS_QUERY = """
+query($owner: String!, $name: String!, $number: Int!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    issueOrPullRequest(number: $number) {
+      ... on Issue { comments(first: 100, after: $cursor) { pageInfo { hasNextPage endCursor } nodes { databaseId body } } }
+      ... on PullRequest { comments(first: 100, after: $cursor) { pageInfo { hasNextPage endCursor } nodes { databaseId body } } }
+    }
+  }
+}
+"""
+
+
+def hash_body(body):
+    return hashlib.sha1(normalize_body(body).encode("utf-8")).hexdigest()
+
+
+class IssueState:
+    """Compact snapshot of an existing GitHub issue or pull request.
+    Bodies are only kept as hashes; comments are kept as (id, body hash) pairs because their ids are needed to update
+    them.
+    """
+    __slots__ = (
+        "number", "is_pull", "state", "title", "body_hash", "labels", "assignees", "comments", "base", "head",
+        "reviewers", "team_reviewers"
+    )
+
+    def __init__(self, number, is_pull, state, title, body_hash, labels, assignees, comments, base=None, head=None,
+                 reviewers=(), team_reviewers=()):
+        self.number = number
+        self.is_pull = is_pull
+        self.state = state
+        self.title = title
+        self.body_hash = body_hash
+        self.labels = labels
+        self.assignees = assignees
+        self.comments = comments
+        self.base = base
+        self.head = head
+        self.reviewers = reviewers
+        self.team_reviewers = team_reviewers
+
+    def diff_comments(self, comments_data):
+        """Returns a description of the first difference between the existing and the rendered comments, or None.
+        """
+        existing_hashes = [body_hash for _, body_hash in self.comments]
+        body_hashes = [hash_body(x["body"]) for x in comments_data]
+        for index, (existing_hash, body_hash) in enumerate(zip(existing_hashes, body_hashes)):
+            if existing_hash != body_hash:
+                return "comments[{}]".format(index)
+        if len(existing_hashes) != len(body_hashes):
+            return "comments (count {} instead of {})".format(len(existing_hashes), len(body_hashes))
+        return None
+
+    def diff_issue_meta(self, meta):
+        """Returns the list of fields (except the comments) that differ between GitHub and the rendered issue.
+        """
+        assignees = frozenset() if meta["assignee"] is None else frozenset([meta["assignee"]])
+        return [
+            name for name, differs in [
+                ("title", self.title != meta["title"]),
+                ("body", self.body_hash != hash_body(meta["body"])),
+                ("labels", self.labels != frozenset(meta["labels"])),
+                ("state", self.state != ("closed" if meta["closed"] else "open")),
+                ("assignees", self.assignees != assignees),
+            ] if differs
+        ]
+
+    def diff_issue(self, issue_data):
+        """Returns the list of fields that differ between GitHub and the rendered issue.
+        """
+        fields = self.diff_issue_meta(issue_data["issue"])
+        comments_diff = self.diff_comments(issue_data["comments"])
+        if comments_diff is not None:
+            fields.append(comments_diff)
+        return fields
+
+    def diff_pull_meta(self, meta):
+        """Returns the list of fields (except the comments) that differ between GitHub and the rendered pull request.
+        """
+        return [
+            name for name, differs in [
+                ("type", not self.is_pull),
+                ("title", self.title != meta["title"]),
+                ("body", self.body_hash != hash_body(meta["body"])),
+                ("labels", self.labels != frozenset(meta["labels"])),
+                ("state", self.state != ("closed" if meta["closed"] else "open")),
+                ("base", self.base != meta["base"]),
+                ("assignees", self.assignees != frozenset(meta["assignees"])),
+                ("reviewers", self.reviewers != frozenset(meta["reviewers"])),
+            ] if differs
+        ]
+
+    def diff_pull(self, pull_data):
+        """Returns the list of fields that differ between GitHub and the rendered pull request.
+        """
+        fields = self.diff_pull_meta(pull_data["pull"])
+        comments_diff = self.diff_comments(pull_data["comments"])
+        if comments_diff is not None:
+            fields.append(comments_diff)
+        return fields
+
+    def diff(self, issue_or_pull):
+        if issue_or_pull["type"] == "issue":
+            return self.diff_issue(issue_or_pull["data"])
+        return self.diff_pull(issue_or_pull["data"])
+
+    def matches(self, issue_or_pull):
+        return not self.diff(issue_or_pull)
+
+
+def graphql_query(query, variables, headers, session=None, graphql_url=GRAPHQL_URL):
+    if session is None:
+        session = requests
+    res = session.post(graphql_url, json={"query": query, "variables": variables}, headers=headers)
+    if not res.ok:
+        res.raise_for_status()
+    result = res.json()
+    if result.get("errors"):
+        raise Exception("GraphQL query failed: {}".format(result["errors"]))
+    return result["data"]
+
+
+def get_paginated_nodes(query, variables, headers, get_connection, session=None, graphql_url=GRAPHQL_URL):
+    cursor = None
+    while True:
+        data = graphql_query(query, dict(variables, cursor=cursor), headers, session, graphql_url)
+        connection = get_connection(data)
+        for node in connection["nodes"]:
+            yield node
+        if not connection["pageInfo"]["hasNextPage"]:
+            return
+        cursor = connection["pageInfo"]["endCursor"]
+
+
+def get_all_comments(node, variables, headers, session=None, graphql_url=GRAPHQL_URL):
+    comments = [(x["databaseId"], hash_body(x["body"])) for x in node["comments"]["nodes"]]
+    page_info = node["comments"]["pageInfo"]
+    if page_info["hasNextPage"]:
+        # Only issues with more than 100 comments need additional requests
+        more_comments = get_paginated_nodes(
+            COMMENTS_QUERY,
+            dict(variables, number=node["number"]),
+            headers,
+            lambda data: data["repository"]["issueOrPullRequest"]["comments"],
+            session,
+            graphql_url
+        )
+        comments = [(x["databaseId"], hash_body(x["body"])) for x in more_comments]
+    return tuple(comments)
+
+
+def create_issue_state(node, is_pull, variables, headers, session=None, graphql_url=GRAPHQL_URL):
+    reviewers = ()
+    team_reviewers = ()
+    if is_pull:
+        requested = [x["requestedReviewer"] for x in node["reviewRequests"]["nodes"] if x["requestedReviewer"]]
+        reviewers = frozenset(x["login"] for x in requested if "login" in x)
+        team_reviewers = frozenset(x["slug"] for x in requested if "slug" in x)
+    return IssueState(
+        number=node["number"],
+        is_pull=is_pull,
+        # GitHub's REST API reports merged pull requests as closed
+        state="open" if node["state"] == "OPEN" else "closed",
+        title=node["title"],
+        body_hash=hash_body(node["body"]),
+        labels=frozenset(x["name"] for x in node["labels"]["nodes"]),
+        assignees=frozenset(x["login"] for x in node["assignees"]["nodes"]),
+        comments=get_all_comments(node, variables, headers, session, graphql_url),
+        base=node.get("baseRefName"),
+        head=node.get("headRefName"),
+        reviewers=reviewers,
+        team_reviewers=team_reviewers,
+    )
+
+
+def load_issue_states(access_token, repository, session=None, graphql_url=GRAPHQL_URL):
+    """Loads the state of all issues and pull requests of a GitHub repository with paginated GraphQL queries.
+    Issues and pull requests are loaded concurrently.
+    Returns a map from the issue number to an `IssueState`.
+    """
+    owner, name = repository.split("/")
+    variables = {"owner": owner, "name": name}
+    headers = {"Authorization": "bearer {}".format(access_token)}
+
+    def load(query, connection_name, is_pull):
+        nodes = get_paginated_nodes(
+            query, variables, headers, lambda data: data["repository"][connection_name], session, graphql_url
+        )
+        return [create_issue_state(node, is_pull, variables, headers, session, graphql_url) for node in nodes]
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        issues = executor.submit(load, ISSUES_QUERY, "issues", False)
+        pulls = executor.submit(load, PULLS_QUERY, "pullRequests", True)
+        return {state.number: state for state in issues.result() + pulls.result()}
@@ -0,0 +1,195 @@
+import json
+import re
+import threading
+from urllib.parse import urlparse
+
+
+# Upper bounds (in seconds) of the buckets of the latency histograms, the last bucket is unbounded
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Replacements that turn the path of a request into the template of its endpoint
+ENDPOINT_PATTERNS = [
+    (re.compile(r'^/repositories/[^/]+/[^/]+'), "/repositories/:repo"),
+    (re.compile(r'^/repos/[^/]+/[^/]+'), "/repos/:repo"),
+    (re.compile(r'/attachments/[^/]+$'), "/attachments/:name"),
+    (re.compile(r'/commit/[^/]+'), "/commit/:hash"),
+    (re.compile(r'/gists/[^/]+'), "/gists/:id"),
+    (re.compile(r'/users/[^/]+'), "/users/:user"),
+    (re.compile(r'/branches/[^/]+'), "/branches/:branch"),
+    (re.compile(r'/\d+(?=/|$)'), "/:id"),
+]
+
+# Columns of the printed table of endpoints
+TABLE_ROW_FORMAT = "{:<7} {:<55} {:>7} {:>7} {:>11} {:>9} {:>8} {:>8} {:>8} {:>7}"
+
+
+def normalize_endpoint(url, base_path=""):
+    """Returns the endpoint template of a request URL, e.g. "/repos/:repo/issues/:id/comments".
+    `base_path` (e.g. "/2.0") is removed from the path.
+    """
+    path = urlparse(url).path
+    if base_path and path.startswith(base_path):
+        path = path[len(base_path):]
+    for pattern, replacement in ENDPOINT_PATTERNS:
+        path = pattern.sub(replacement, path)
+    return path or "/"
+
+
+def get_bucket_labels():
+    return ["<={}s".format(bound) for bound in LATENCY_BUCKETS] + [">{}s".format(LATENCY_BUCKETS[-1])]
+
+
+def get_body_size(body):
+    if isinstance(body, (bytes, str)):
+        return len(body)
+    return 0
+
+
+def compute_totals(endpoint_metrics):
+    endpoint_metrics = list(endpoint_metrics)
+    return {
+        "requests": sum(x.count for x in endpoint_metrics),
+        "bytes_sent": sum(x.bytes_sent for x in endpoint_metrics),
+        "bytes_received": sum(x.bytes_received for x in endpoint_metrics),
+        "total_latency": round(sum(x.total_latency for x in endpoint_metrics), 3),
+        "retries": sum(x.retries for x in endpoint_metrics),
+    }
+
+
+class EndpointMetrics:
+    """Totals and latency histogram of the requests sent to one endpoint.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.statuses = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.retries = 0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, status, bytes_sent, bytes_received, latency, retries):
+        self.count += 1
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.bytes_sent += bytes_sent
+        self.bytes_received += bytes_received
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        self.retries += retries
+        bucket = 0
+        while bucket < len(LATENCY_BUCKETS) and latency > LATENCY_BUCKETS[bucket]:
+            bucket += 1
+        self.histogram[bucket] += 1
+
+    def get_percentile(self, percentile):
+        """Returns the upper bound of the histogram bucket that contains the given percentile of the latencies.
+        """
+        rank = percentile / 100 * self.count
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= rank:
+                return LATENCY_BUCKETS[bucket] if bucket < len(LATENCY_BUCKETS) else self.max_latency
+        return 0.0
+
+    def to_json(self):
+        return {
+            "count": self.count,
+            "statuses": {str(status): count for status, count in sorted(self.statuses.items(), key=str)},
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "total_latency": round(self.total_latency, 3),
+            "mean_latency": round(self.total_latency / self.count, 4) if self.count else 0.0,
+            "max_latency": round(self.max_latency, 4),
+            "retries": self.retries,
+            "histogram": dict(zip(get_bucket_labels(), self.histogram)),
+        }
+
+
+class RequestMetrics:
+    """Per-endpoint metrics of the requests sent by a `ScheduledSession`. Register `record_request` as a request
+    hook of the session.
+    """
+
+    def __init__(self, name, base_url=""):
+        self.name = name
+        self.base_path = urlparse(base_url).path.rstrip("/")
+        self.lock = threading.Lock()
+        # (method, endpoint template) -> EndpointMetrics
+        self.endpoints = {}
+
+    def record_request(self, method, url, response, latency, retries):
+        """Records a request. `response` is None if the request failed without a response, `latency` is the time
+        spent sending it (without waiting for the rate limit) and `retries` the number of times it has been resent.
+        """
+        key = (method.upper(), normalize_endpoint(url, self.base_path))
+        if response is None:
+            status, bytes_sent, bytes_received = "error", 0, 0
+        else:
+            status = response.status_code
+            bytes_sent = get_body_size(response.request.body) if response.request is not None else 0
+            # Streamed bodies are not read here
+            if response._content_consumed:
+                bytes_received = len(response.content or b"")
+            else:
+                bytes_received = int(response.headers.get("Content-Length") or 0)
+        with self.lock:
+            if key not in self.endpoints:
+                self.endpoints[key] = EndpointMetrics()
+            self.endpoints[key].add(status, bytes_sent, bytes_received, latency, retries)
+
+    def get_totals(self):
+        with self.lock:
+            return compute_totals(self.endpoints.values())
+
+    def to_json(self):
+        with self.lock:
+            endpoints = sorted(self.endpoints.items(), key=lambda x: (x[0][1], x[0][0]))
+            return {
+                "totals": compute_totals(x for _, x in endpoints),
+                "endpoints": [
+                    dict(method=method, endpoint=endpoint, **metrics.to_json())
+                    for (method, endpoint), metrics in endpoints
+                ],
+            }
+
+    def format_table(self):
+        """Returns a table of the endpoints, sorted by the total time spent on them.
+        """
+        with self.lock:
+            endpoints = sorted(self.endpoints.items(), key=lambda x: -x[1].total_latency)
+            rows = [TABLE_ROW_FORMAT.format(
+                "method", "endpoint", "count", "errors", "received", "total s", "mean s", "p95 s", "max s", "retries"
+            )]
+            for (method, endpoint), metrics in endpoints:
+                errors = sum(
+                    count for status, count in metrics.statuses.items()
+                    if status == "error" or status >= 400
+                )
+                rows.append(TABLE_ROW_FORMAT.format(
+                    method,
+                    endpoint,
+                    metrics.count,
+                    errors,
+                    metrics.bytes_received,
+                    round(metrics.total_latency, 2),
+                    round(metrics.total_latency / metrics.count, 3),
+                    metrics.get_percentile(95),
+                    round(metrics.max_latency, 3),
+                    metrics.retries
+                ))
+            totals = compute_totals(x for _, x in endpoints)
+        rows.append(TABLE_ROW_FORMAT.format(
+            "", "total", totals["requests"], "", totals["bytes_received"], totals["total_latency"], "", "", "",
+            totals["retries"]
+        ))
+        return "\n".join(rows)
+
+
+def export_request_metrics(path, metrics_list):
+    """Writes the metrics of several sessions (e.g. Bitbucket and Github) to a JSON file.
+    """
+    with open(path, "w") as file:
+        json.dump({metrics.name: metrics.to_json() for metrics in metrics_list}, file, indent=2)
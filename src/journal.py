@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def hash_payload(issue_or_pull):
+    """Returns a hash of a rendered issue or pull request (a `{"type", "data"}` dict).
+    """
+    return hashlib.sha256(json.dumps(issue_or_pull, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def hash_render_inputs(*inputs):
+    """Returns a hash of the inputs of the rendering besides the bitbucket data (e.g. the configured mappings and
+    the commit map). Sets are hashed as sorted lists.
+    """
+    data = json.dumps(inputs, sort_keys=True, default=sorted)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+
+
+def hash_source(bitbucket_item, render_hash=""):
+    """Returns a fingerprint of the bitbucket issue or pull request that an issue is rendered from (None for a
+    missing id) and of the other inputs of the rendering (see `hash_render_inputs`), which changes whenever the
+    issue is updated on bitbucket or the migration is configured differently. Unlike the payload hash, it is
+    known before the issue is rendered.
+    """
+    if bitbucket_item is None:
+        return "missing#{}".format(render_hash)
+    return "{}@{}#{}".format(bitbucket_item["id"], bitbucket_item["updated_on"], render_hash)
+
+
+class MigrationJournal:
+    """Persistent record of the issues and pull requests that have been uploaded to a GitHub repository.
+    For each number it stores the hash of the uploaded payload, the fingerprint of the bitbucket data it has been
+    rendered from and whether GitHub has confirmed it, so that an interrupted migration can skip the completed
+    issues without any API call.
+    """
+
+    SUBMITTED = "submitted"
+    CONFIRMED = "confirmed"
+
+    def __init__(self, path, repository):
+        self.path = path
+        self.repository = repository
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Imports are confirmed from the thread that polls the Issue Import API
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS issues ("
+            "repository TEXT, number INTEGER, type TEXT, payload_hash TEXT, status TEXT, updated_at REAL, "
+            "source_hash TEXT, PRIMARY KEY (repository, number))"
+        )
+        columns = [x[1] for x in self.connection.execute("PRAGMA table_info(issues)")]
+        if "source_hash" not in columns:
+            # Journal written before the fingerprints were recorded
+            self.connection.execute("ALTER TABLE issues ADD COLUMN source_hash TEXT")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS syncs (repository TEXT PRIMARY KEY, synced_at TEXT)"
+        )
+        self.connection.commit()
+
+    def get_entry(self, number):
+        """Returns the (payload hash, status) recorded for an issue number, or None.
+        """
+        with self.lock:
+            return self.connection.execute(
+                "SELECT payload_hash, status FROM issues WHERE repository = ? AND number = ?",
+                (self.repository, number)
+            ).fetchone()
+
+    def is_confirmed(self, number, payload_hash):
+        return self.get_entry(number) == (payload_hash, self.CONFIRMED)
+
+    def record(self, number, type, payload_hash, status, source_hash=None):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO issues VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.repository, number, type, payload_hash, status, time.time(), source_hash)
+            )
+            self.connection.commit()
+
+    def get_confirmed_source_hashes(self):
+        """Returns a map from the confirmed issue numbers to the fingerprint of their bitbucket data.
+        """
+        with self.lock:
+            return dict(self.connection.execute(
+                "SELECT number, source_hash FROM issues WHERE repository = ? AND status = ? AND source_hash IS NOT NULL",
+                (self.repository, self.CONFIRMED)
+            ).fetchall())
+
+    def has_entries_from(self, number):
+        """Checks whether an issue number from `number` on has been recorded, confirmed or not.
+        """
+        with self.lock:
+            return self.connection.execute(
+                "SELECT 1 FROM issues WHERE repository = ? AND number >= ? LIMIT 1",
+                (self.repository, number)
+            ).fetchone() is not None
+
+    def get_first_unconfirmed(self):
+        """Returns the first issue number that is not confirmed, assuming that numbers start at 1.
+        """
+        with self.lock:
+            numbers = self.connection.execute(
+                "SELECT number FROM issues WHERE repository = ? AND status = ? ORDER BY number",
+                (self.repository, self.CONFIRMED)
+            ).fetchall()
+        expected = 1
+        for (number,) in numbers:
+            if number != expected:
+                break
+            expected += 1
+        return expected
+
+    def get_high_water_mark(self):
+        """Returns the time (ISO 8601) of the bitbucket data of the last completed migration, or None.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT synced_at FROM syncs WHERE repository = ?",
+                (self.repository,)
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def set_high_water_mark(self, synced_at):
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO syncs VALUES (?, ?)", (self.repository, synced_at))
+            self.connection.commit()
+
+    def forget(self, numbers):
+        """Removes the entries of the given issue numbers, so that they are rendered and uploaded again.
+        """
+        with self.lock:
+            self.connection.executemany(
+                "DELETE FROM issues WHERE repository = ? AND number = ?",
+                [(self.repository, number) for number in numbers]
+            )
+            self.connection.commit()
+
+    def clear(self, first_number=1, last_number=None):
+        """Removes the entries of the issue numbers from `first_number` to `last_number` (or the last one).
+        """
+        with self.lock:
+            if last_number is None:
+                self.connection.execute(
+                    "DELETE FROM issues WHERE repository = ? AND number >= ?",
+                    (self.repository, first_number)
+                )
+            else:
+                self.connection.execute(
+                    "DELETE FROM issues WHERE repository = ? AND number BETWEEN ? AND ?",
+                    (self.repository, first_number, last_number)
+                )
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
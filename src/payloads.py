@@ -0,0 +1,66 @@
+import gzip
+import json
+import os
+
+
+class PayloadFile:
+    """Compressed, line-delimited file of rendered issues and pull requests (the `{"type", "data"}` dicts), with an
+    index by github issue number.
+    Every line is compressed as a separate gzip member, so the file can be read as a whole with any gzip tool and a
+    single payload can be read by seeking to its offset. The index is stored next to the file as JSON.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + ".index.json"
+        self.index = None
+
+    def write(self, numbered_payloads, metadata=None):
+        """Writes (number, payload) pairs, streamed from `numbered_payloads`. Returns the number of payloads.
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        offsets = []
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            for number, payload in numbered_payloads:
+                line = json.dumps(payload, sort_keys=True) + "\n"
+                member = gzip.compress(line.encode("utf-8"))
+                offsets.append([number, file.tell(), len(member)])
+                file.write(member)
+        os.replace(tmp_path, self.path)
+        self.index = {"metadata": metadata or {}, "offsets": offsets}
+        tmp_index_path = self.index_path + ".tmp"
+        with open(tmp_index_path, "w") as file:
+            json.dump(self.index, file)
+        os.replace(tmp_index_path, self.index_path)
+        return len(offsets)
+
+    def read_index(self):
+        if self.index is None:
+            with open(self.index_path, "r") as file:
+                self.index = json.load(file)
+        return self.index
+
+    def get_metadata(self):
+        return self.read_index()["metadata"]
+
+    def get_numbers(self):
+        return [number for number, _, _ in self.read_index()["offsets"]]
+
+    def iterate(self, first=None, last=None):
+        """Yields the (number, payload) pairs with a number between `first` and `last` (both inclusive and optional),
+        reading one payload at a time.
+        """
+        with open(self.path, "rb") as file:
+            for number, offset, length in self.read_index()["offsets"]:
+                if (first is not None and number < first) or (last is not None and number > last):
+                    continue
+                file.seek(offset)
+                yield number, json.loads(gzip.decompress(file.read(length)).decode("utf-8"))
+
+    def get(self, number):
+        for _, payload in self.iterate(number, number):
+            return payload
+        return None
@@ -0,0 +1,161 @@
+import datetime
+import threading
+from .github import diff_comments
+
+
+class MigrationPlan:
+    """Counts the GitHub requests that uploading the rendered issues and pull requests would send, by replaying the
+    decisions of the upload against the snapshot of the existing issues (`IssueState`) without sending anything.
+    The polls of the Issue Import API depend on how fast GitHub imports issues, so only their minimum is counted.
+    """
+
+    def __init__(self, max_pending_imports):
+        self.max_pending_imports = max_pending_imports
+        self.pending_imports = 0
+        # Attachments are planned by several threads
+        self.lock = threading.Lock()
+        self.counts = {
+            "reads": 0,
+            "writes": 0,
+            "imports": 0,
+            "import_polls": 0,
+            "gists_created": 0,
+            "gists_edited": 0,
+            "issues_unchanged": 0,
+            "issues_skipped": 0,
+            "issues_imported": 0,
+            "issues_updated": 0,
+            "pulls_created": 0,
+            "pulls_updated": 0,
+            "comments_created": 0,
+            "comments_edited": 0,
+            "comments_deleted": 0,
+            "errors": 0,
+        }
+
+    def add(self, name, count=1):
+        with self.lock:
+            self.counts[name] += count
+
+    def add_gist(self, exists):
+        """Records the creation of a gist, or the edit of an existing one.
+        """
+        self.add("writes")
+        self.add("gists_edited" if exists else "gists_created")
+
+    def flush_imports(self):
+        if self.pending_imports:
+            self.add("reads")
+            self.add("import_polls")
+            self.pending_imports = 0
+
+    def add_import(self):
+        if self.pending_imports >= self.max_pending_imports:
+            self.flush_imports()
+        self.add("writes")
+        self.add("imports")
+        self.add("issues_imported")
+        self.pending_imports += 1
+
+    def add_comments(self, existing_comments, comments_data):
+        existing_hashes = [body_hash for _, body_hash in existing_comments]
+        for action, _ in diff_comments(existing_hashes, comments_data):
+            if action == "edit":
+                self.add("comments_edited")
+            elif action == "create":
+                self.add("comments_created")
+            elif action == "delete":
+                self.add("comments_deleted")
+            if action != "keep":
+                self.add("writes")
+
+    def add_skipped(self):
+        self.add("issues_skipped")
+
+    def add_issue_or_pull(self, issue_or_pull, existing_state):
+        """Records the requests of `upload_issue_or_pull` for a rendered issue or pull request. `existing_state`
+        is the `IssueState` of the github issue with the same number, or None.
+        """
+        data = issue_or_pull["data"]
+        if existing_state is not None and existing_state.matches(issue_or_pull):
+            self.add("issues_unchanged")
+        elif issue_or_pull["type"] == "issue":
+            if existing_state is None:
+                self.add_import()
+            else:
+                self.add_issue_update(existing_state, data)
+        elif existing_state is None:
+            self.add_pull_creation(data)
+        elif existing_state.is_pull:
+            self.add_pull_update(existing_state, data)
+        else:
+            self.add("errors")
+
+    def add_issue_update(self, existing_state, issue_data):
+        self.add("issues_updated")
+        if existing_state.diff_issue_meta(issue_data["issue"]):
+            self.add("writes")
+        self.add_comments(existing_state.comments, issue_data["comments"])
+
+    def add_pull_update(self, existing_state, pull_data):
+        self.add("pulls_updated")
+        meta = pull_data["pull"]
+        fields = existing_state.diff_pull_meta(meta)
+        if any(x in fields for x in ("title", "body", "state", "base")):
+            self.add("writes")
+        if "labels" in fields:
+            self.add("writes")
+        assignees = frozenset(meta["assignees"])
+        if existing_state.assignees - assignees:
+            self.add("writes")
+        if assignees - existing_state.assignees:
+            self.add("writes")
+        reviewers = frozenset(meta["reviewers"])
+        if existing_state.reviewers - reviewers or existing_state.team_reviewers:
+            self.add("writes")
+        if reviewers - existing_state.reviewers:
+            self.add("writes")
+        self.add_comments(existing_state.comments, pull_data["comments"])
+
+    def add_pull_creation(self, pull_data):
+        # The pull request takes the next number, so the pending imports are awaited first
+        self.flush_imports()
+        self.add("pulls_created")
+        meta = pull_data["pull"]
+        # Create the pull request, set its labels and assignees
+        self.add("writes", 3)
+        if meta["reviewers"]:
+            self.add("writes")
+        self.add("writes", len(pull_data["comments"]))
+        self.add("comments_created", len(pull_data["comments"]))
+
+    def finish(self, final_count=True):
+        """Records the requests at the end of the upload: the last polls of the imports and, if `final_count` is
+        set, the final count of the github issues.
+        """
+        self.flush_imports()
+        if final_count:
+            self.add("reads")
+
+    def get_requests_count(self):
+        return self.counts["reads"] + self.counts["writes"]
+
+    def format_report(self, scheduler):
+        """Returns the counted requests and the predicted duration of the upload with the current rate limit.
+        """
+        requests_count = self.get_requests_count()
+        duration = scheduler.predict_duration(requests_count, self.counts["writes"])
+        remaining = scheduler.get_remaining()
+        lines = ["{:<20} {:>10}".format(name, count) for name, count in self.counts.items()]
+        lines.append("{:<20} {:>10}".format("requests", requests_count))
+        lines.append("Github rate limit: {} requests remaining, {} writes spaced by {}s.".format(
+            remaining,
+            self.counts["writes"],
+            scheduler.min_write_interval
+        ))
+        lines.append("Predicted duration: {} (completion {}), {} the remaining rate limit.".format(
+            datetime.timedelta(seconds=round(duration)),
+            (datetime.datetime.now() + datetime.timedelta(seconds=duration)).strftime("%Y-%m-%d %H:%M:%S"),
+            "within" if remaining is None or requests_count <= remaining else "exceeding"
+        ))
+        return "\n".join(lines)
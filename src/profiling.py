@@ -0,0 +1,130 @@
+import cProfile
+import os
+import pstats
+import threading
+from contextlib import contextmanager
+
+
+def start_profile(profile):
+    # Since Python 3.12, only one profiler can be active at a time, so concurrent phases of other threads are lost
+    try:
+        profile.enable()
+        return True
+    except ValueError:
+        return False
+
+
+class PhaseProfiler:
+    """Deterministic profiler (cProfile) whose measurements are split into named phases, e.g. "fetch", "render" and
+    "upload". A nested phase pauses the enclosing one, so every function call is attributed to the innermost phase.
+    Phases are tracked per thread; nothing is measured while the profiler is disabled.
+    """
+
+    def __init__(self):
+        self.path = None
+        self.lock = threading.Lock()
+        # phase name -> cProfile.Profile
+        self.profiles = {}
+        self.local = threading.local()
+
+    def enable(self, path):
+        """Starts collecting the phases, which `write` saves to `path`.
+        """
+        self.path = path
+
+    def is_enabled(self):
+        return self.path is not None
+
+    def get_profile(self, name):
+        with self.lock:
+            if name not in self.profiles:
+                self.profiles[name] = cProfile.Profile()
+            return self.profiles[name]
+
+    @contextmanager
+    def phase(self, name):
+        if not self.is_enabled():
+            yield
+            return
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        if stack and stack[-1][0] == name:
+            # Already in this phase
+            yield
+            return
+        profile = self.get_profile(name)
+        if stack:
+            stack[-1][1].disable()
+        stack.append((name, profile))
+        enabled = start_profile(profile)
+        try:
+            yield
+        finally:
+            if enabled:
+                profile.disable()
+            stack.pop()
+            if stack:
+                start_profile(stack[-1][1])
+
+    def iterate(self, name, iterable):
+        """Iterates over `iterable`, attributing the computation of every item to the phase `name`. The items are
+        computed in the phase of the thread that consumes them.
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def get_phase_path(self, name):
+        root, extension = os.path.splitext(self.path)
+        return "{}.{}{}".format(root, name.replace(" ", "-"), extension or ".pstats")
+
+    def write(self, top=15):
+        """Writes the profile of all phases to the configured path and the profile of every phase next to it
+        (e.g. `profile.fetch.pstats`), in the pstats format of cProfile. Prints the functions with the highest
+        cumulative time of every phase.
+        """
+        if not self.is_enabled():
+            return
+        with self.lock:
+            profiles = sorted(self.profiles.items())
+        if not profiles:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        for name, profile in profiles:
+            profile.create_stats()
+            profile.dump_stats(self.get_phase_path(name))
+            stats = pstats.Stats(profile)
+            print("Profile of phase '{}' ({}s):".format(name, round(stats.total_tt, 3)))
+            stats.sort_stats("cumulative").print_stats(top)
+        combined = pstats.Stats(profiles[0][1])
+        for _, profile in profiles[1:]:
+            combined.add(profile)
+        combined.dump_stats(self.path)
+        print("Profiles of the phases {} written to '{}'.".format(
+            ", ".join(name for name, _ in profiles),
+            self.path
+        ))
+
+
+# Profiler shared by the modules of a script, enabled by its --profile option
+profiler = PhaseProfiler()
+
+
+def phase(name):
+    """Context manager that attributes the profile of its body to the phase `name` (a no-op without --profile).
+    """
+    return profiler.phase(name)
+
+
+def profile_iteration(name, iterable):
+    if not profiler.is_enabled():
+        return iterable
+    return profiler.iterate(name, iterable)
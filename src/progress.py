@@ -0,0 +1,177 @@
+import datetime
+import sys
+import threading
+import time
+import config
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    return "{}:{:02}:{:02}".format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+def format_value(value):
+    if value is None:
+        return "-"
+    if " " in str(value):
+        return '"{}"'.format(value)
+    return str(value)
+
+
+class StatusLineStream:
+    """Wraps the standard output of a terminal to keep a status line below the printed lines. The status line is
+    cleared before every write and drawn again after every complete line.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.RLock()
+        self.status = ""
+        self.status_drawn = False
+        self.at_line_start = True
+
+    def write(self, text):
+        with self.lock:
+            if self.status_drawn:
+                self.stream.write("\r\033[K")
+                self.status_drawn = False
+            count = self.stream.write(text)
+            if text:
+                self.at_line_start = text.endswith("\n")
+            if self.status and self.at_line_start:
+                self.stream.write(self.status)
+                self.status_drawn = True
+            self.stream.flush()
+            return count
+
+    def set_status(self, status):
+        with self.lock:
+            self.status = status
+            # A partially printed line is completed first
+            if self.at_line_start:
+                self.stream.write("\r\033[K" + status)
+                self.stream.flush()
+                self.status_drawn = bool(status)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class ProgressReporter:
+    """Reports the progress of a phase that processes `total` items: items per second, remaining items and the
+    expected time of completion. If the `RequestScheduler` that paces the phase is given, the estimate accounts
+    for its rate limit, extrapolating the requests and writes per item observed so far.
+    On a terminal the progress is a status line that is updated in place; otherwise a structured line
+    (`progress phase=... done=... total=...`) is printed every `config.PROGRESS_LOG_INTERVAL` seconds.
+    """
+
+    def __init__(self, phase, total, scheduler=None, stream=None):
+        self.phase = phase
+        self.total = total
+        self.scheduler = scheduler
+        self.stream = stream if stream is not None else sys.stdout
+        self.is_tty = self.stream.isatty()
+        self.interval = config.PROGRESS_TTY_INTERVAL if self.is_tty else config.PROGRESS_LOG_INTERVAL
+        self.lock = threading.Lock()
+        self.done = 0
+        self.skipped = 0
+        self.started_at = time.monotonic()
+        self.reported_at = None
+        self.start_requests = scheduler.requests_count if scheduler is not None else 0
+        self.start_writes = scheduler.writes_count if scheduler is not None else 0
+        self.status_stream = None
+        if self.is_tty:
+            self.status_stream = StatusLineStream(self.stream)
+            if sys.stdout is self.stream:
+                sys.stdout = self.status_stream
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.finish()
+
+    def advance(self, count=1, skipped=False):
+        """Marks `count` items as done. Skipped items (e.g. already migrated ones) are excluded from the rate.
+        """
+        with self.lock:
+            self.done += count
+            if skipped:
+                self.skipped += count
+            now = time.monotonic()
+            if self.reported_at is not None and now - self.reported_at < self.interval:
+                return
+            self.reported_at = now
+        self.report()
+
+    def iterate(self, iterable):
+        """Yields the items of `iterable`, advancing the progress after each one.
+        """
+        for item in iterable:
+            yield item
+            self.advance()
+
+    def get_status(self):
+        with self.lock:
+            done = self.done
+            processed = self.done - self.skipped
+            elapsed = time.monotonic() - self.started_at
+        remaining = max(0, self.total - done)
+        rate = processed / elapsed if elapsed > 0 else 0.0
+        eta = remaining / rate if rate > 0 else None
+        if self.scheduler is not None and processed > 0:
+            remaining_requests = (self.scheduler.requests_count - self.start_requests) * remaining / processed
+            remaining_writes = (self.scheduler.writes_count - self.start_writes) * remaining / processed
+            limited_eta = self.scheduler.predict_duration(remaining_requests, remaining_writes)
+            eta = limited_eta if eta is None else max(eta, limited_eta)
+        return {
+            "phase": self.phase,
+            "done": done,
+            "total": self.total,
+            "skipped": self.skipped,
+            "remaining": remaining,
+            "rate": round(rate, 2),
+            "elapsed": round(elapsed),
+            "eta_seconds": None if eta is None else round(eta),
+            "eta": None if eta is None else (datetime.datetime.now() + datetime.timedelta(seconds=eta)).strftime("%Y-%m-%d %H:%M:%S"),
+            "rate_limit_remaining": self.scheduler.get_remaining() if self.scheduler is not None else None,
+        }
+
+    def format_line(self, status):
+        return "progress " + " ".join(
+            "{}={}".format(name, format_value(value))
+            for name, value in status.items()
+        )
+
+    def format_status_line(self, status):
+        line = "{phase}: {done}/{total} ({percent}%), {rate}/s, elapsed {elapsed}".format(
+            percent=round(100 * status["done"] / status["total"]) if status["total"] else 100,
+            **dict(status, elapsed=format_duration(status["elapsed"]))
+        )
+        if status["eta_seconds"] is not None:
+            line += ", remaining {}".format(format_duration(status["eta_seconds"]))
+        if status["rate_limit_remaining"] is not None:
+            line += ", rate limit {}".format(status["rate_limit_remaining"])
+        return line
+
+    def report(self):
+        status = self.get_status()
+        if self.is_tty:
+            self.status_stream.set_status(self.format_status_line(status))
+        else:
+            print(self.format_line(status), file=self.stream, flush=True)
+
+    def finish(self):
+        """Prints the final progress and restores the standard output.
+        """
+        status = self.get_status()
+        if self.is_tty:
+            self.status_stream.set_status("")
+            if sys.stdout is self.status_stream:
+                sys.stdout = self.stream
+            print(self.format_status_line(status), file=self.stream, flush=True)
+        else:
+            print(self.format_line(status), file=self.stream, flush=True)
@@ -0,0 +1,394 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from requests import Request, Session
+
+
+def parse_retry_after(value, now=None):
+    """Converts the value of a `Retry-After` header to a number of seconds.
+    The header either contains a number of seconds or an HTTP date.
+    Returns None if the value cannot be parsed.
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if now is None:
+        now = time.time()
+    return max(0.0, date.timestamp() - now)
+
+
+def parse_int_header(headers, name):
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        # `rate` is the number of tokens added per second
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def set_rate(self, rate, capacity):
+        self.refill()
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = min(self.tokens, self.capacity)
+
+    def time_until_available(self):
+        """Returns the number of seconds until a token is available.
+        """
+        self.refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.refill()
+        self.tokens -= 1
+
+    def drain(self):
+        self.refill()
+        self.tokens = min(self.tokens, 0.0)
+
+
+WRITE_METHODS = ("POST", "PATCH", "PUT", "DELETE")
+
+
+class RequestScheduler:
+    """Paces the requests sent to an API with a token bucket.
+    The bucket is adjusted from the rate limit headers of the responses, and the number of requests in flight is
+    adapted (additive increase, multiplicative decrease) to stay just under the limit.
+    Writes (POST, PATCH, PUT and DELETE, see `is_write`) are spaced by at least `min_write_interval` seconds.
+    """
+    primary_resource = "default"
+    not_modified_is_free = False
+
+    def __init__(self, name, requests_per_hour, max_concurrency=4, safety_margin=0.05, min_write_interval=0.0,
+                 limit_header="X-RateLimit-Limit", remaining_header="X-RateLimit-Remaining",
+                 reset_header="X-RateLimit-Reset", near_limit_header="X-RateLimit-NearLimit"):
+        self.name = name
+        self.requests_per_hour = requests_per_hour
+        self.safety_margin = safety_margin
+        self.max_concurrency = max_concurrency
+        self.min_write_interval = min_write_interval
+        self.limit_header = limit_header
+        self.remaining_header = remaining_header
+        self.reset_header = reset_header
+        self.near_limit_header = near_limit_header
+        self.bucket = TokenBucket(requests_per_hour / 3600.0, self.usable_budget(requests_per_hour))
+        self.concurrency = float(max_concurrency)
+        self.in_flight = 0
+        # resource -> (limit, remaining, reset time)
+        self.limits = {}
+        self.blocked_until = 0.0
+        self.last_write_at = None
+        self.condition = threading.Condition()
+        # metrics
+        self.started_at = time.monotonic()
+        self.requests_count = 0
+        self.writes_count = 0
+        self.throttled_count = 0
+        self.total_wait_time = 0.0
+        self.last_wait_time = 0.0
+
+    def usable_budget(self, requests_per_hour):
+        return max(1.0, requests_per_hour * (1 - self.safety_margin))
+
+    def request_resource(self, url):
+        """Returns the rate limit resource that a request to `url` counts against.
+        """
+        return self.primary_resource
+
+    def response_resource(self, response):
+        """Returns the rate limit resource that the headers of `response` describe.
+        """
+        return self.primary_resource
+
+    def is_write(self, method, url):
+        """Checks whether a request creates or changes content, so that it is spaced from the other writes.
+        """
+        return method in WRITE_METHODS
+
+    def get_remaining(self, resource=None):
+        limit, remaining, reset_at = self.limits.get(resource or self.primary_resource, (None, None, None))
+        return remaining
+
+    def compute_wait_time(self, method=None, url=None):
+        now = time.time()
+        wait = max(0.0, self.blocked_until - now)
+        limit, remaining, reset_at = self.limits.get(self.request_resource(url), (None, None, None))
+        if remaining is not None and reset_at is not None and now < reset_at:
+            if remaining <= (limit or self.requests_per_hour) * self.safety_margin:
+                # Keep a reserve instead of running into the limit
+                wait = max(wait, reset_at - now)
+        if self.is_write(method, url) and self.last_write_at is not None:
+            wait = max(wait, self.last_write_at + self.min_write_interval - time.monotonic())
+        return max(wait, self.bucket.time_until_available())
+
+    def acquire(self, method=None, url=None):
+        """Blocks until a request may be sent. Returns the time spent waiting.
+        """
+        waited = 0.0
+        with self.condition:
+            while True:
+                if self.in_flight < max(1, int(self.concurrency)):
+                    wait = self.compute_wait_time(method, url)
+                    if wait <= 0:
+                        break
+                else:
+                    wait = None
+                start = time.monotonic()
+                self.condition.wait(wait)
+                waited += time.monotonic() - start
+            self.bucket.consume()
+            self.in_flight += 1
+            self.requests_count += 1
+            if self.is_write(method, url):
+                self.writes_count += 1
+                self.last_write_at = time.monotonic()
+            self.total_wait_time += waited
+            self.last_wait_time = waited
+        return waited
+
+    def release(self, response=None):
+        with self.condition:
+            self.in_flight -= 1
+            if response is not None:
+                self.update_from_response(response)
+            self.condition.notify_all()
+
+    def update_from_response(self, response):
+        headers = response.headers
+        resource = self.response_resource(response)
+        limit = parse_int_header(headers, self.limit_header)
+        remaining = parse_int_header(headers, self.remaining_header)
+        reset = parse_int_header(headers, self.reset_header)
+        if remaining is not None:
+            self.limits[resource] = (limit, remaining, None if reset is None else float(reset))
+        if resource == self.primary_resource and limit is not None and limit > 0 and limit != self.requests_per_hour:
+            self.requests_per_hour = limit
+            self.bucket.set_rate(limit / 3600.0, self.usable_budget(limit))
+
+        if response.status_code == 304 and self.not_modified_is_free:
+            # Conditional requests answered with 304 don't count against the rate limit
+            self.bucket.tokens = min(self.bucket.capacity, self.bucket.tokens + 1)
+
+        near_limit = headers.get(self.near_limit_header, "").lower() == "true"
+        if self.is_throttled(response):
+            self.throttle(self.get_retry_after(response))
+        elif near_limit:
+            self.concurrency = max(1.0, self.concurrency / 2)
+        elif self.concurrency < self.max_concurrency:
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+
+    def is_throttled(self, response):
+        """Checks whether the request has been rejected because of the rate limit.
+        """
+        return response.status_code == 429
+
+    def get_retry_after(self, response):
+        return parse_retry_after(response.headers.get("Retry-After"))
+
+    def throttle(self, retry_after=None):
+        """Reacts to a rejected request by reducing the concurrency and pausing all requests.
+        Must be called while holding `self.condition`.
+        """
+        self.throttled_count += 1
+        self.concurrency = max(1.0, self.concurrency / 2)
+        if retry_after is None:
+            # No hint from the server: pause for roughly the time needed to refill a few tokens
+            # and fall back to the steady rate afterwards
+            self.bucket.drain()
+            retry_after = min(60.0, 5 / self.bucket.rate)
+        self.blocked_until = max(self.blocked_until, time.time() + retry_after)
+
+    def predict_duration(self, remaining_requests, remaining_writes=0):
+        """Predicts the number of seconds needed to send the given number of requests, taking into account the
+        observed throughput, the remaining budget of the rate limit and the spacing of writes.
+        """
+        with self.condition:
+            elapsed = time.monotonic() - self.started_at
+            duration = 0.0
+            if self.requests_count > 0 and elapsed > 0:
+                duration = remaining_requests * elapsed / self.requests_count
+            duration = max(duration, remaining_writes * self.min_write_interval)
+            limit, remaining, reset_at = self.limits.get(self.primary_resource, (None, None, None))
+            limit = limit or self.requests_per_hour
+            usable_remaining = remaining - limit * self.safety_margin if remaining is not None else self.bucket.tokens
+            if remaining_requests > usable_remaining:
+                # The requests exceeding the remaining budget have to wait for the next windows
+                until_reset = max(0.0, reset_at - time.time()) if reset_at is not None else 0.0
+                duration = max(duration, until_reset + (remaining_requests - usable_remaining) * 3600.0 / self.usable_budget(limit))
+            return duration
+
+    def get_metrics(self):
+        with self.condition:
+            self.bucket.refill()
+            return {
+                "name": self.name,
+                "requests": self.requests_count,
+                "writes": self.writes_count,
+                "throttled": self.throttled_count,
+                "budget": int(self.bucket.tokens),
+                "remaining": self.get_remaining(),
+                "concurrency": max(1, int(self.concurrency)),
+                "in_flight": self.in_flight,
+                "wait_time": round(self.compute_wait_time(), 3),
+                "total_wait_time": round(self.total_wait_time, 3),
+            }
+
+    def format_metrics(self):
+        metrics = self.get_metrics()
+        return "{name}: budget {budget}, remaining {remaining}, concurrency {concurrency}, next wait {wait_time}s, total wait {total_wait_time}s, throttled {throttled}x".format(**metrics)
+
+
+class GithubRequestScheduler(RequestScheduler):
+    """Scheduler for GitHub's REST and GraphQL APIs. Requests are rejected with 403 or 429 both when the primary
+    rate limit is exhausted (`X-RateLimit-Remaining: 0`) and when a secondary rate limit is hit (`Retry-After`).
+    GitHub recommends to wait at least one second between content-creating requests.
+    """
+    primary_resource = "core"
+    not_modified_is_free = True
+
+    def __init__(self, requests_per_hour=5000, max_concurrency=1, min_write_interval=1.0):
+        super().__init__(
+            "github",
+            requests_per_hour=requests_per_hour,
+            max_concurrency=max_concurrency,
+            min_write_interval=min_write_interval
+        )
+
+    def request_resource(self, url):
+        if url is not None and url.split("?")[0].endswith("/graphql"):
+            return "graphql"
+        return "core"
+
+    def response_resource(self, response):
+        return response.headers.get("X-RateLimit-Resource", "core")
+
+    def is_write(self, method, url):
+        # GraphQL queries are sent with POST, but only read
+        return super().is_write(method, url) and self.request_resource(url) != "graphql"
+
+    def is_throttled(self, response):
+        if response.status_code == 429:
+            return True
+        if response.status_code != 403:
+            return False
+        return "Retry-After" in response.headers or response.headers.get("X-RateLimit-Remaining") == "0" \
+            or is_secondary_rate_limit(response)
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None and response.headers.get("X-RateLimit-Remaining") == "0":
+            reset = parse_int_header(response.headers, "X-RateLimit-Reset")
+            if reset is not None:
+                retry_after = max(0.0, reset - time.time()) + 1
+        if retry_after is None and response.status_code == 403:
+            # Secondary rate limit without a hint: GitHub asks to wait at least one minute
+            retry_after = 60.0
+        return retry_after
+
+
+def is_secondary_rate_limit(response):
+    """Checks whether GitHub has rejected a request because of a secondary rate limit, which is only stated in the
+    message of the response if it has neither a `Retry-After` nor a `X-RateLimit-Remaining: 0` header.
+    """
+    message = response.text.lower()
+    return "secondary rate limit" in message or "abuse" in message
+
+
+def get_retries_count(response):
+    """Returns the number of times that the retry policy of the connection pool has resent a request.
+    """
+    retries = getattr(response.raw, "retries", None)
+    return 0 if retries is None else len(retries.history)
+
+
+class ScheduledSession(Session):
+    """A session that sends every request through a `RequestScheduler` and retries the requests that the scheduler
+    considers rejected because of the rate limit.
+    """
+
+    def __init__(self, scheduler, max_throttled_retries=10, timeout=None, cache=None):
+        super().__init__()
+        self.scheduler = scheduler
+        # Optional `ConditionalRequestCache` for GET requests
+        self.cache = cache
+        self.max_throttled_retries = max_throttled_retries
+        # Default timeout (in seconds) of requests that don't specify one
+        self.timeout = timeout
+        # Functions called as `hook(method, url, response, latency, retries)` after every request, see `add_request_hook`
+        self.request_hooks = []
+
+    def add_request_hook(self, hook):
+        """Calls `hook(method, url, response, latency, retries)` after every request. `response` is None if the request
+        raised an exception, `latency` excludes the time waited for the scheduler and `retries` counts both the
+        retries of rejected and of failing requests.
+        """
+        self.request_hooks.append(hook)
+
+    def request(self, method, url, *args, **kwargs):
+        if self.timeout is not None and kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        if self.cache is not None and method.upper() == "GET" and not args:
+            headers = kwargs.pop("headers", None)
+            cache_url = Request("GET", url, params=kwargs.get("params")).prepare().url
+            return self.cache.send(
+                lambda conditional_headers: self.send_scheduled(method, url, headers=conditional_headers, **kwargs),
+                cache_url,
+                headers
+            )
+        return self.send_scheduled(method, url, *args, **kwargs)
+
+    def send_scheduled(self, method, url, *args, **kwargs):
+        attempt = 0
+        latency = 0.0
+        retries = 0
+        while True:
+            self.scheduler.acquire(method.upper(), url)
+            response = None
+            start = time.monotonic()
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            finally:
+                latency += time.monotonic() - start
+                self.scheduler.release(response)
+                if response is None:
+                    self.call_request_hooks(method, url, None, latency, retries)
+            retries += get_retries_count(response)
+            if not self.scheduler.is_throttled(response) or attempt >= self.max_throttled_retries:
+                self.call_request_hooks(method, url, response, latency, retries)
+                return response
+            retries += 1
+            attempt += 1
+            print("Warning: {} rate limit exceeded on {} {}, retrying ({}/{})...".format(
+                self.scheduler.name,
+                method,
+                url,
+                attempt,
+                self.max_throttled_retries
+            ))
+
+    def call_request_hooks(self, method, url, response, latency, retries):
+        for hook in self.request_hooks:
+            hook(method, url, response, latency, retries)
@@ -0,0 +1,129 @@
+import datetime
+import os
+import resource
+import subprocess
+import time
+
+
+class StepUsage:
+    """Wall time and resource usage of a step of the migration of a repository. The usage of the subprocesses
+    (including their descendants) is read from `wait4`, the one of the migration script from `getrusage`.
+    """
+
+    def __init__(self, name, repo):
+        self.name = name
+        self.repo = repo
+        self.commands = 0
+        self.wall_time = 0.0
+        self.user_time = 0.0
+        self.system_time = 0.0
+        # In kilobytes, as reported by Linux
+        self.max_rss = 0
+        self.blocks_written = 0
+
+    def add_usage(self, usage_before, usage_after):
+        self.user_time += usage_after.ru_utime - usage_before.ru_utime
+        self.system_time += usage_after.ru_stime - usage_before.ru_stime
+        self.blocks_written += usage_after.ru_oublock - usage_before.ru_oublock
+
+    def add_command(self, usage):
+        self.commands += 1
+        self.user_time += usage.ru_utime
+        self.system_time += usage.ru_stime
+        self.max_rss = max(self.max_rss, usage.ru_maxrss)
+        self.blocks_written += usage.ru_oublock
+
+    def get_bytes_written(self):
+        # `ru_oublock` counts blocks of 512 bytes
+        return self.blocks_written * 512
+
+
+class StepTimings:
+    """Times the steps of a migration and the commands that they execute. Every step is tagged with the repository
+    that it migrates, so that the summary shows which step dominates for each repository.
+    """
+
+    def __init__(self):
+        self.steps = []
+        self.current = None
+        self.current_start = None
+        self.current_usage = None
+
+    def step(self, msg, name, repo=None):
+        """Ends the current step and starts a new one. `msg` is printed with a timestamp, `name` is the (short)
+        name of the step in the summary.
+        """
+        self.end_step()
+        now = datetime.datetime.now()
+        print("\n[{}] === {}...".format(now.strftime("%Y-%m-%d %H:%M:%S"), msg))
+        self.current = StepUsage(name, repo)
+        self.current_start = time.monotonic()
+        self.current_usage = resource.getrusage(resource.RUSAGE_SELF)
+        self.steps.append(self.current)
+
+    def end_step(self):
+        if self.current is None:
+            return
+        self.current.wall_time = time.monotonic() - self.current_start
+        self.current.add_usage(self.current_usage, resource.getrusage(resource.RUSAGE_SELF))
+        self.current = None
+
+    def execute(self, cmd, cwd=None):
+        """Runs a shell command like `subprocess.check_call` and adds its resource usage to the current step.
+        """
+        print("> '{}'".format(cmd))
+        start = time.monotonic()
+        process = subprocess.Popen(cmd, shell=True, cwd=cwd)
+        _, status, usage = os.wait4(process.pid, 0)
+        # Let the `Popen` object know that the process has been reaped
+        process.returncode = os.waitstatus_to_exitcode(status)
+        wall_time = time.monotonic() - start
+        print("> Finished in {}s (user {}s, system {}s, max RSS {} MB, written {} MB)".format(
+            round(wall_time, 1),
+            round(usage.ru_utime, 1),
+            round(usage.ru_stime, 1),
+            round(usage.ru_maxrss / 1024, 1),
+            round(usage.ru_oublock * 512 / 1024 / 1024, 1)
+        ))
+        if self.current is not None:
+            self.current.add_command(usage)
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, cmd)
+
+    def format_summary(self):
+        """Returns a table of the steps, grouped by repository.
+        """
+        self.end_step()
+        row_format = "{:<30} {:<16} {:>8} {:>10} {:>10} {:>10} {:>12} {:>12}"
+        rows = [row_format.format(
+            "repository", "step", "commands", "wall s", "user s", "system s", "max RSS MB", "written MB"
+        )]
+        repos = []
+        for step in self.steps:
+            if step.repo not in repos:
+                repos.append(step.repo)
+        for repo in repos:
+            for step in self.steps:
+                if step.repo != repo:
+                    continue
+                rows.append(row_format.format(
+                    repo or "-",
+                    step.name,
+                    step.commands,
+                    round(step.wall_time, 1),
+                    round(step.user_time, 1),
+                    round(step.system_time, 1),
+                    round(step.max_rss / 1024, 1),
+                    round(step.get_bytes_written() / 1024 / 1024, 1)
+                ))
+        rows.append(row_format.format(
+            "total",
+            "",
+            sum(x.commands for x in self.steps),
+            round(sum(x.wall_time for x in self.steps), 1),
+            round(sum(x.user_time for x in self.steps), 1),
+            round(sum(x.system_time for x in self.steps), 1),
+            round(max([x.max_rss for x in self.steps] or [0]) / 1024, 1),
+            round(sum(x.get_bytes_written() for x in self.steps) / 1024 / 1024, 1)
+        ))
+        return "\n".join(rows)
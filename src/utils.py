@@ -1,4 +1,8 @@
+import queue
+import threading
+
 import requests
+from requests.adapters import HTTPAdapter
 
 
 def get_request_content(url, session=None):
@@ -10,6 +14,15 @@ def get_request_content(url, session=None):
     return res.text
 
 
+def get_request_bytes(url, session=None):
+    if session is None:
+        session = requests
+    res = session.get(url)
+    if not res.ok:
+        res.raise_for_status()
+    return res.content
+
+
 def get_request_json(url, session=None, headers=None):
     if session is None:
         session = requests
@@ -17,3 +30,76 @@ def get_request_json(url, session=None, headers=None):
     if not res.ok:
         res.raise_for_status()
     return res.json()
+
+
+def normalize_body(body):
+    # GitHub stores line breaks of bodies and comments as "\r\n"
+    return (body or "").replace("\r\n", "\n")
+
+
+def mount_retry_adapter(session, retry, pool_maxsize=10):
+    # Keep up to `pool_maxsize` connections per host alive and retry failing requests
+    adapter = HTTPAdapter(max_retries=retry, pool_maxsize=pool_maxsize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+
+def get_connection_stats(session):
+    """Returns the number of requests sent and connections opened by the connection pools of a session.
+    """
+    stats = {"requests": 0, "connections": 0}
+    for adapter in set(session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            stats["requests"] += pool.num_requests
+            stats["connections"] += pool.num_connections
+    stats["reused"] = max(0, stats["requests"] - stats["connections"])
+    return stats
+
+
+def format_connection_stats(session):
+    stats = get_connection_stats(session)
+    return "{} requests over {} connections ({}% reused)".format(
+        stats["requests"],
+        stats["connections"],
+        round(100 * stats["reused"] / stats["requests"]) if stats["requests"] else 0
+    )
+
+
+def iterate_in_background(iterable, max_pending):
+    """Iterates over `iterable` in a background thread, at most `max_pending` items ahead of the consumer.
+    Exceptions raised by the iteration are re-raised in the consumer.
+    """
+    items = queue.Queue(maxsize=max_pending)
+    done = object()
+    stopped = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                while not stopped.is_set():
+                    try:
+                        items.put((item, None), timeout=1)
+                        break
+                    except queue.Full:
+                        pass
+                if stopped.is_set():
+                    return
+            items.put((done, None))
+        except BaseException as e:
+            items.put((done, e))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        # Stop the producer if the consumer stops early
+        stopped.set()